@@ -0,0 +1,483 @@
+import argparse
+import asyncio
+import json
+import re
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+import blob_store
+import metrics
+import operations
+import scheduling
+import sessions
+from initial_setup import initialize_defaults
+from repository import find_by_id, find_by_index, load_collection
+from search_index import search
+from transactions import TransactionAborted, transaction
+from user_auth import check_password, find_user_by_id, hash_password, needs_rehash, store_password_hash
+
+# HTTP/JSON API over the same operations as the menus (python main.py serve).
+#
+# The event loop only parses HTTP. Everything that touches the collections runs on one
+# storage thread, so the in-memory repository is never used from two threads at once, and
+# bcrypt runs on a process pool. Reads are submitted to the storage thread directly;
+# writes go through a queue drained by a single writer task, which commits whatever has
+# queued up (up to WRITE_BATCH operations) in one transaction, so a burst of writes costs
+# one save per collection.
+#
+# POST /login {"id", "password"} returns a session token (sessions.py); every other call
+# sends it as "Authorization: Bearer <token>". Errors come back as {"error": message}.
+#
+# Thesis files do not go through JSON. An upload (POST /theses/<id>/files/<name>, the file
+# as the body) is streamed into blob_store on a worker thread as it arrives, then recorded
+# through the writer like any other write; a download is sent from the stored chunks with
+# loop.sendfile (os.sendfile where the platform has it).
+
+WRITE_BATCH = 200
+MAX_BODY = 1 << 20
+MAX_UPLOAD = 1 << 30
+FILE_PATH = re.compile("^/theses/([^/]+)/files/([^/]+)$")
+# Seconds a validated token is trusted before the session store is checked again; any
+# revocation (sessions.revocation_stamp) clears the whole cache at once.
+TOKEN_RECHECK = 30
+# Validated tokens kept, least recently used evicted first.
+TOKEN_CACHE = 1000
+MAX_SEARCH_RESULTS = 100
+
+class ApiError(Exception):
+    """An error response: HTTP status and message."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+class Download(NamedTuple):
+    """A read endpoint's answer that is a stored file: sent from its chunk files, not as JSON."""
+    name: str
+    size: int
+    paths: List[Path]
+
+# token -> (user ID, time it was last checked against the session store), least recently used first
+_tokens: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+_tokens_stamp: Optional[Tuple[int, int]] = None
+
+def _encode(value: Any) -> bytes:
+    """JSON body of a response. Runs on the storage thread, which owns the records being encoded."""
+    return json.dumps(value, ensure_ascii=False).encode('utf-8')
+
+def _public(user: Dict) -> Dict:
+    return {k: v for k, v in user.items() if k not in ("password", "password_hash")}
+
+def _login_user(user_id: str) -> Optional[Dict]:
+    """A copy of a user record, safe to read on the event loop."""
+    user = find_user_by_id(user_id)
+    return dict(user) if user else None
+
+def _authenticate(token: str) -> Dict:
+    """The user a bearer token belongs to (runs on the storage thread)."""
+    global _tokens_stamp
+    stamp = sessions.revocation_stamp()
+    if stamp != _tokens_stamp:
+        _tokens.clear()
+        _tokens_stamp = stamp
+    cached = _tokens.get(token)
+    if cached and time.monotonic() - cached[1] < TOKEN_RECHECK:
+        user = find_user_by_id(cached[0])
+        _tokens.move_to_end(token)
+    else:
+        user = sessions.validate(token)
+        if user:
+            _tokens[token] = (user['id'], time.monotonic())
+            _tokens.move_to_end(token)
+            while len(_tokens) > TOKEN_CACHE:
+                _tokens.popitem(last=False)
+        else:
+            _tokens.pop(token, None)
+    if not user:
+        raise ApiError(401, "Invalid or expired token.")
+    return user
+
+def _thesis_for(user: Dict, thesis_id: str, reviewers: bool = True) -> Dict:
+    """A thesis the user is the student or supervisor of (or, if reviewers, a defense reviewer)."""
+    thesis = find_by_id("theses.json", thesis_id)
+    people = {thesis['student_id'], thesis['supervisor_id']} if thesis else set()
+    if thesis and reviewers:
+        people |= {(thesis.get('defense') or {}).get(k) for k in ("internal_reviewer", "external_reviewer")}
+    if user['id'] not in people:
+        raise ApiError(404, f"No thesis {thesis_id}.")
+    return thesis
+
+def _upload_user(token: str, thesis_id: str) -> Dict:
+    """The user behind an upload, checked before the body is read (runs on the storage thread)."""
+    user = _authenticate(token)
+    _thesis_for(user, thesis_id, reviewers=False)
+    return user
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Endpoints
+# ----------------------------------------------------------------------------------------------------------------------
+
+# A read endpoint returns the response; a write endpoint returns (operation name,
+# arguments after the acting user) for the writer. Both run on the storage thread.
+
+def get_me(user: Dict, params: Tuple, body: Dict, query: Dict) -> Any:
+    return _public(user)
+
+def get_courses(user: Dict, params: Tuple, body: Dict, query: Dict) -> Any:
+    return load_collection("courses.json")
+
+def get_my_requests(user: Dict, params: Tuple, body: Dict, query: Dict) -> Any:
+    return find_by_index("requests.json", "student_id", user['id'])
+
+def get_search(user: Dict, params: Tuple, body: Dict, query: Dict) -> Any:
+    try:
+        k = int(query.get("k", 20))
+    except ValueError:
+        raise ApiError(400, "k must be a whole number.")
+    return search(query.get("q", ""), max(1, min(k, MAX_SEARCH_RESULTS)))
+
+def get_pending(user: Dict, params: Tuple, body: Dict, query: Dict) -> Any:
+    return find_by_index("requests.json", "supervisor_status", (user['id'], "Pending"))
+
+def get_supervised(user: Dict, params: Tuple, body: Dict, query: Dict) -> Any:
+    return find_by_index("theses.json", "supervisor_id", user['id'])
+
+def get_to_score(user: Dict, params: Tuple, body: Dict, query: Dict) -> Any:
+    return find_by_index("theses.json", "reviewer", user['id'])
+
+def get_report(user: Dict, params: Tuple, body: Dict, query: Dict) -> Any:
+    import reports
+    if params[0] not in reports.REPORTS:
+        raise ApiError(404, f"No report named {params[0]}.")
+    header, rows = reports.run_report(params[0])
+    return [dict(zip(header, row)) for row in rows]
+
+def get_files(user: Dict, params: Tuple, body: Dict, query: Dict) -> Any:
+    return _thesis_for(user, params[0]).get("files") or {}
+
+def get_file(user: Dict, params: Tuple, body: Dict, query: Dict) -> Any:
+    name = unquote(params[1])
+    meta = (_thesis_for(user, params[0]).get("files") or {}).get(name)
+    if meta is None:
+        raise ApiError(404, f"No file {name} in this thesis.")
+    try:
+        return Download(name, meta["size"], blob_store.chunk_paths(meta["sha256"]))
+    except blob_store.BlobNotFound as e:
+        raise ApiError(404, str(e))
+
+def _field(body: Dict, name: str, kind: type, default: Any = None) -> Any:
+    """body[name] if it is of the given type (or missing: default), else a 400 error."""
+    value = body.get(name, default)
+    if value is not default and (not isinstance(value, kind) or isinstance(value, bool)):
+        raise ApiError(400, f"{name} must be a {'whole number' if kind is int else 'string'}.")
+    return value
+
+def post_request(user: Dict, params: Tuple, body: Dict, query: Dict) -> Any:
+    return "submit_request", (_field(body, "course_id", str, ""), _field(body, "proposal", str, ""))
+
+def post_resubmit(user: Dict, params: Tuple, body: Dict, query: Dict) -> Any:
+    return "resubmit_request", (params[0],)
+
+def post_defense_request(user: Dict, params: Tuple, body: Dict, query: Dict) -> Any:
+    return "request_defense", ()
+
+def post_review(user: Dict, params: Tuple, body: Dict, query: Dict) -> Any:
+    return "review_request", (params[0], _field(body, "decision", str, "").lower(), _field(body, "version", int))
+
+def post_defense(user: Dict, params: Tuple, body: Dict, query: Dict) -> Any:
+    internal, external = _field(body, "internal_reviewer", str), _field(body, "external_reviewer", str)
+    date, room = _field(body, "date", str, ""), _field(body, "room", str)
+    if not (internal and external):
+        try:
+            start, end = scheduling.slot(date)
+        except ValueError:
+            raise ApiError(400, "Invalid date. Use YYYY-MM-DD or YYYY-MM-DD HH:MM.")
+        proposed = scheduling.propose_reviewers(user['id'], start, end) or ("", "")
+        internal, external = internal or proposed[0], external or proposed[1]
+    return "schedule_defense", (params[0], date, internal, external, room)
+
+def delete_file(user: Dict, params: Tuple, body: Dict, query: Dict) -> Any:
+    return "detach_file", (params[0], unquote(params[1]))
+
+def post_score(user: Dict, params: Tuple, body: Dict, query: Dict) -> Any:
+    try:
+        score = float(body.get("score"))
+    except (TypeError, ValueError):
+        raise ApiError(400, "Invalid score.")
+    return "record_score", (params[0], score)
+
+Handler = Callable[[Dict, Tuple, Dict, Dict], Any]
+# (method, path pattern, roles allowed (empty: any logged-in user), handler, is a write)
+ROUTES: List[Tuple[str, "re.Pattern", Tuple[str, ...], Handler, bool]] = [
+    (method, re.compile(f"^{pattern}$"), roles, handler, write)
+    for method, pattern, roles, handler, write in [
+        ("GET", "/me", (), get_me, False),
+        ("GET", "/courses", (), get_courses, False),
+        ("GET", "/search", (), get_search, False),
+        ("GET", "/requests", ("student",), get_my_requests, False),
+        ("POST", "/requests", ("student",), post_request, True),
+        ("POST", "/requests/([^/]+)/resubmit", ("student",), post_resubmit, True),
+        ("POST", "/defense-request", ("student",), post_defense_request, True),
+        ("GET", "/supervisor/requests", ("supervisor",), get_pending, False),
+        ("POST", "/requests/([^/]+)/review", ("supervisor",), post_review, True),
+        ("GET", "/supervisor/theses", ("supervisor",), get_supervised, False),
+        ("POST", "/theses/([^/]+)/defense", ("supervisor",), post_defense, True),
+        ("GET", "/reports/([^/]+)", ("supervisor",), get_report, False),
+        ("GET", "/reviewer/defenses", ("reviewer", "supervisor"), get_to_score, False),
+        ("POST", "/theses/([^/]+)/score", ("reviewer", "supervisor"), post_score, True),
+        ("GET", "/theses/([^/]+)/files", (), get_files, False),
+        ("GET", "/theses/([^/]+)/files/([^/]+)", (), get_file, False),
+        ("DELETE", "/theses/([^/]+)/files/([^/]+)", ("student", "supervisor"), delete_file, True),
+    ]
+]
+
+def _route(method: str, path: str) -> Tuple[Tuple[str, ...], Handler, bool, Tuple]:
+    for route_method, pattern, roles, handler, write in ROUTES:
+        m = pattern.match(path)
+        if m and route_method == method:
+            return roles, handler, write, m.groups()
+    raise ApiError(404, f"No endpoint {method} {path}.")
+
+def _prepare(token: str, method: str, path: str, body: Dict, query: Dict) -> Tuple[bool, Any]:
+    """Authenticate and run a read endpoint, or turn a write endpoint into a queued operation."""
+    roles, handler, write, params = _route(method, path)
+    user = _authenticate(token)
+    if roles and user.get('type') not in roles:
+        raise ApiError(403, f"Only for {' or '.join(roles)} accounts.")
+    with metrics.action("api." + handler.__name__):
+        result = handler(user, params, body, query)
+    if write:
+        return True, (result[0], user['id'], result[1])
+    return False, result if isinstance(result, Download) else _encode(result)
+
+class _OperationFailed(Exception):
+    """An operation of a write batch raised something other than TransactionAborted."""
+
+    def __init__(self, position: int, error: Exception):
+        super().__init__(str(error))
+        self.position = position
+        self.error = error
+
+def apply_writes(ops: List[Tuple[str, str, tuple]]) -> List[Tuple[int, bytes]]:
+    """Run queued operations in one transaction; return (HTTP status, response body) per operation.
+
+    An operation that fails unexpectedly may have changed records half way, so the batch is
+    rolled back, that operation gets a 500 and the others run again without it.
+    """
+    results: Dict[int, Tuple[int, bytes]] = {}
+    remaining = list(range(len(ops)))
+
+    def action():
+        done: List[Tuple[int, bytes]] = []
+        for position, i in enumerate(remaining):
+            name, user_id, args = ops[i]
+            try:
+                done.append((200, _encode(getattr(operations, name)(find_user_by_id(user_id), *args))))
+            except TransactionAborted as e:
+                done.append((400, _encode({"error": str(e)})))
+            except Exception as e:
+                raise _OperationFailed(position, e) from e
+        return done
+
+    while remaining:
+        locks = sorted({fn for i in remaining for fn in operations.LOCKS[ops[i][0]]})
+        try:
+            with metrics.action("api.write_batch"):
+                results.update(zip(remaining, transaction(locks, action)))
+            break
+        except _OperationFailed as e:
+            results[remaining.pop(e.position)] = (500, _encode({"error": f"Internal error: {e.error}"}))
+        except TransactionAborted as e:
+            results.update((i, (400, _encode({"error": str(e)}))) for i in remaining)
+            break
+    return [results[i] for i in range(len(ops))]
+
+class Server:
+    """The asyncio HTTP server with its storage thread, bcrypt pool and writer task."""
+
+    def __init__(self):
+        self.storage = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+        self.cpu = ProcessPoolExecutor()
+        self.writes: "asyncio.Queue[Tuple[Tuple[str, str, tuple], asyncio.Future]]" = asyncio.Queue()
+
+    async def on_storage(self, fn: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.storage, fn, *args)
+
+    async def writer(self):
+        """The only task that changes data: commits queued operations in groups."""
+        while True:
+            batch = [await self.writes.get()]
+            while not self.writes.empty() and len(batch) < WRITE_BATCH:
+                batch.append(self.writes.get_nowait())
+            try:
+                results = await self.on_storage(apply_writes, [op for op, _ in batch])
+            except Exception as e:  # keep serving; report the failure to every caller
+                results = [(500, _encode({"error": f"Internal error: {e}"}))] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def login(self, body: Dict) -> Dict:
+        user = await self.on_storage(_login_user, str(body.get("id", "")))
+        password = str(body.get("password", ""))
+        loop = asyncio.get_running_loop()
+        if user and 'password_hash' in user:
+            ok = await loop.run_in_executor(self.cpu, check_password, password, user['password_hash'])
+            rehash = ok and needs_rehash(user['password_hash'])
+        else:
+            ok = rehash = bool(user) and user.get('password') == password
+        if not ok:
+            raise ApiError(401, "Login failed.")
+        if rehash:
+            new_hash = await loop.run_in_executor(self.cpu, hash_password, password)
+            await self.on_storage(store_password_hash, user, new_hash)
+        token = await self.on_storage(sessions.issue, user)
+        return {"token": token, "user": _public(user)}
+
+    async def dispatch(self, method: str, target: str, headers: Dict[str, str], raw: bytes) -> Tuple[int, bytes]:
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            raise ApiError(400, "The body must be JSON.")
+        if not isinstance(body, dict):
+            raise ApiError(400, "The body must be a JSON object.")
+        if (method, url.path) == ("POST", "/login"):
+            return 200, _encode(await self.login(body))
+        token = headers.get("authorization", "")
+        token = token[7:] if token.lower().startswith("bearer ") else ""
+        if (method, url.path) == ("POST", "/logout"):
+            await self.on_storage(sessions.revoke, token)
+            _tokens.pop(token, None)
+            return 200, _encode({"ok": True})
+        write, result = await self.on_storage(_prepare, token, method, url.path, body, query)
+        if not write:
+            return 200, result
+        future = asyncio.get_running_loop().create_future()
+        await self.writes.put((result, future))
+        return await future
+
+    async def upload(self, token: str, thesis_id: str, name: str, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter, headers: Dict[str, str]) -> Tuple[int, bytes]:
+        """Stream a request body into the blob store, then attach it to the thesis through the writer."""
+        length = int(headers.get("content-length", 0) or 0)
+        if length > MAX_UPLOAD:
+            raise ApiError(413, "File too large.")
+        user = await self.on_storage(_upload_user, token, thesis_id)
+        if headers.get("expect", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        loop = asyncio.get_running_loop()
+        # Holds the store's shared lock until close(), so blob_store.gc() cannot run meanwhile.
+        blob = await loop.run_in_executor(None, blob_store.BlobWriter().open)
+        try:
+            remaining = length
+            pending = bytearray()
+            while remaining:
+                data = await reader.read(min(remaining, blob_store.CHUNK_SIZE))
+                if not data:
+                    raise asyncio.IncompleteReadError(bytes(pending), remaining)
+                remaining -= len(data)
+                pending += data
+                if len(pending) >= blob_store.CHUNK_SIZE or not remaining:
+                    await loop.run_in_executor(None, blob.write, pending)
+                    pending = bytearray()
+            meta = await loop.run_in_executor(None, blob.close)
+        finally:
+            blob.abort()
+        future = loop.create_future()
+        await self.writes.put((("attach_file", user['id'], (thesis_id, name, meta)), future))
+        return await future
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve one keep-alive connection."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                method, target, version = line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0) or 0)
+                upload = FILE_PATH.match(urlsplit(target).path) if method.upper() == "POST" else None
+                try:
+                    if length > MAX_BODY and not upload:
+                        raise ApiError(413, "Request body too large.")
+                    if upload:
+                        token = headers.get("authorization", "")
+                        token = token[7:] if token.lower().startswith("bearer ") else ""
+                        status, payload = await self.upload(token, upload.group(1), unquote(upload.group(2)),
+                                                            reader, writer, headers)
+                    else:
+                        raw = await reader.readexactly(length) if length else b""
+                        status, payload = await self.dispatch(method.upper(), target, headers, raw)
+                except ApiError as e:
+                    status, payload = e.status, _encode({"error": str(e)})
+                except Exception as e:
+                    status, payload = 500, _encode({"error": f"Internal error: {e}"})
+                # A refused upload leaves its body unread, so the connection cannot be reused.
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close" \
+                    and status != 413 and not (upload and status != 200)
+                if isinstance(payload, Download):
+                    head = (f"Content-Type: application/octet-stream\r\n"
+                            f"Content-Disposition: attachment; filename*=UTF-8''{quote(payload.name)}\r\n"
+                            f"Content-Length: {payload.size}\r\n")
+                else:
+                    head = f"Content-Type: application/json; charset=utf-8\r\nContent-Length: {len(payload)}\r\n"
+                writer.write((f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n{head}"
+                              f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode('latin-1'))
+                if isinstance(payload, Download):
+                    for path in payload.paths:
+                        with open(path, 'rb') as f:
+                            await asyncio.get_running_loop().sendfile(writer.transport, f)
+                else:
+                    writer.write(payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int):
+        # On the storage thread, which then owns the repository (and its SQLite connection).
+        await self.on_storage(initialize_defaults)
+        writer_task = asyncio.create_task(self.writer())
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Serving the thesis API on http://{host}:{port}", flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            writer_task.cancel()
+            self.cpu.shutdown()
+            self.storage.shutdown()
+
+def main(argv: List[str]) -> int:
+    """Entry point of the serve subcommand."""
+    parser = argparse.ArgumentParser(prog="main.py serve", description="Serve the HTTP/JSON API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(Server().serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,393 @@
+import argparse
+import copy
+import gzip
+import json
+import lzma
+import os
+import stat
+import sys
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import repository
+from data_handler import DATA_DIR, file_lock, iter_jsonl, write_json_file
+from id_allocator import ID_PREFIXES, parse_id
+from transactions import TransactionAborted, interrupted, transaction
+
+# Term partitions. Requests and theses belong to the academic term (year, semester) of
+# their course. Records of the open terms stay in the regular collection files, the hot
+# set every menu works on. Once a term is closed, its finished records can be sealed:
+# moved out of the collections into one read-only, compressed JSON-Lines partition per
+# term and collection, e.g. data/archive/1401-First/requests.<random>.jsonl.gz. So the hot files
+# only grow with the terms still in progress, however long the history gets.
+#
+# A record is finished when nothing in the application can change it any more: a
+# rejected request, a thesis whose defense has both scores, and an accepted request
+# whose thesis is finished. Anything else stays hot until it is, and a later seal of the
+# same term merges it into the partition. The menus only see hot records; search,
+# reports and ID allocation also cover the sealed ones.
+#
+# ARCHIVE_DIR/manifest.json lists every partition with its codec, record count and
+# status counts, so queries skip partitions by term, year or status without opening
+# them. Sealing writes each partition to a new file first, which nothing reads until a
+# manifest names it; the new manifest is then committed together with the hot
+# collections the records leave (one transaction), so a seal that is aborted or retried
+# changes nothing visible. Partition files no manifest names are deleted after a seal.
+# A record found in both places (after unseal, or a crash in SQLite mode) is read from
+# the hot collection.
+
+ARCHIVE_DIR = DATA_DIR / "archive"
+MANIFEST_FILE = "manifest.json"
+PARTITIONED = ["requests.json", "theses.json"]
+# codec -> (file suffix, open function)
+CODECS: Dict[str, Tuple[str, Callable]] = {"gzip": (".gz", gzip.open), "lzma": (".xz", lzma.open)}
+# Order of the semesters within a year; unknown names sort after these, alphabetically.
+SEMESTERS = ["First", "Second", "Summer"]
+# Decompressed partitions kept in memory for lookups by ID.
+CACHED_PARTITIONS = 8
+
+_manifest: Optional[Dict] = None
+_manifest_stamp: Optional[Tuple[int, int]] = None
+# (fn, term) -> {pk: record}, least recently used first.
+_partitions: "OrderedDict[Tuple[str, str], Dict[str, Dict]]" = OrderedDict()
+
+def term_key(term: str) -> Tuple:
+    """Sort key of a term name "<year>-<semester>"."""
+    year, _, semester = term.partition("-")
+    order = SEMESTERS.index(semester) if semester in SEMESTERS else len(SEMESTERS)
+    return (int(year) if year.isdigit() else 0, order, semester)
+
+def course_term(course: Optional[Dict]) -> Optional[str]:
+    """Term name of a course, or None if it has no year or semester."""
+    if not course or course.get("year") is None or not course.get("semester"):
+        return None
+    return f"{course['year']}-{course['semester']}"
+
+def record_term(record: Dict) -> Optional[str]:
+    """Term of a request or thesis (that of its course)."""
+    return course_term(repository.find_by_id("courses.json", record.get("course_id")))
+
+def _course_terms() -> Dict[str, Optional[str]]:
+    """course_id -> term of every course, for classifying many records at once."""
+    return {c.get("course_id"): course_term(c) for c in repository.load_collection("courses.json")}
+
+def current_term() -> Optional[str]:
+    """The latest term any course is offered in."""
+    terms = {course_term(c) for c in repository.load_collection("courses.json")} - {None}
+    return max(terms, key=term_key) if terms else None
+
+def closed_terms() -> List[str]:
+    """Every term before the current one, oldest first."""
+    current = current_term()
+    if current is None:
+        return []
+    terms = {course_term(c) for c in repository.load_collection("courses.json")} - {None}
+    return sorted((t for t in terms if term_key(t) < term_key(current)), key=term_key)
+
+def partition_path(term: str, entry: Dict) -> Path:
+    """Path of a sealed partition, from its manifest entry."""
+    return ARCHIVE_DIR / term / entry["file"]
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Manifest and partitions
+# ----------------------------------------------------------------------------------------------------------------------
+
+def stamp() -> Optional[Tuple[int, int]]:
+    """A value that changes whenever partitions are sealed or removed."""
+    try:
+        st = os.stat(ARCHIVE_DIR / MANIFEST_FILE)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def manifest() -> Dict:
+    """The manifest: {"partitions": {term: {fn: entry}}, "max_ids": {fn: n}} (re-read when it changes)."""
+    global _manifest, _manifest_stamp
+    current = stamp()
+    if _manifest is None or current != _manifest_stamp:
+        if current is None:
+            _manifest = {"partitions": {}, "max_ids": {}}
+        else:
+            with open(ARCHIVE_DIR / MANIFEST_FILE, 'r', encoding='utf-8') as f:
+                _manifest = json.load(f)
+        _manifest_stamp = current
+        _partitions.clear()
+    return _manifest
+
+def _write_manifest(data: Dict):
+    ARCHIVE_DIR.mkdir(exist_ok=True)
+    tmp = ARCHIVE_DIR / (MANIFEST_FILE + ".tmp")
+    write_json_file(tmp, data)
+    os.replace(tmp, ARCHIVE_DIR / MANIFEST_FILE)
+
+def _entry(fn: str, term: str) -> Optional[Dict]:
+    return manifest()["partitions"].get(term, {}).get(fn)
+
+def _stream(fn: str, term: str) -> Iterator[Dict]:
+    """Decompress and yield the records of one partition, one at a time."""
+    entry = _entry(fn, term)
+    if entry is None:
+        return
+    with CODECS[entry["codec"]][1](partition_path(term, entry), 'rb') as f:
+        yield from iter_jsonl(f)
+
+def _partition(fn: str, term: str) -> Dict[str, Dict]:
+    """The records of a partition by primary key, decompressed once and kept in an LRU cache."""
+    key = (fn, term)
+    records = _partitions.get(key)
+    if records is None:
+        pk = repository.PRIMARY_KEYS[fn]
+        records = _partitions[key] = {r[pk]: r for r in _stream(fn, term)}
+        while len(_partitions) > CACHED_PARTITIONS:
+            _partitions.popitem(last=False)
+    _partitions.move_to_end(key)
+    return records
+
+def _write_partition(fn: str, term: str, records: List[Dict], codec: str) -> Dict:
+    """Write a partition read-only to a new file; return its manifest entry."""
+    path = ARCHIVE_DIR / term / f"{fn[:-5]}.{os.urandom(4).hex()}.jsonl{CODECS[codec][0]}"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with CODECS[codec][1](tmp, 'wb') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b"\n")
+    with open(tmp, 'rb') as f:
+        os.fsync(f.fileno())
+    os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    os.replace(tmp, path)
+    return {"file": path.name, "codec": codec, "count": len(records), "bytes": path.stat().st_size,
+            "statuses": dict(Counter(r.get("status") for r in records))}
+
+def _remove_unlisted():
+    """Delete the partition files no manifest entry names: replaced, or left by an aborted seal.
+
+    Runs with the partitioned collections locked, so no seal is writing new files, and
+    not while an interrupted seal (whose manifest names new files) waits to be rolled forward.
+    """
+    with file_lock(PARTITIONED):
+        if interrupted(PARTITIONED):
+            return
+        listed = {(term, e["file"]) for term, entries in manifest()["partitions"].items() for e in entries.values()}
+        for path in ARCHIVE_DIR.glob("*/*.jsonl.*"):
+            if (path.parent.name, path.name) not in listed and not path.name.endswith(".tmp"):
+                path.unlink()
+
+def count(fn: str) -> int:
+    """Number of sealed records of a collection."""
+    return sum(p[fn]["count"] for p in manifest()["partitions"].values() if fn in p)
+
+def highest_id(fn: str) -> int:
+    """Largest ID number among the sealed records of a collection (0 if none)."""
+    return manifest()["max_ids"].get(fn, 0)
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Queries
+# ----------------------------------------------------------------------------------------------------------------------
+
+def _selected(term: Optional[str], years: Optional[Set[int]], terms: Optional[Set[str]]) -> bool:
+    if terms is not None and term not in terms:
+        return False
+    if years is not None and (term is None or term_key(term)[0] not in years):
+        return False
+    return True
+
+def iter_records(fn: str, years: Optional[Iterable[int]] = None, terms: Optional[Iterable[str]] = None,
+                 status: Optional[str] = None, where: Optional[Callable[[Dict], bool]] = None,
+                 sealed_only: bool = False) -> Iterator[Dict]:
+    """Stream requests or theses from the hot collection and the sealed partitions.
+
+    years, terms and status narrow the result; partitions that cannot match (by their
+    term, or by the status counts in the manifest) are not opened.
+    """
+    years = set(years) if years is not None else None
+    terms = set(terms) if terms is not None else None
+    pk = repository.PRIMARY_KEYS[fn]
+    if not sealed_only:
+        course_terms = _course_terms() if years is not None or terms is not None else {}
+        for r in repository.load_collection(fn):
+            if (status is None or r.get("status") == status) and (where is None or where(r)) \
+                    and (years is None and terms is None or _selected(course_terms.get(r.get("course_id")), years, terms)):
+                yield r
+    for term, entries in sorted(manifest()["partitions"].items(), key=lambda item: term_key(item[0])):
+        entry = entries.get(fn)
+        if entry is None or not _selected(term, years, terms) or (status is not None and not entry["statuses"].get(status)):
+            continue
+        for r in _stream(fn, term):
+            if (status is None or r.get("status") == status) and (where is None or where(r)) \
+                    and repository.find_by_id(fn, r.get(pk)) is None:
+                yield r
+
+def sealed_records(fn: str) -> List[Dict]:
+    """Every sealed record of a collection (none for collections that are not partitioned)."""
+    return list(iter_records(fn, sealed_only=True)) if fn in PARTITIONED else []
+
+def find(fn: str, record_id: str, term: Optional[str] = None) -> Optional[Dict]:
+    """A request or thesis by ID, hot or sealed; term, if known, saves searching the partitions."""
+    record = repository.find_by_id(fn, record_id)
+    if record is not None:
+        return record
+    if term is not None:
+        return _partition(fn, term).get(record_id) if _entry(fn, term) else None
+    for term, entries in manifest()["partitions"].items():
+        if fn in entries:
+            record = _partition(fn, term).get(record_id)
+            if record is not None:
+                return record
+    return None
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Sealing
+# ----------------------------------------------------------------------------------------------------------------------
+
+def thesis_finished(thesis: Dict) -> bool:
+    """Whether a thesis's defense has been held and scored by both reviewers."""
+    defense = thesis.get("defense") or {}
+    reviewers = {defense.get("internal_reviewer"), defense.get("external_reviewer")} - {None}
+    return bool(reviewers) and reviewers <= set(defense.get("scores") or {})
+
+def request_finished(request: Dict) -> bool:
+    """Whether a request is decided for good: rejected, or accepted with a finished (or sealed) thesis."""
+    if request.get("status") == "Rejected":
+        return True
+    if request.get("status") != "Accepted":
+        return False
+    theses = [t for t in repository.find_by_index("theses.json", "student_id", request.get("student_id"))
+              if t.get("course_id") == request.get("course_id")]
+    return all(thesis_finished(t) for t in theses)
+
+FINISHED: Dict[str, Callable[[Dict], bool]] = {"requests.json": request_finished, "theses.json": thesis_finished}
+
+def _seal(terms: List[str], codec: str) -> Dict[str, Dict[str, int]]:
+    """Transaction body of seal()."""
+    closed = set(closed_terms())
+    for term in terms:
+        if term not in closed:
+            raise TransactionAborted(f"{term} is not a closed term; only terms before {current_term()} can be sealed.")
+    wanted = set(terms)
+    course_terms = _course_terms()
+    moving: Dict[str, Dict[str, List[Dict]]] = {fn: {} for fn in PARTITIONED}
+    for fn in PARTITIONED:
+        for r in repository.load_collection(fn):
+            term = course_terms.get(r.get("course_id"))
+            if term in wanted and FINISHED[fn](r):
+                moving[fn].setdefault(term, []).append(r)
+    data = copy.deepcopy(manifest())
+    moved: Dict[str, Dict[str, int]] = {}
+    for fn in PARTITIONED:
+        pk = repository.PRIMARY_KEYS[fn]
+        for term, records in moving[fn].items():
+            merged = dict(_partition(fn, term)) if _entry(fn, term) else {}
+            merged.update((r[pk], r) for r in records)
+            data["partitions"].setdefault(term, {})[fn] = _write_partition(fn, term, list(merged.values()), codec)
+            numbers = (parse_id(r.get(pk), ID_PREFIXES[fn]) for r in records)
+            data["max_ids"][fn] = max([data["max_ids"].get(fn, 0)] + [n for n in numbers if n is not None])
+            moved.setdefault(term, {})[fn] = len(records)
+    if not moved:
+        return moved
+    moved = {term: moved[term] for term in sorted(moved, key=term_key)}
+    repository.save_file((ARCHIVE_DIR / MANIFEST_FILE).relative_to(DATA_DIR).as_posix(), data)
+    for fn in PARTITIONED:
+        pk = repository.PRIMARY_KEYS[fn]
+        leaving = {r[pk] for records in moving[fn].values() for r in records}
+        if leaving:
+            repository.save_collection(fn, [r for r in repository.load_collection(fn) if r.get(pk) not in leaving])
+    return moved
+
+def seal(terms: Optional[List[str]] = None, codec: str = "gzip") -> Dict[str, Dict[str, int]]:
+    """Move the finished requests and theses of closed terms (default: all) into their partitions.
+
+    Returns the number of records moved per term and collection.
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec}; use one of {', '.join(CODECS)}.")
+    try:
+        moved = transaction(PARTITIONED, lambda: _seal(terms if terms is not None else closed_terms(), codec))
+    finally:
+        _remove_unlisted()
+    if any("theses.json" in counts for counts in moved.values()):
+        import search_index
+        search_index.rebuild()
+    return moved
+
+def unseal(term: str) -> Dict[str, int]:
+    """Move a term's sealed records back into the hot collections and delete its partitions."""
+    def action() -> Dict[str, int]:
+        entries = manifest()["partitions"].get(term)
+        if not entries:
+            raise TransactionAborted(f"No sealed partitions for {term}.")
+        restored = {}
+        for fn in PARTITIONED:
+            if fn not in entries:
+                continue
+            pk = repository.PRIMARY_KEYS[fn]
+            records = [r for r in _stream(fn, term) if repository.find_by_id(fn, r[pk]) is None]
+            # Saved as a new list, so the records come back unchanged (add_record would bump versions).
+            repository.save_collection(fn, repository.load_collection(fn) + records)
+            restored[fn] = len(records)
+        return restored
+    restored = transaction(PARTITIONED, action)
+    data = copy.deepcopy(manifest())
+    for fn, entry in data["partitions"].pop(term).items():
+        os.unlink(partition_path(term, entry))
+    _write_manifest(data)
+    try:
+        (ARCHIVE_DIR / term).rmdir()
+    except OSError:
+        pass
+    return restored
+
+def _plan() -> List[Tuple[str, str, int, int]]:
+    """(term, collection, records that would be sealed, records that would stay hot) for every term."""
+    closed = set(closed_terms())
+    course_terms = _course_terms()
+    rows: Counter = Counter()
+    for fn in PARTITIONED:
+        for r in repository.load_collection(fn):
+            term = course_terms.get(r.get("course_id")) or "(no term)"
+            rows[(term, fn, term in closed and FINISHED[fn](r))] += 1
+    keys = sorted({(term, fn) for term, fn, _ in rows}, key=lambda k: (term_key(k[0]), k[1]))
+    return [(term, fn, rows[(term, fn, True)], rows[(term, fn, False)]) for term, fn in keys]
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Seal closed terms of requests and theses into compressed partitions.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    repartition = sub.add_parser("repartition", help="seal every closed term (or --terms) of the existing collections")
+    repartition.add_argument("--terms", nargs="+", help="terms to seal, e.g. 1401-First (default: all closed terms)")
+    repartition.add_argument("--codec", choices=list(CODECS), default="gzip")
+    repartition.add_argument("--dry-run", action="store_true", help="only show what would be sealed")
+    sub.add_parser("list", help="list the sealed partitions")
+    restore = sub.add_parser("unseal", help="move a term back into the hot collections")
+    restore.add_argument("term")
+    get = sub.add_parser("get", help="look up a request or thesis by ID, hot or sealed")
+    get.add_argument("collection", choices=PARTITIONED)
+    get.add_argument("id")
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "repartition" and args.dry_run:
+            print(f"Current term: {current_term()}")
+            for term, fn, sealable, hot in _plan():
+                print(f"  {term:<16} {fn:<14} seal {sealable:>8}   stay hot {hot:>8}")
+        elif args.command == "repartition":
+            moved = seal(args.terms, args.codec)
+            for term, counts in moved.items():
+                print(f"{term}: " + ", ".join(f"{n} {fn[:-5]}" for fn, n in counts.items()) + " sealed")
+            print(f"{sum(n for counts in moved.values() for n in counts.values())} records sealed.")
+        elif args.command == "list":
+            for term, entries in sorted(manifest()["partitions"].items(), key=lambda item: term_key(item[0])):
+                for fn, entry in entries.items():
+                    print(f"{term:<16} {entry['file']:<22} {entry['count']:>8} records {entry['bytes'] / 1024:>9.0f} KiB  "
+                          + ", ".join(f"{s}: {n}" for s, n in sorted(entry["statuses"].items(), key=str)))
+        elif args.command == "unseal":
+            for fn, n in unseal(args.term).items():
+                print(f"{fn}: {n} records restored")
+        else:
+            record = find(args.collection, args.id)
+            print(json.dumps(record, ensure_ascii=False, indent=2) if record else "Not found.")
+            return 0 if record else 1
+    except TransactionAborted as e:
+        print(e)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,151 @@
+import argparse
+import csv
+import itertools
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple
+import operations
+from credentials import hash_many
+from initial_setup import initialize_defaults
+from operations import require_role
+from transactions import TransactionAborted, transaction
+
+# Non-interactive bulk operations: python main.py batch <file> [--format csv|jsonl]
+#
+# Each row names an operation ("op") and its fields; rows that act for a user give the
+# acting user's ID in "user" (no password: whoever can run this can edit the data files).
+# Rows are applied through the same operations as the menus, so they get the same
+# validation and messages. Every --batch-size rows share one transaction and one write of
+# each collection; a refused row is reported and skipped without affecting the others.
+#
+#   op                 fields
+#   submit_request     user, course_id, proposal
+#   resubmit_request   user, request_id
+#   request_defense    user
+#   review_request     user, request_id, decision (accept/reject)
+#   schedule_defense   user, thesis_id, date, internal_reviewer, external_reviewer, room (optional)
+#   record_score       user, thesis_id, score
+#   create_user        id, type, name, password (or password_hash)
+
+BATCH_SIZE = 500
+
+def _score(row: Dict) -> float:
+    try:
+        return float(row.get("score", ""))
+    except ValueError:
+        raise TransactionAborted("Invalid score.")
+
+# op -> (roles allowed to run it, function of the row returning the operation's arguments after the user)
+OPS: Dict[str, Tuple[Tuple[str, ...], Callable[[Dict], tuple]]] = {
+    "submit_request": (("student",), lambda r: (r.get("course_id", ""), r.get("proposal", ""))),
+    "resubmit_request": (("student",), lambda r: (r.get("request_id", ""),)),
+    "request_defense": (("student",), lambda r: ()),
+    "review_request": (("supervisor",), lambda r: (r.get("request_id", ""), r.get("decision", "").lower())),
+    "schedule_defense": (("supervisor",), lambda r: (r.get("thesis_id", ""), r.get("date", ""),
+                                                     r.get("internal_reviewer", ""), r.get("external_reviewer", ""),
+                                                     r.get("room") or None)),
+    "record_score": (("reviewer", "supervisor"), lambda r: (r.get("thesis_id", ""), _score(r))),
+}
+
+def read_rows(path: Path, fmt: str) -> Iterator[Dict]:
+    """Stream the rows of a CSV or JSON-Lines file as dicts of strings."""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if fmt == "csv":
+            for row in csv.DictReader(f):
+                yield {k.strip(): (v or "").strip() for k, v in row.items() if k}
+        else:
+            for line in f:
+                if line.strip():
+                    yield {k: v if isinstance(v, str) else json.dumps(v) for k, v in json.loads(line).items()}
+
+def prepare(rows: List[Tuple[int, Dict]]):
+    """Work done before taking the locks: hash new users' passwords on all cores."""
+    todo = [row for _, row in rows
+            if row.get("op") == "create_user" and row.get("password") and not row.get("password_hash")]
+    for row, password_hash in zip(todo, hash_many([row["password"] for row in todo])):
+        row["password_hash"] = password_hash
+        row["password"] = ""
+
+def apply_row(row: Dict) -> str:
+    """Run one row's operation (inside a transaction) and describe what it did."""
+    op = row.get("op", "")
+    if op == "create_user":
+        user = operations.create_user(row.get("id", ""), row.get("type", ""), row.get("name", ""),
+                                      row.get("password", ""), row.get("password_hash", ""))
+        return f"created {user['id']}"
+    if op not in OPS:
+        raise TransactionAborted(f"Unknown operation '{op}'.")
+    roles, arguments = OPS[op]
+    user = require_role(row.get("user", ""), *roles)
+    record = getattr(operations, op)(user, *arguments(row))
+    for key in ("thesis_id", "request_id"):
+        if key in record:
+            return f"{record[key]} {record.get('status', '')}".strip()
+    return "done"
+
+def run_group(rows: List[Tuple[int, Dict]]) -> List[Tuple[int, str, str, str]]:
+    """Apply rows in one transaction; return (row number, op, OK/FAILED, message) per row."""
+    locks = sorted({fn for _, row in rows for fn in operations.LOCKS.get(row.get("op", ""), [])})
+
+    def action():
+        results = []
+        for number, row in rows:
+            try:
+                results.append((number, row.get("op", ""), "OK", apply_row(row)))
+            except TransactionAborted as e:
+                results.append((number, row.get("op", ""), "FAILED", str(e)))
+        return results
+
+    if not locks:
+        return action()
+    return transaction(locks, action)
+
+def run_batch(path: Path, fmt: str, batch_size: int = BATCH_SIZE, report: str = "") -> Tuple[int, int]:
+    """Apply every row of a batch file; print a per-row report and return (succeeded, failed)."""
+    rows = enumerate(read_rows(path, fmt), start=1)
+    ok = failed = 0
+    report_file = open(report, 'w', encoding='utf-8', newline='') if report else None
+    writer = csv.writer(report_file) if report_file else None
+    if writer:
+        writer.writerow(["row", "op", "result", "message"])
+    start = time.perf_counter()
+    try:
+        while True:
+            group = list(itertools.islice(rows, batch_size))
+            if not group:
+                break
+            prepare(group)
+            for result in run_group(group):
+                print(f"Row {result[0]}: {result[1]} {result[2]} - {result[3]}")
+                if writer:
+                    writer.writerow(result)
+                if result[2] == "OK":
+                    ok += 1
+                else:
+                    failed += 1
+    finally:
+        if report_file:
+            report_file.close()
+    elapsed = time.perf_counter() - start
+    total = ok + failed
+    print(f"{total} rows: {ok} succeeded, {failed} failed in {elapsed:.2f} s "
+          f"({total / elapsed if elapsed else 0:.0f} ops/sec).")
+    return ok, failed
+
+def main(argv: List[str]) -> int:
+    """Entry point of the batch subcommand."""
+    parser = argparse.ArgumentParser(prog="main.py batch", description="Apply operations from a CSV or JSON-Lines file.")
+    parser.add_argument("file", type=Path)
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="default: from the file extension")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="rows per transaction")
+    parser.add_argument("--report", default="", help="also write the per-row results to this CSV file")
+    args = parser.parse_args(argv)
+    fmt = args.format or ("csv" if args.file.suffix.lower() == ".csv" else "jsonl")
+    initialize_defaults()
+    _, failed = run_batch(args.file, fmt, max(1, args.batch_size), args.report)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,110 @@
+"""Throughput of the thesis document store (blob_store.py) on multi-hundred-MB files.
+
+Usage: python benchmarks/bench_blobs.py [MiB ...]   (default: 256 and 512 MiB files, 3 runs)
+
+For each size, writes a file of random bytes to a temporary data directory, then:
+
+  upload           put_file into an empty store (every chunk new)
+  upload again     the same file again (every chunk already stored)
+  upload draft     a copy with one byte changed in the middle (one chunk new)
+  export sendfile  export() of the file to a new file: os.sendfile from the chunks
+  export mmap      the same through the memory-mapped chunks (iter_chunks + write)
+  plain copy       shutil.copyfile of the original file, for reference
+  verify           re-hash every chunk and the whole file
+  gc               delete the draft's recipe and its one chunk of its own (no thesis
+                   refers to either file; the first is kept by touching it)
+
+Prints the median time and throughput of each, the bytes stored for the three uploads,
+and the peak memory allocated by Python during an upload (tracemalloc, separate run).
+The files are read back from the page cache, so this measures hashing and copying, not
+the disk.
+"""
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RUNS = 3
+
+def random_file(path: Path, size: int):
+    with open(path, 'wb') as f:
+        for _ in range(size // 2 ** 20):
+            f.write(os.urandom(2 ** 20))
+
+def stored_bytes(blob_store) -> int:
+    return sum(p.stat().st_size for p in blob_store._walk("chunks"))
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [256, 512]
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["THESIS_DATA_DIR"] = tmp
+        os.environ.pop("THESIS_METRICS", None)
+        (Path(tmp) / "theses.json").write_text("[]")
+        sys.path.insert(0, str(ROOT))
+        import blob_store
+        for mib in sizes:
+            shutil.rmtree(blob_store.BLOB_DIR, ignore_errors=True)
+            src, draft, out = Path(tmp) / "thesis.pdf", Path(tmp) / "draft.pdf", Path(tmp) / "out.pdf"
+            random_file(src, mib * 2 ** 20)
+            shutil.copyfile(src, draft)
+            with open(draft, 'r+b') as f:
+                f.seek(mib * 2 ** 19)
+                byte = f.read(1)
+                f.seek(-1, os.SEEK_CUR)
+                f.write(bytes([byte[0] ^ 0xFF]))
+            print(f"{mib} MiB file, {blob_store.CHUNK_SIZE // 1024} KiB chunks; median of {RUNS} runs")
+            print(f"  {'':<16} {'time':>9} {'MiB/s':>9} {'stored MiB':>11}")
+
+            def report(label, seconds, stored=None):
+                print(f"  {label:<16} {seconds * 1000:>7.0f}ms {mib / seconds:>9.0f}"
+                      + (f" {stored / 2 ** 20:>11.1f}" if stored is not None else ""))
+
+            def median(call, reset=None):
+                times = []
+                for _ in range(RUNS):
+                    if reset:
+                        reset()
+                    start = time.perf_counter()
+                    call()
+                    times.append(time.perf_counter() - start)
+                return statistics.median(times)
+
+            blobs = blob_store.BLOB_DIR
+            meta = {}
+            report("upload", median(lambda: meta.update(blob_store.put_file(src)),
+                                    lambda: shutil.rmtree(blobs, ignore_errors=True)), stored_bytes(blob_store))
+            report("upload again", median(lambda: blob_store.put_file(src)), stored_bytes(blob_store))
+            draft_meta = blob_store.put_file(draft)
+            report("upload draft", median(lambda: blob_store.put_file(draft)), stored_bytes(blob_store))
+            assert draft_meta["new_chunks"] == 1, draft_meta
+            digest = meta["sha256"]
+            report("export sendfile", median(lambda: blob_store.export(digest, out)))
+
+            def export_mmap():
+                with open(out, 'wb') as f:
+                    for view in blob_store.iter_chunks(digest):
+                        f.write(view)
+            report("export mmap", median(export_mmap))
+            report("plain copy", median(lambda: shutil.copyfile(src, out)))
+            assert not blob_store.verify(digest)
+            report("verify", median(lambda: blob_store.verify(digest)))
+            # Nothing refers to either file, so keep the first one by making it look new.
+            for path in blob_store.chunk_paths(digest) + [blob_store.recipe_path(digest)]:
+                os.utime(path, (time.time() + 60, time.time() + 60))
+            start = time.perf_counter()
+            freed = blob_store.gc(grace=0)
+            print(f"  {'gc':<16} {(time.perf_counter() - start) * 1000:>7.0f}ms "
+                  f"(freed {freed['files']} file, {freed['chunks']} chunk)")
+            tracemalloc.start()
+            blob_store.put_file(src)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"  peak Python memory during an upload: {peak / 2 ** 20:.1f} MiB")
+
+if __name__ == "__main__":
+    main()
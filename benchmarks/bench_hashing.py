@@ -0,0 +1,36 @@
+"""Measure how bulk bcrypt hashing scales with the number of worker processes.
+
+Usage: python benchmarks/bench_hashing.py [passwords] [cost]
+
+Hashes the same passwords with 1, 2, 4, ... workers up to the number of cores and prints
+the rate and speedup over a single process. The default cost (10) keeps the run short;
+each extra cost step doubles the time per hash.
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from credentials import hash_many
+from user_auth import check_password
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    cost = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    passwords = [f"password-{i}" for i in range(count)]
+    cores = os.cpu_count() or 1
+    worker_counts = sorted({min(2 ** i, cores) for i in range(cores.bit_length() + 1)})
+    print(f"{count} passwords, bcrypt cost {cost}, {cores} cores")
+    base = None
+    for workers in worker_counts:
+        start = time.perf_counter()
+        hashes = hash_many(passwords, rounds=cost, workers=workers)
+        elapsed = time.perf_counter() - start
+        base = base or elapsed
+        print(f"  {workers:>3} workers: {elapsed:7.2f} s  {count / elapsed:8.1f} hashes/s  speedup {base / elapsed:.2f}x")
+    assert check_password(passwords[-1], hashes[-1])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Compare memory and time of reading a collection as a JSON array and as JSON Lines.
+
+Usage: python benchmarks/bench_jsonl.py [students] [runs]   (default: 20000 students, 3 runs)
+
+Writes a data set with datagen.py, converts it with jsonl_store.py and builds the offset
+indexes, then reads requests in fresh processes (no snapshot cache), each way:
+
+  json load + filter      load_json, then pick one student's requests (today's format)
+  json array, streamed    the same filter over iter_json_array, one record at a time
+  jsonl, streamed         the same filter over the JSON-Lines file
+  jsonl, first match      next() over the JSON-Lines file: stops at the first match
+  jsonl, offset index     one request by ID through the mmap index
+  repository + index      load_collection and find_by_index, as the menus do
+
+Prints the median time, and the peak memory allocated while reading (tracemalloc, from a
+separate run so that tracing does not slow down the timed ones).
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = {
+    "json load + filter": "found = [r for r in load_json('requests.json', []) if r['student_id'] == STUDENT]",
+    "json array, streamed": "found = list(iter_file(DIR / 'requests.json', lambda r: r['student_id'] == STUDENT))",
+    "jsonl, streamed": "found = list(iter_file(DIR / 'requests.jsonl', lambda r: r['student_id'] == STUDENT))",
+    "jsonl, first match": "found = next(iter_file(DIR / 'requests.jsonl', lambda r: r['student_id'] == STUDENT))",
+    "jsonl, offset index": "found = jsonl_store.find('requests.json', REQUEST)",
+    "repository + index": "found = repository.find_by_index('requests.json', 'student_id', STUDENT)",
+}
+
+RUNNER = """
+import sys, time, tracemalloc
+import jsonl_store, repository
+from data_handler import DATA_DIR as DIR, load_json
+from jsonl_store import iter_file
+STUDENT, REQUEST, TRACE = sys.argv[1], sys.argv[2], sys.argv[3] == "trace"
+if TRACE:
+    tracemalloc.start()
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+assert found
+print(tracemalloc.get_traced_memory()[1] if TRACE else elapsed)
+"""
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    sys.path.insert(0, str(ROOT))
+    import datagen
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        data = datagen.generate(students)
+        datagen.write(data_dir, data)
+        env = dict(os.environ, THESIS_DATA_DIR=tmp, PYTHONPATH=str(ROOT), THESIS_STORAGE_MODE="json",
+                   THESIS_SNAPSHOT_CACHE="0")
+        env.pop("THESIS_METRICS", None)
+        subprocess.run([sys.executable, str(ROOT / "jsonl_store.py"), "to-jsonl", tmp], env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        subprocess.run([sys.executable, str(ROOT / "jsonl_store.py"), "index", tmp], env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        requests = data["requests.json"]
+        middle = requests[len(requests) // 2]
+        args = [middle["student_id"], middle["request_id"]]
+        sizes = {name: (data_dir / name).stat().st_size / 2 ** 20 for name in ("requests.json", "requests.jsonl")}
+        print(f"{len(requests)} requests: {sizes['requests.json']:.1f} MiB as JSON, "
+              f"{sizes['requests.jsonl']:.1f} MiB as JSON Lines; median of {runs} runs")
+        print(f"  {'':<24} {'time':>9} {'peak memory':>12}")
+
+        def run(code: str, mode: str) -> float:
+            out = subprocess.run([sys.executable, "-c", RUNNER.format(code=code)] + args + [mode], env=env, cwd=ROOT,
+                                 check=True, capture_output=True, text=True).stdout
+            return float(out.split()[-1])
+
+        for name, code in SCENARIOS.items():
+            elapsed = statistics.median(run(code, "time") for _ in range(runs))
+            peak = run(code, "trace")
+            print(f"  {name:<24} {elapsed * 1000:>7.1f}ms {peak / 2 ** 20:>10.2f}MiB")
+
+if __name__ == "__main__":
+    main()
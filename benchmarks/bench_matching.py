@@ -0,0 +1,56 @@
+"""Benchmark intake matching on synthetic cohorts.
+
+Usage: python benchmarks/bench_matching.py [students ...]   (default: 2000 20000 50000)
+
+Each student ranks 5 courses, skewed towards popular ones. There is one course per 8
+students with 3-12 seats, and each supervisor has one course and a cap of 10. Reports the time, how many were placed and at which choice, and
+checks that no course or supervisor is over capacity.
+"""
+import itertools
+import random
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import matching
+
+def cohort(n: int, rng: random.Random):
+    supervisors = [{"id": f"P{i}", "type": "supervisor", "supervise_count": rng.randint(0, 4)}
+                   for i in range(max(5, n // 8))]
+    courses = [{"course_id": f"C{i}", "supervisor_id": s["id"], "capacity": rng.randint(3, 12)}
+               for i, s in enumerate(supervisors)]
+    cum_weights = list(itertools.accumulate(1 / (i + 1) ** 0.8 for i in range(len(courses))))
+    requests = []
+    for i in range(n):
+        ranked = []
+        while len(ranked) < 5:
+            for c in rng.choices(courses, cum_weights=cum_weights, k=8):
+                if c["course_id"] not in ranked and len(ranked) < 5:
+                    ranked.append(c["course_id"])
+        requests.append({"request_id": f"R{i}", "student_id": f"S{i}", "course_id": ranked[0],
+                         "status": "Pending", "preferences": ranked})
+    return requests, courses, supervisors
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [2000, 20000, 50000]
+    for n in sizes:
+        requests, courses, users = cohort(n, random.Random(n))
+        start = time.perf_counter()
+        assignment = matching.match(requests, courses, users)
+        elapsed = time.perf_counter() - start
+        per_course = Counter(c for c, _ in assignment.values())
+        course_by_id = {c["course_id"]: c for c in courses}
+        per_supervisor = Counter(course_by_id[c]["supervisor_id"] for c in per_course.elements())
+        over = sum(1 for c, k in per_course.items() if k > course_by_id[c]["capacity"])
+        over += sum(1 for u in users if per_supervisor[u["id"]] + u["supervise_count"] > matching.SUPERVISOR_CAP)
+        seats = sum(c["capacity"] for c in courses)
+        ranks = Counter(rank for _, rank in assignment.values())
+        print(f"{n:>6} students, {len(courses)} courses ({seats} seats): {elapsed:6.2f} s, "
+              f"{len(assignment)} placed ({', '.join(f'#{r + 1}: {k}' for r, k in sorted(ranks.items()))}), "
+              f"{over} over capacity")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Show that current-term operations stay flat as history grows once closed terms are sealed.
+
+Usage: python benchmarks/bench_partitions.py [per_term] [history ...]   (default: 1000 requests per
+term; 0 4 16 32 closed terms of history)
+
+For each history length, writes a department where every closed term has per_term
+finished requests (rejected, or accepted with a defended thesis) and the current term has
+per_term requests in progress. Then, in fresh processes, with all of it in the collection
+files and again after "archive.py repartition" (gzip):
+
+  startup       load requests, theses and their indexes from disk
+  submit        a student submits a request in the current term (one transaction)
+  accept        a supervisor accepts a pending request, creating its thesis
+  view status   a student's requests through the index
+  archive query Rejected requests of the oldest term (partitions pruned by term and status)
+
+Prints the median time of each operation. THESIS_STORAGE_MODE applies as usual. Accepting
+also saves users.json (the supervisor's supervise_count), and accounts are not per term, so
+in json mode that save still grows with the number of students; journal mode appends instead.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+SUPERVISORS = 20
+RUNS = 15
+
+def department(per_term: int, history: int) -> Dict[str, List[Dict]]:
+    """Users, courses, requests and theses for history closed terms plus the current one."""
+    terms = [(1380 + i // 2, ("First", "Second")[i % 2]) for i in range(history + 1)]
+    users = [{"id": f"P{i}", "type": "supervisor", "name": f"Dr. {i}", "supervise_count": 0, "review_count": 0}
+             for i in range(1, SUPERVISORS + 1)]
+    courses, requests, theses = [], [], []
+    for n, (year, semester) in enumerate(terms):
+        current = n == len(terms) - 1
+        term_courses = [{"course_id": f"TH{year}{semester[0]}-{k:02d}", "title": f"Thesis {k}",
+                         "supervisor_id": f"P{k}", "year": year, "semester": semester, "capacity": per_term,
+                         "resources": [], "sessions": 10, "units": 6} for k in range(1, SUPERVISORS + 1)]
+        courses += term_courses
+        for i in range(per_term):
+            student = f"S{n * per_term + i + 1}"
+            course = term_courses[i % SUPERVISORS]
+            users.append({"id": student, "type": "student", "name": f"Student {student}"})
+            day = f"{2000 + n // 2}-{'03' if n % 2 else '10'}-{i % 28 + 1:02d}T10:00:00"
+            status = "Pending" if current else ("Accepted" if i % 3 == 0 else "Rejected")
+            history_entries = [{"status": "Pending", "date": day, "note": "Submitted by student"}]
+            if status != "Pending":
+                history_entries.append({"status": status, "date": day, "note": f"{status} by supervisor"})
+            requests.append({"request_id": f"R{len(requests) + 1}", "student_id": student,
+                             "course_id": course["course_id"], "proposal": "", "status": status,
+                             "date_submitted": day, "history": history_entries})
+            if status == "Accepted":
+                reviewers = [f"P{(i + 1) % SUPERVISORS + 1}", f"P{(i + 2) % SUPERVISORS + 1}"]
+                theses.append({"thesis_id": f"T{len(theses) + 1}", "student_id": student,
+                               "course_id": course["course_id"], "supervisor_id": course["supervisor_id"],
+                               "title": f"Thesis of {student}", "abstract": "", "keywords": [], "files": {},
+                               "ready_for_defense": True, "status": "Scheduled", "date_submitted": day,
+                               "defense": {"date": day[:10], "time": "10:00", "room": "R1",
+                                           "internal_reviewer": reviewers[0], "external_reviewer": reviewers[1],
+                                           "attendance": [], "scores": {reviewers[0]: 17.0, reviewers[1]: 18.0}}})
+    return {"users.json": users, "courses.json": courses, "requests.json": requests, "theses.json": theses,
+            "defenses.json": []}
+
+RUNNER = """
+import json, statistics, sys, time
+t0 = time.perf_counter()
+import archive, operations, repository
+from transactions import transaction
+repository.load_collection("requests.json")
+repository.load_collection("theses.json")
+results = {"startup": [time.perf_counter() - t0]}
+hot = len(repository.load_collection("requests.json"))
+pending = [r for r in repository.load_collection("requests.json") if r["status"] == "Pending"]
+current = archive.current_term()
+course = next(c for c in repository.load_collection("courses.json") if archive.course_term(c) == current)
+oldest = (archive.closed_terms() or [current])[0]
+
+def timed(name, call):
+    start = time.perf_counter()
+    call()
+    results.setdefault(name, []).append(time.perf_counter() - start)
+
+for i in range(RUNS):
+    student = {"id": f"NEW{i}", "type": "student"}
+    timed("submit", lambda: transaction(operations.LOCKS["submit_request"],
+                                        lambda: operations.submit_request(student, course["course_id"])))
+    req = pending[i]
+    supervisor = {"id": repository.find_by_id("courses.json", req["course_id"])["supervisor_id"]}
+    timed("accept", lambda: transaction(operations.LOCKS["review_request"],
+                                        lambda: operations.review_request(supervisor, req["request_id"], "accept")))
+    timed("view status", lambda: repository.find_by_index("requests.json", "student_id", req["student_id"]))
+    timed("archive query", lambda: list(archive.iter_records("requests.json", terms=[oldest], status="Rejected")))
+print(json.dumps({k: statistics.median(v) for k, v in results.items()}))
+print(hot)
+"""
+
+def main():
+    per_term = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    histories = [int(a) for a in sys.argv[2:]] or [0, 4, 16, 32]
+    sys.path.insert(0, str(ROOT))
+    import datagen
+    from data_handler import STORAGE_MODE
+    ops = ["startup", "submit", "accept", "view status", "archive query"]
+    print(f"{per_term} requests per term, {STORAGE_MODE} storage; median of {RUNS} runs (startup: 1), ms")
+    print(f"  {'closed terms':<13} {'layout':<12}" + "".join(f"{op:>14}" for op in ops) + f"{'hot requests':>14}")
+    for history in histories:
+        data = department(per_term, history)
+        for sealed in (False, True):
+            with tempfile.TemporaryDirectory() as tmp:
+                datagen.write(Path(tmp), data)
+                env = dict(os.environ, THESIS_DATA_DIR=tmp, PYTHONPATH=str(ROOT))
+                env.pop("THESIS_METRICS", None)
+                if sealed:
+                    subprocess.run([sys.executable, str(ROOT / "archive.py"), "repartition"], env=env, check=True,
+                                   stdout=subprocess.DEVNULL)
+                out = subprocess.run([sys.executable, "-c", RUNNER.replace("RUNS", str(RUNS))], env=env, cwd=ROOT,
+                                     check=True, capture_output=True, text=True).stdout
+                times, hot = json.loads(out.splitlines()[-2]), int(out.splitlines()[-1])
+                print(f"  {history:<13} {'sealed' if sealed else 'one file':<12}"
+                      + "".join(f"{times[op] * 1000:>14.2f}" for op in ops) + f"{hot:>14}")
+
+if __name__ == "__main__":
+    main()
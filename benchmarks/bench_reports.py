@@ -0,0 +1,69 @@
+"""Benchmark the reports on a synthetic archive.
+
+Usage: python benchmarks/bench_reports.py [requests]   (default: 250000, about 1M history events)
+
+Writes requests with 2-6 history events each, plus theses with defense scores, to a
+temporary data directory, then times building the column snapshot, each report, and a
+second run that reuses the snapshot.
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+def generate(data_dir: Path, n: int, rng: random.Random) -> int:
+    courses = [{"course_id": f"C{i}", "title": f"Course {i}", "supervisor_id": f"P{i % 50}", "capacity": 30}
+               for i in range(200)]
+    base = datetime(2025, 9, 1)
+    requests, theses, events = [], [], 0
+    for i in range(n):
+        t = base + timedelta(minutes=rng.randint(0, 60 * 24 * 120))
+        history = [{"status": "Pending", "date": t.isoformat(timespec='seconds'), "note": "Submitted by student"}]
+        for _ in range(rng.randint(1, 5)):
+            t += timedelta(minutes=rng.randint(60, 60 * 24 * 14))
+            status = rng.choice(["Rejected", "Pending", "Accepted"])
+            history.append({"status": status, "date": t.isoformat(timespec='seconds'), "note": ""})
+        events += len(history)
+        course = rng.choice(courses)
+        requests.append({"request_id": f"R{i}", "student_id": f"S{i}", "course_id": course["course_id"],
+                         "status": history[-1]["status"], "history": history})
+        if history[-1]["status"] == "Accepted" and rng.random() < 0.5:
+            reviewers = rng.sample(range(80), 2)
+            theses.append({"thesis_id": f"T{i}", "student_id": f"S{i}", "course_id": course["course_id"],
+                           "supervisor_id": course["supervisor_id"],
+                           "defense": {"scores": {f"E{r}": round(rng.uniform(12, 20), 2) for r in reviewers}}})
+    for fn, data in [("requests.json", requests), ("theses.json", theses), ("courses.json", courses), ("users.json", [])]:
+        (data_dir / fn).write_text(json.dumps(data), encoding='utf-8')
+    return events
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 250000
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["THESIS_DATA_DIR"] = tmp
+        sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+        import reports
+        import repository
+        events = generate(Path(tmp), n, random.Random(1))
+        print(f"{n} requests, {events} history events")
+        start = time.perf_counter()
+        for fn in reports.COLLECTIONS:
+            repository.load_collection(fn)
+        print(f"  load JSON:       {time.perf_counter() - start:6.2f} s")
+        start = time.perf_counter()
+        reports.get_snapshot()
+        print(f"  build snapshot:  {time.perf_counter() - start:6.2f} s")
+        for name in reports.REPORTS:
+            start = time.perf_counter()
+            _, rows = reports.run_report(name)
+            print(f"  {name + ':':<16} {time.perf_counter() - start:6.3f} s  ({len(rows)} rows)")
+        start = time.perf_counter()
+        for name in reports.REPORTS:
+            reports.run_report(name)
+        print(f"  all again (snapshot reused): {time.perf_counter() - start:6.3f} s")
+
+if __name__ == "__main__":
+    main()
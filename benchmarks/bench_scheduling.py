@@ -0,0 +1,61 @@
+"""Benchmark batch defense scheduling on synthetic seasons.
+
+Usage: python benchmarks/bench_scheduling.py [theses ...]   (default: 1000 10000)
+
+For each size, plans that many ready theses (20 per supervisor, one external reviewer per
+40 theses, 10 rooms, 4 slots a day) and reports the planning time, how many were placed,
+the spread of review_count and whether any person or room was double-booked.
+"""
+import math
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import date
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import scheduling
+
+ROOMS = [f"Room {i}" for i in range(1, 11)]
+
+def season(n: int, rng: random.Random):
+    supervisors = [{"id": f"P{i}", "type": "supervisor", "review_count": rng.randint(0, 3)} for i in range(max(3, n // 20))]
+    reviewers = [{"id": f"E{i}", "type": "reviewer", "review_count": rng.randint(0, 3)} for i in range(max(3, n // 40))]
+    theses = [{"thesis_id": f"T{i}", "supervisor_id": rng.choice(supervisors)["id"]} for i in range(n)]
+    return theses, supervisors + reviewers
+
+def double_bookings(placed) -> int:
+    busy = defaultdict(list)
+    for p in placed:
+        for resource in scheduling.resources(p["supervisor_id"], p["internal_reviewer"], p["external_reviewer"], p["room"]):
+            busy[resource].append((p["start"], p["end"]))
+    clashes = 0
+    for intervals in busy.values():
+        intervals.sort()
+        clashes += sum(1 for a, b in zip(intervals, intervals[1:]) if b[0] < a[1])
+    return clashes
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [1000, 10000]
+    for n in sizes:
+        theses, users = season(n, random.Random(n))
+        days = math.ceil(n / (len(ROOMS) * len(scheduling.DAY_SLOTS)) * 1.2)
+        slots = scheduling.season_slots(date(2026, 6, 1), days)
+        start = time.perf_counter()
+        placed, unplaced = scheduling.plan(theses, users, [], slots, ROOMS)
+        elapsed = time.perf_counter() - start
+        loads = defaultdict(int, {u["id"]: u["review_count"] for u in users})
+        for p in placed:
+            loads[p["internal_reviewer"]] += 1
+            loads[p["external_reviewer"]] += 1
+        by_type = defaultdict(list)
+        for u in users:
+            by_type[u["type"]].append(loads[u["id"]])
+        spread = ", ".join(f"{t} review_count {min(v)}-{max(v)}" for t, v in sorted(by_type.items()))
+        print(f"{n:>6} theses, {days} days: {elapsed:6.2f} s ({n / elapsed:7.0f} theses/s), "
+              f"{len(placed)} placed, {len(unplaced)} left over, {double_bookings(placed)} double bookings; {spread}")
+
+if __name__ == "__main__":
+    main()
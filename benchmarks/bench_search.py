@@ -0,0 +1,61 @@
+"""Compare the inverted thesis index with the old substring scan on a synthetic archive.
+
+Usage: python benchmarks/bench_search.py [number_of_theses]
+"""
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from search_index import InvertedIndex, thesis_terms
+
+WORDS = ("learning deep neural network vision graph model data analysis security cloud "
+         "robot language speech image retrieval optimization quantum sensor energy "
+         "یادگیری ماشین شبکه عصبی بینایی داده امنیت پردازش زبان تصویر بهینه‌سازی").split()
+
+def make_theses(n: int, seed: int = 1) -> List[Dict]:
+    rng = random.Random(seed)
+    return [{
+        "thesis_id": f"T{i}",
+        "title": " ".join(rng.choices(WORDS, k=5)),
+        "abstract": " ".join(rng.choices(WORDS, k=60)) + f" topic{i % 5000}",
+        "keywords": rng.sample(WORDS, 3),
+    } for i in range(1, n + 1)]
+
+def scan(theses: List[Dict], query: str) -> List[Dict]:
+    """The substring scan search_theses used before the index existed."""
+    query = query.lower()
+    return [t for t in theses
+            if query in t.get("title", "").lower() or query in t.get("abstract", "").lower()
+            or any(query in k.lower() for k in t.get("keywords", []))]
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    theses = make_theses(n)
+    start = time.perf_counter()
+    index = InvertedIndex()
+    for t in theses:
+        index.add(t["thesis_id"], thesis_terms(t))
+    print(f"{n} theses, index built in {time.perf_counter() - start:.2f} s, {len(index.postings)} terms")
+    print(f"{'query':<28}{'scan ms':>10}{'index ms':>10}")
+    for query in ["topic42", "quantum", "یادگیری", "quantum sensor", "topic4*", "topic1 OR topic2"]:
+        scan_query = query.split()[0].rstrip("*")
+        scan_ms = timed(lambda: scan(theses, scan_query), 3)
+        index_ms = timed(lambda: index.search(query, 10), 10)
+        print(f"{query:<28}{scan_ms:>10.1f}{index_ms:>10.2f}")
+    start = time.perf_counter()
+    for t in theses[:1000]:
+        t["title"] += " revised"
+        index.add(t["thesis_id"], thesis_terms(t))
+    print(f"incremental update: {(time.perf_counter() - start):.3f} ms per thesis")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark startup: time to the login prompt and to the first load of every collection.
+
+Usage: python benchmarks/bench_startup.py [students] [runs]   (default: 20000 students, 5 runs)
+
+Writes a data set with datagen.py to a temporary directory, then starts fresh processes:
+
+  login prompt   python main.py until it has printed the menu and read "0" (exit)
+  load all       import repository and load the five collections (timed inside the
+                 process, since freeing everything at exit is not part of startup)
+
+"cold" runs delete the snapshot cache (data/.cache) first, so every JSON file is parsed and
+the cache rewritten; "warm" runs find it in place; "no cache" runs set
+THESIS_SNAPSHOT_CACHE=0. Prints the median time of each, and of a bare interpreter for
+reference.
+"""
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+LOAD_ALL = """
+import time
+start = time.perf_counter()
+import repository
+for fn in repository.PRIMARY_KEYS:
+    repository.load_collection(fn)
+print(time.perf_counter() - start)
+"""
+
+def run(args, env, stdin="", timed_inside=False):
+    """Seconds a process took; with timed_inside, the time it printed as its last line instead."""
+    start = time.perf_counter()
+    out = subprocess.run(args, env=env, cwd=ROOT, input=stdin, text=True, check=True, capture_output=True).stdout
+    return float(out.split()[-1]) if timed_inside else time.perf_counter() - start
+
+def median_ms(args, env, runs: int, stdin: str = "", cache_dir=None, timed_inside=False) -> float:
+    times = []
+    for _ in range(runs):
+        if cache_dir is not None:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        times.append(run(args, env, stdin, timed_inside))
+    return statistics.median(times) * 1000
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    sys.path.insert(0, str(ROOT))
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        env = dict(os.environ, THESIS_DATA_DIR=tmp, PYTHONPATH=str(ROOT))
+        env.pop("THESIS_METRICS", None)
+        env.pop("THESIS_PROFILE", None)
+        subprocess.run([sys.executable, str(ROOT / "datagen.py"), tmp, "--students", str(students)], env=env, check=True)
+        size = sum(f.stat().st_size for f in data_dir.glob("*.json"))
+        print(f"{size / 2 ** 20:.1f} MiB of JSON, median of {runs} runs")
+        print(f"  {'':<14} {'cold':>9} {'warm':>9} {'no cache':>9}")
+        bare = median_ms([sys.executable, "-c", "pass"], env, runs)
+        print(f"  {'interpreter':<14} {bare:>7.0f}ms")
+        cache_dir = data_dir / ".cache"
+        no_cache = dict(env, THESIS_SNAPSHOT_CACHE="0")
+        for label, args, stdin, inside in [("login prompt", [sys.executable, "main.py"], "0\n", False),
+                                           ("load all", [sys.executable, "-c", LOAD_ALL], "", True)]:
+            cold = median_ms(args, env, runs, stdin, cache_dir, inside)
+            run(args, env, stdin)  # leave a cache for the warm runs
+            warm = median_ms(args, env, runs, stdin, timed_inside=inside)
+            plain = median_ms(args, no_cache, runs, stdin, timed_inside=inside)
+            print(f"  {label:<14} {cold:>7.0f}ms {warm:>7.0f}ms {plain:>7.0f}ms")
+
+if __name__ == "__main__":
+    main()
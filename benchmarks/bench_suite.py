@@ -0,0 +1,234 @@
+"""Benchmark every menu action on generated data and compare with a baseline.
+
+Usage: python benchmarks/bench_suite.py [--students 5000] [--seed 1] [--repeat 5] [--only PREFIX]
+                                         [--out results.json] [--baseline [FILE]] [--save-baseline FILE]
+                                         [--tolerance 0.25]
+
+Writes a data set with datagen.py to a temporary directory (THESIS_STORAGE_MODE applies as
+usual), then drives the student, supervisor and reviewer menus headlessly: input() is fed a
+script and the output is discarded. Also times search_theses, authenticate_user, and
+load_json/save_json plus a cold repository load of each collection.
+
+Each case runs --repeat times (every run on fresh records, e.g. another pending request),
+then once more under tracemalloc for its peak memory. Results go to --out as JSON. With
+--baseline, each case's median time and peak memory are compared with the stored ones; a
+case more than --tolerance slower or bigger (and past a small absolute noise floor) is a
+regression, and the exit status is 1.
+
+benchmarks/baseline.json is the stored baseline (--baseline with no file): the default
+settings (5000 students, seed 1, json storage), see its "meta" for the machine. Refresh it
+with --save-baseline benchmarks/baseline.json after an intended change, on the machine
+the comparisons run on; timings from other machines only compare loosely.
+"""
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE = ROOT / "benchmarks" / "baseline.json"
+# Differences below these are noise, whatever the ratio.
+TIME_FLOOR = 0.002
+MEMORY_FLOOR = 256 * 1024
+
+def scripted(menu: Callable, user: Dict, answers: List[str]):
+    """Run a menu with input() answering from answers (then "0" to leave) and no console output."""
+    it = iter(answers)
+    saved = builtins.input
+    builtins.input = lambda prompt='': next(it, "0")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            menu(user)
+    finally:
+        builtins.input = saved
+
+def cases(data: Dict[str, List[Dict]]) -> List[Tuple[str, Callable[[], Callable[[], None]]]]:
+    """(name, prepare) pairs; prepare() picks fresh records and returns the call to time."""
+    import menus
+    import repository
+    import user_auth
+    from data_handler import load_json, save_json
+    from datagen import PASSWORDS
+
+    user = lambda user_id: repository.find_by_id("users.json", user_id)
+    students = [u['id'] for u in data["users.json"] if u['type'] == 'student']
+    supervisors = [u['id'] for u in data["users.json"] if u['type'] == 'supervisor']
+    reviewers = [u['id'] for u in data["users.json"] if u['type'] == 'reviewer']
+    applied = {r['student_id'] for r in data["requests.json"]}
+    active = {r['student_id'] for r in data["requests.json"] if r['status'] in ('Pending', 'Accepted')}
+    with_thesis = {t['student_id'] for t in data["theses.json"]}
+
+    def pool(items) -> Iterator:
+        return iter(list(items))
+
+    fresh = pool(s for s in students if s not in applied)
+    rejected = pool(r for r in data["requests.json"] if r['status'] == 'Rejected' and r['student_id'] not in active
+                    and r['student_id'] not in with_thesis)
+    ongoing = pool(t for t in data["theses.json"] if t['status'] == 'Ongoing' and not t['ready_for_defense'])
+    pending = pool(r for r in data["requests.json"] if r['status'] == 'Pending')
+    ready = pool(t for t in data["theses.json"] if t['ready_for_defense'] and t['status'] == 'Ongoing')
+    unscored = pool((t, reviewer) for t in data["theses.json"] if t.get('defense') and not t['defense']['scores']
+                    for reviewer in (t['defense']['internal_reviewer'],))
+    courses = pool(c['course_id'] for c in sorted(data["courses.json"], key=lambda c: -c['capacity']) * 50)
+    supervisor_of = {c['course_id']: c['supervisor_id'] for c in data["courses.json"]}
+    # Defense days after the generated ones, one per run so they never clash.
+    days = iter(range(10 ** 6))
+    viewer = next(s for s in students if s in active)
+
+    def student(answers: Callable[[], Tuple[str, List[str]]]) -> Callable[[], Callable[[], None]]:
+        def prepare():
+            student_id, script = answers()
+            return lambda: scripted(menus.student_menu, user(student_id), script)
+        return prepare
+
+    def request_thesis():
+        return next(fresh), ["1", next(courses), "Benchmark proposal"]
+
+    def resubmit():
+        r = next(rejected)
+        active.add(r['student_id'])
+        return r['student_id'], ["3", r['request_id']]
+
+    seats = {c['course_id']: c['capacity'] for c in data["courses.json"]}
+
+    def review():
+        r = next(pending)
+        while seats[r['course_id']] <= 0:  # accepting needs a free seat
+            r = next(pending)
+        seats[r['course_id']] -= 1
+        supervisor = supervisor_of[r['course_id']]
+        return lambda: scripted(menus.supervisor_menu, user(supervisor), ["1", r['request_id'], "accept"])
+
+    def schedule():
+        t = next(ready)
+        day = str(date(2031, 1, 1) + timedelta(days=next(days)))
+        return lambda: scripted(menus.supervisor_menu, user(t['supervisor_id']), ["3", t['thesis_id'], day, "", ""])
+
+    def score():
+        t, reviewer = next(unscored)
+        return lambda: scripted(menus.reviewer_menu, user(reviewer), ["1", t['thesis_id'], "17.5"])
+
+    def busiest(ids: List[str], key: str) -> str:
+        return max(ids, key=lambda i: user(i).get(key, 0))
+
+    return [
+        ("student.request_thesis", student(request_thesis)),
+        ("student.view_status", student(lambda: (viewer, ["2"]))),
+        ("student.resubmit", student(resubmit)),
+        ("student.request_defense", student(lambda: (next(ongoing)['student_id'], ["4"]))),
+        ("student.search", student(lambda: (students[0], ["5", "learning OR graph*"]))),
+        ("supervisor.review_accept", review),
+        ("supervisor.view_theses", lambda: lambda: scripted(menus.supervisor_menu, user(busiest(supervisors, 'supervise_count')), ["2"])),
+        ("supervisor.schedule_defense", schedule),
+        ("supervisor.report", lambda: lambda: scripted(menus.supervisor_menu, user(supervisors[0]), ["4", "1"])),
+        ("reviewer.record_score", score),
+        ("reviewer.view_defenses", lambda: lambda: scripted(menus.reviewer_menu, user(busiest(reviewers or supervisors, 'review_count')), ["1", ""])),
+        ("search_theses", lambda: lambda: menus.search_theses("efficient learning")),
+        ("search_theses.prefix", lambda: lambda: menus.search_theses("distrib* OR secur*")),
+        ("authenticate_user", lambda: lambda: user_auth.authenticate_user(students[-1], PASSWORDS["student"])),
+    ] + [
+        (f"{name}.{fn[:-5]}", prepare)
+        for fn in ("users.json", "requests.json", "theses.json")
+        for name, prepare in [
+            ("load_json", lambda fn=fn: lambda: load_json(fn, [])),
+            ("save_json", lambda fn=fn: (lambda data: lambda: save_json(fn + ".bench", data))(load_json(fn, []))),
+            ("repository.cold_load", lambda fn=fn: (repository.invalidate(fn), lambda: repository.load_collection(fn))[1]),
+        ]
+    ]
+
+def measure(prepare: Callable[[], Callable[[], None]], repeat: int) -> Dict:
+    times = []
+    for _ in range(repeat):
+        call = prepare()
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+    call = prepare()
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"median_s": statistics.median(times), "min_s": min(times), "runs": repeat, "peak_bytes": peak}
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Regressions of results against a baseline, one line each."""
+    regressions = []
+    print(f"\n{'case':<32} {'median':>10} {'baseline':>10} {'ratio':>7} {'peak KiB':>9} {'baseline':>9}")
+    for name, case in results["cases"].items():
+        base = baseline["cases"].get(name)
+        if not base:
+            print(f"{name:<32} {case['median_s'] * 1000:>8.2f}ms {'(new)':>10}")
+            continue
+        ratio = case["median_s"] / base["median_s"] if base["median_s"] else 1.0
+        flags = []
+        if ratio > 1 + tolerance and case["median_s"] - base["median_s"] > TIME_FLOOR:
+            flags.append(f"{ratio:.2f}x slower")
+        if case["peak_bytes"] > base["peak_bytes"] * (1 + tolerance) and case["peak_bytes"] - base["peak_bytes"] > MEMORY_FLOOR:
+            flags.append(f"peak memory {case['peak_bytes'] / max(1, base['peak_bytes']):.2f}x")
+        print(f"{name:<32} {case['median_s'] * 1000:>8.2f}ms {base['median_s'] * 1000:>8.2f}ms {ratio:>6.2f}x "
+              f"{case['peak_bytes'] // 1024:>9} {base['peak_bytes'] // 1024:>9}  {', '.join(flags)}")
+        regressions += [f"{name}: {flag}" for flag in flags]
+    if any(results["meta"][k] != baseline["meta"].get(k) for k in ("students", "seed", "storage_mode")):
+        print("Note: the baseline was taken with different settings:", baseline["meta"])
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--students", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", default="", help="run only the cases whose name starts with this")
+    parser.add_argument("--out", type=Path, help="write the results here as JSON")
+    parser.add_argument("--baseline", type=Path, nargs="?", const=BASELINE,
+                        help=f"compare with these stored results (default: {BASELINE.relative_to(ROOT)})")
+    parser.add_argument("--save-baseline", type=Path, help="also store the results as a baseline here")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown / growth (default 0.25 = 25%%)")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["THESIS_DATA_DIR"] = tmp
+        sys.path.insert(0, str(ROOT))
+        import datagen
+        from data_handler import STORAGE_MODE
+        from initial_setup import initialize_defaults
+        start = time.perf_counter()
+        data = datagen.generate(args.students, seed=args.seed)
+        datagen.write(Path(tmp), data)
+        with contextlib.redirect_stdout(io.StringIO()):
+            initialize_defaults()
+        counts = {fn[:-5]: len(records) for fn, records in data.items()}
+        print(f"Generated {', '.join(f'{n} {k}' for k, n in counts.items())} in {time.perf_counter() - start:.1f} s "
+              f"({STORAGE_MODE} storage)")
+        results = {"meta": {"students": args.students, "seed": args.seed, "storage_mode": STORAGE_MODE,
+                            "records": counts, "python": platform.python_version(), "machine": platform.machine(),
+                            "date": time.strftime("%Y-%m-%dT%H:%M:%S")},
+                   "cases": {}}
+        for name, prepare in cases(data):
+            if not name.startswith(args.only):
+                continue
+            case = results["cases"][name] = measure(prepare, args.repeat)
+            print(f"  {name:<32} median {case['median_s'] * 1000:9.2f} ms   min {case['min_s'] * 1000:9.2f} ms   "
+                  f"peak {case['peak_bytes'] / 1024:9.0f} KiB")
+    for path in (args.out, args.save_baseline):
+        if path:
+            path.write_text(json.dumps(results, indent=2), encoding='utf-8')
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text(encoding='utf-8')), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION:", regression)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
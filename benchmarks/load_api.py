@@ -0,0 +1,182 @@
+"""Load generator for the HTTP API (api_server.py).
+
+Usage: python benchmarks/load_api.py [--clients 50] [--duration 10] [--students 500] [--url http://host:port]
+
+Without --url, starts a server on a temporary data directory seeded with --students
+students (plaintext passwords, hashed at first login at THESIS_BCRYPT_ROUNDS=4), one
+supervisor per 25 students and a course per supervisor. Each client logs in on a
+keep-alive connection, as its own student or (one in ten) supervisor account, and repeatedly picks a
+random call from its role's mix for --duration seconds. With --url, the target's data must
+contain the same accounts (S<n>/pass<n>, P<n>/pass<n>).
+
+Prints requests/sec, p50 and p99 latency overall and per endpoint, and the status codes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+
+STUDENT_MIX = [("GET", "/me", 2), ("GET", "/courses", 3), ("GET", "/requests", 3), ("GET", "/search?q=thesis", 1),
+               ("POST", "/requests", 1)]
+SUPERVISOR_MIX = [("GET", "/supervisor/requests", 3), ("GET", "/supervisor/theses", 2), ("POST", "review", 1)]
+
+def seed(data_dir: Path, students: int):
+    supervisors = max(1, students // 25)
+    users = [{"id": f"S{i}", "type": "student", "name": f"Student {i}", "password": f"pass{i}"} for i in range(students)]
+    users += [{"id": f"P{i}", "type": "supervisor", "name": f"Dr. {i}", "password": f"pass{i}",
+               "supervise_count": 0, "review_count": 0} for i in range(supervisors)]
+    courses = [{"course_id": f"C{i}", "title": f"Thesis - Topic {i}", "supervisor_id": f"P{i}", "year": 1404,
+                "semester": "First", "capacity": 30, "resources": [], "sessions": 10, "units": 6}
+               for i in range(supervisors)]
+    for fn, data in [("users.json", users), ("courses.json", courses), ("requests.json", []),
+                     ("theses.json", []), ("defenses.json", [])]:
+        (data_dir / fn).write_text(json.dumps(data), encoding='utf-8')
+
+class Client:
+    """One keep-alive HTTP connection."""
+
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.token = ""
+
+    async def call(self, method: str, path: str, body: Optional[Dict] = None) -> Tuple[int, object]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        raw = json.dumps(body).encode('utf-8') if body is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(raw)}\r\n"
+        if self.token:
+            head += f"Authorization: Bearer {self.token}\r\n"
+        self.writer.write((head + "\r\n").encode('latin-1') + raw)
+        status = int((await self.reader.readline()).split()[1])
+        length, close = 0, False
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode('latin-1').partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+            elif name.lower() == "connection" and value.strip().lower() == "close":
+                close = True
+        payload = json.loads(await self.reader.readexactly(length)) if length else None
+        if close:
+            self.writer.close()
+            self.writer = None
+        return status, payload
+
+async def run_client(n: int, host: str, port: int, students: int, deadline: float,
+                     latencies: Dict[str, List[float]], statuses: Counter):
+    rng = random.Random(n)
+    client = Client(host, port)
+    supervisor = n % 10 == 9
+    # Distinct accounts: a first login replaces the plaintext password, ending other sessions of that user.
+    user_id = f"P{n // 10 % max(1, students // 25)}" if supervisor else f"S{n % students}"
+
+    async def timed(label: str, method: str, path: str, body: Optional[Dict] = None):
+        start = time.perf_counter()
+        status, payload = await client.call(method, path, body)
+        latencies[label].append(time.perf_counter() - start)
+        statuses[status] += 1
+        return status, payload
+
+    status, payload = await timed("POST /login", "POST", "/login", {"id": user_id, "password": "pass" + user_id[1:]})
+    if status != 200:
+        raise SystemExit(f"Login of {user_id} failed: {payload}")
+    client.token = payload["token"]
+    mix = SUPERVISOR_MIX if supervisor else STUDENT_MIX
+    weights = [w for _, _, w in mix]
+    while time.perf_counter() < deadline:
+        method, path, _ = rng.choices(mix, weights)[0]
+        if path == "/requests" and method == "POST":
+            await timed("POST /requests", method, path, {"course_id": f"C{rng.randrange(max(1, students // 25))}",
+                                                        "proposal": "Load test"})
+        elif path == "review":
+            _, pending = await timed("GET /supervisor/requests", "GET", "/supervisor/requests")
+            if pending:
+                req = rng.choice(pending)
+                await timed("POST /requests/<id>/review", "POST", f"/requests/{req['request_id']}/review",
+                            {"decision": rng.choice(["accept", "reject"]), "version": req.get("version")})
+        else:
+            await timed(f"{method} {path.split('?')[0]}", method, path)
+    if client.writer is not None:
+        client.writer.close()
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def wait_for(host: str, port: int, server: Optional[subprocess.Popen], timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while True:
+        if server is not None and server.poll() is not None:
+            raise SystemExit("The server exited.")
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+async def load(host: str, port: int, clients: int, duration: float, students: int,
+               server: Optional[subprocess.Popen] = None):
+    await wait_for(host, port, server)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Counter = Counter()
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(n, host, port, students, start + duration, latencies, statuses)
+                           for n in range(clients)))
+    elapsed = time.perf_counter() - start
+    everything = [x for values in latencies.values() for x in values]
+    print(f"{clients} clients, {elapsed:.1f} s: {len(everything)} requests, {len(everything) / elapsed:.0f} req/s")
+    print(f"  {'endpoint':<28} {'count':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for label, values in sorted(latencies.items()) + [("all", everything)]:
+        print(f"  {label:<28} {len(values):>7} {percentile(values, 0.5) * 1000:>8.1f} {percentile(values, 0.99) * 1000:>8.1f}")
+    print("  status codes: " + ", ".join(f"{code}: {k}" for code, k in sorted(statuses.items())))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--url", help="an already running server (default: start one)")
+    parser.add_argument("--port", type=int, default=0, help="port of the server started here (default: any free one)")
+    args = parser.parse_args()
+    if args.url:
+        url = urlsplit(args.url)
+        asyncio.run(load(url.hostname, url.port or 80, args.clients, args.duration, args.students))
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        seed(Path(tmp), args.students)
+        env = dict(os.environ, THESIS_DATA_DIR=tmp, THESIS_BCRYPT_ROUNDS="4")
+        port = args.port or free_port()
+        server = subprocess.Popen([sys.executable, str(ROOT / "api_server.py"), "--port", str(port)],
+                                  env=env, cwd=ROOT)
+        try:
+            asyncio.run(load("127.0.0.1", port, args.clients, args.duration, args.students, server))
+        finally:
+            server.terminate()
+            server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Run N processes doing mixed menu operations on one data directory and check invariants.
+
+Usage: python benchmarks/stress_concurrency.py [processes] [operations_per_process]
+
+The operations lock different sets of collections: submitting and re-submitting lock
+requests.json, reviewing locks courses, requests, theses and users, requesting a
+defense locks theses.json, creating an account locks users.json, and adding a seat
+locks courses.json. So commits of unrelated transactions overlap in time.
+
+Set THESIS_STORAGE_MODE to stress the journal, JSON-Lines or SQLite storage instead of plain JSON.
+Exits non-zero if any update was lost or applied twice.
+"""
+import builtins
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+STUDENTS = 200
+SUPERVISORS = 5
+
+def seed(data_dir: Path):
+    jsonl = os.environ.get("THESIS_STORAGE_MODE") == "jsonl"
+    users = [{"id": f"S{i}", "type": "student", "name": f"Student {i}"} for i in range(1, STUDENTS + 1)]
+    users += [{"id": f"P{i}", "type": "supervisor", "name": f"Dr. {i}", "supervise_count": 0, "review_count": 0}
+              for i in range(1, SUPERVISORS + 1)]
+    courses = [{"course_id": f"C{i}", "title": f"Thesis {i}", "supervisor_id": f"P{i}", "year": 1404,
+                "semester": "First", "capacity": STUDENTS, "resources": [], "sessions": 10, "units": 6}
+               for i in range(1, SUPERVISORS + 1)]
+    for fn, data in [("users.json", users), ("courses.json", courses), ("requests.json", []),
+                     ("theses.json", []), ("defenses.json", [])]:
+        if jsonl:
+            (data_dir / (fn[:-5] + ".jsonl")).write_text("".join(json.dumps(r) + "\n" for r in data), encoding='utf-8')
+        else:
+            (data_dir / fn).write_text(json.dumps(data), encoding='utf-8')
+
+def add_seat(course_id: str):
+    """Add one seat to a course (a courses.json-only transaction)."""
+    import repository
+    course = repository.find_by_id("courses.json", course_id)
+    course["capacity"] += 1
+    repository.update_record("courses.json", course)
+    repository.save_collection("courses.json")
+
+def worker(worker_id: int, operations: int):
+    sys.path.insert(0, str(ROOT))
+    import menus
+    import operations as ops
+    import repository
+    from transactions import transaction
+    rng = random.Random(worker_id)
+    out = io.StringIO()
+    done = {"users": [], "seats": Counter(), "defense_requests": 0}
+
+    def run(menu, user_id, answers):
+        it = iter(answers)
+        builtins.input = lambda prompt='': next(it, "0")
+        with contextlib.redirect_stdout(out):
+            menu(repository.find_by_id("users.json", user_id))
+
+    for n in range(operations):
+        op = rng.random()
+        if op < 0.35:
+            run(menus.student_menu, f"S{rng.randint(1, STUDENTS)}", ["1", f"C{rng.randint(1, SUPERVISORS)}", "p", "0"])
+        elif op < 0.45:
+            user_id = f"W{worker_id}-{n}"
+            transaction(ops.LOCKS["create_user"], lambda: ops.create_user(user_id, "reviewer", user_id, password_hash="-"))
+            done["users"].append(user_id)
+        elif op < 0.55:
+            course_id = f"C{rng.randint(1, SUPERVISORS)}"
+            transaction(["courses.json"], lambda: add_seat(course_id))
+            done["seats"][course_id] += 1
+        elif op < 0.65:
+            student = f"S{rng.randint(1, STUDENTS)}"
+            before = out.getvalue().count("Defense request sent")
+            run(menus.student_menu, student, ["4", "0"])
+            done["defense_requests"] += out.getvalue().count("Defense request sent") - before
+        elif op < 0.9:
+            supervisor = f"P{rng.randint(1, SUPERVISORS)}"
+            pending = repository.find_by_index("requests.json", "supervisor_status", (supervisor, "Pending"))
+            if pending:
+                req = rng.choice(pending)
+                run(menus.supervisor_menu, supervisor, ["1", req["request_id"], rng.choice(["accept", "reject"]), "0"])
+        else:
+            student = f"S{rng.randint(1, STUDENTS)}"
+            rejected = [r for r in repository.find_by_index("requests.json", "student_id", student) if r["status"] == "Rejected"]
+            if rejected:
+                run(menus.student_menu, student, ["3", rejected[0]["request_id"], "0"])
+    done["conflicts"] = out.getvalue().count("changed by another session")
+    print(json.dumps(done))
+
+def check(data_dir: Path, done: list) -> list:
+    sys.path.insert(0, str(ROOT))
+    os.environ["THESIS_DATA_DIR"] = str(data_dir)
+    import repository
+    users = repository.load_collection("users.json")
+    requests = repository.load_collection("requests.json")
+    theses = repository.load_collection("theses.json")
+    problems = []
+    for fn, records, key in [("requests", requests, "request_id"), ("theses", theses, "thesis_id")]:
+        dupes = [k for k, n in Counter(r[key] for r in records).items() if n > 1]
+        if dupes:
+            problems.append(f"duplicate {fn} IDs: {dupes[:5]}")
+    per_supervisor = Counter(t["supervisor_id"] for t in theses)
+    for u in users:
+        if u["type"] == "supervisor" and u["supervise_count"] != per_supervisor[u["id"]]:
+            problems.append(f"{u['id']}: supervise_count {u['supervise_count']} but {per_supervisor[u['id']]} theses")
+    accepted = Counter((r["student_id"], r["course_id"]) for r in requests if r["status"] == "Accepted")
+    created = Counter((t["student_id"], t["course_id"]) for t in theses)
+    if accepted != created:
+        problems.append(f"{sum(accepted.values())} accepted requests but {sum(created.values())} theses")
+    active = Counter(r["student_id"] for r in requests if r["status"] in ("Pending", "Accepted"))
+    problems += [f"{s} has {n} active requests" for s, n in active.items() if n > 1]
+    user_ids = {u["id"] for u in users}
+    created = [u for d in done for u in d["users"]]
+    if any(u not in user_ids for u in created):
+        problems.append(f"{sum(u not in user_ids for u in created)} of {len(created)} created accounts are missing")
+    seats = Counter()
+    for d in done:
+        seats.update(d["seats"])
+    taken = Counter(t["course_id"] for t in theses)
+    for c in repository.load_collection("courses.json"):
+        expected = STUDENTS + seats[c["course_id"]] - taken[c["course_id"]]
+        if c["capacity"] != expected:
+            problems.append(f"{c['course_id']}: capacity {c['capacity']} but expected {expected}")
+    ready = sum(t["ready_for_defense"] for t in theses)
+    if ready != sum(d["defense_requests"] for d in done):
+        problems.append(f"{ready} theses ready for defense but {sum(d['defense_requests'] for d in done)} requests made")
+    problems += repository.check_indexes()
+    return problems
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    operations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        seed(data_dir)
+        env = dict(os.environ, THESIS_DATA_DIR=str(data_dir))
+        start = time.perf_counter()
+        procs = [subprocess.Popen([sys.executable, __file__, "--worker", str(i), str(operations)],
+                                  env=env, stdout=subprocess.PIPE, text=True) for i in range(processes)]
+        outputs = [p.communicate()[0].strip() for p in procs]
+        elapsed = time.perf_counter() - start
+        failed = [p.returncode for p in procs if p.returncode]
+        done = [json.loads(o.splitlines()[-1]) for o in outputs if o]
+        conflicts = sum(d["conflicts"] for d in done)
+        problems = check(data_dir, done)
+        print(f"{processes} processes x {operations} operations in {elapsed:.1f} s "
+              f"({processes * operations / elapsed:.0f} ops/s), {conflicts} conflicts reported to users")
+        if failed:
+            problems.append(f"{len(failed)} worker processes failed")
+        for problem in problems:
+            print("FAIL:", problem)
+        print("OK: no lost or duplicated updates." if not problems else f"{len(problems)} problems found.")
+        sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        worker(int(sys.argv[2]), int(sys.argv[3]))
+    else:
+        main()
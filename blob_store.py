@@ -0,0 +1,386 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import IO, BinaryIO, Dict, Iterator, List, Optional, Set
+from data_handler import DATA_DIR, fcntl
+
+# Content-addressed store for thesis documents (PDFs, drafts). Files are kept outside the
+# collections: a thesis only records, per file name, the SHA-256 of the content and its
+# metadata in thesis['files'], so the JSON files stay small however large the documents get.
+#
+# An upload is streamed in fixed-size chunks (CHUNK_SIZE). Each chunk is stored once under
+# its own SHA-256 (BLOB_DIR/chunks/ab/abcd...), so a chunk shared by two drafts, or two
+# theses, takes space once. The file as a whole is described by a small recipe
+# (BLOB_DIR/files/ab/<sha256 of the file>) listing its chunks in order; the file digest is
+# computed incrementally while the chunks go by, so nothing is held in memory beyond one
+# chunk. Chunks and recipes are written to a temporary file and renamed into place, so a
+# reader never sees a partial one, and they are never changed afterwards.
+#
+# Reads memory-map one chunk at a time (iter_chunks); send() copies a file to another file
+# or socket with os.sendfile where available, so the data does not pass through Python.
+#
+# gc() deletes recipes no thesis refers to (hot or sealed) and chunks no recipe uses. Every
+# upload (a BlobWriter between open() and close(), as put() does) holds a shared lock on
+# the store and gc() an exclusive one. Each writer locks through its own open file, so
+# uploads on several threads of one process (the API server) are each covered. Anything
+# written in the last GC_GRACE seconds is kept, so a file that was just uploaded but is not
+# attached to its thesis yet survives; reused chunks and recipes are touched for the same
+# reason.
+
+BLOB_DIR = DATA_DIR / "blobs"
+CHUNK_SIZE = 1 << 20
+# Seconds an unreferenced chunk or recipe is kept after it was last written or reused.
+GC_GRACE = 3600
+LOCK = "blobs"
+
+class BlobNotFound(Exception):
+    """A file or one of its chunks is missing from the store."""
+
+def chunk_path(digest: str) -> Path:
+    return BLOB_DIR / "chunks" / digest[:2] / digest
+
+def recipe_path(digest: str) -> Path:
+    return BLOB_DIR / "files" / digest[:2] / digest
+
+def _write_atomic(path: Path, data) -> Path:
+    """Write data to a temporary file next to path and rename it into place (not fsynced)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return path
+
+def _lock(exclusive: bool) -> IO:
+    """Lock the store through a new open file (flock locks belong to the open file)."""
+    f = open(DATA_DIR / (LOCK + ".lock"), 'a+b')
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    return f
+
+def _unlock(f: IO):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    f.close()
+
+def _fsync(path: Path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class BlobWriter:
+    """Stores a file written to it in pieces of any size, between open() and close() (or abort())."""
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._lock: Optional[IO] = None
+        self._pending = bytearray()
+        self._file_hash = hashlib.sha256()
+        self._new: List[Path] = []
+        self.chunks: List[str] = []
+        self.size = 0
+
+    def open(self) -> "BlobWriter":
+        """Take the shared store lock, waiting while gc() runs."""
+        if self._lock is None:
+            self._lock = _lock(exclusive=False)
+        return self
+
+    def abort(self):
+        """Give up the upload; chunks already written are left to gc()."""
+        if self._lock is not None:
+            _unlock(self._lock)
+            self._lock = None
+
+    def write(self, data) -> int:
+        if self._lock is None:
+            raise RuntimeError("BlobWriter.write() before open().")
+        view = memoryview(data).cast('B')
+        while view:
+            if not self._pending and len(view) >= self.chunk_size:
+                # A whole chunk in the caller's buffer: store it without copying.
+                self._store(view[:self.chunk_size])
+                view = view[self.chunk_size:]
+                continue
+            take = self.chunk_size - len(self._pending)
+            self._pending += view[:take]
+            view = view[take:]
+            if len(self._pending) == self.chunk_size:
+                self._store(self._pending)
+                self._pending = bytearray()
+        return len(data)
+
+    def _store(self, chunk):
+        digest = hashlib.sha256(chunk).hexdigest()
+        self._file_hash.update(chunk)
+        self.size += len(chunk)
+        self.chunks.append(digest)
+        path = chunk_path(digest)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self._new.append(_write_atomic(path, chunk))
+
+    def close(self) -> Dict:
+        """Store the last partial chunk and the recipe, release the lock, and return the file's
+        metadata: {"sha256", "size", "chunks", "new_chunks"}."""
+        try:
+            return self._finish()
+        finally:
+            self.abort()
+
+    def _finish(self) -> Dict:
+        if self._lock is None:
+            raise RuntimeError("BlobWriter.close() before open().")
+        if self._pending:
+            self._store(self._pending)
+            self._pending = bytearray()
+        # The chunks were left to the page cache while streaming; flush them together,
+        # before the recipe that refers to them.
+        for path in self._new:
+            _fsync(path)
+        digest = self._file_hash.hexdigest()
+        path = recipe_path(digest)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            recipe = {"size": self.size, "chunk_size": self.chunk_size, "chunks": self.chunks}
+            _fsync(_write_atomic(path, json.dumps(recipe).encode('utf-8')))
+        return {"sha256": digest, "size": self.size, "chunks": len(self.chunks), "new_chunks": len(self._new)}
+
+def put(stream: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Dict:
+    """Store everything read from a binary stream; return its metadata (see BlobWriter.close)."""
+    writer = BlobWriter(chunk_size).open()
+    buffer = bytearray(chunk_size)
+    try:
+        while True:
+            n = stream.readinto(buffer)
+            if not n:
+                break
+            writer.write(memoryview(buffer)[:n])
+        return writer.close()
+    finally:
+        writer.abort()
+
+def put_file(path: Path, chunk_size: int = CHUNK_SIZE) -> Dict:
+    """Store a local file; return its metadata."""
+    with open(path, 'rb', buffering=0) as f:
+        return put(f, chunk_size)
+
+def recipe(digest: str) -> Dict:
+    """The recipe of a stored file: {"size", "chunk_size", "chunks"}."""
+    try:
+        with open(recipe_path(digest), 'rb') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise BlobNotFound(f"No stored file {digest}.")
+
+def exists(digest: str) -> bool:
+    return len(digest) == 64 and recipe_path(digest).exists()
+
+def chunk_paths(digest: str) -> List[Path]:
+    """Paths of a stored file's chunks, in order."""
+    paths = [chunk_path(c) for c in recipe(digest)["chunks"]]
+    missing = next((p for p in paths if not p.exists()), None)
+    if missing is not None:
+        raise BlobNotFound(f"Chunk {missing.name} of {digest} is missing.")
+    return paths
+
+def iter_chunks(digest: str) -> Iterator[memoryview]:
+    """The content of a stored file as memory-mapped chunks, one at a time.
+
+    Each view is released when the next one is requested; copy it to keep it.
+    """
+    for path in chunk_paths(digest):
+        with open(path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                yield view
+
+def send(digest: str, out: BinaryIO) -> int:
+    """Copy a stored file to an open file or socket; return the number of bytes.
+
+    Uses os.sendfile (no copy through user space) when out has a file descriptor,
+    otherwise writes the memory-mapped chunks.
+    """
+    paths = chunk_paths(digest)
+    try:
+        out_fd = out.fileno()
+    except (AttributeError, OSError):
+        out_fd = None
+    if out_fd is None or not hasattr(os, "sendfile"):
+        total = 0
+        for view in iter_chunks(digest):
+            out.write(view)
+            total += len(view)
+        return total
+    if hasattr(out, "flush"):
+        out.flush()
+    total = 0
+    for path in paths:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(out_fd, f.fileno(), offset, size - offset)
+                if not sent:
+                    raise BlobNotFound(f"Chunk {path.name} of {digest} was truncated.")
+                offset += sent
+            total += size
+    return total
+
+def export(digest: str, path: Path) -> int:
+    """Write a stored file to path; return its size."""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, 'wb') as f:
+        n = send(digest, f)
+    os.replace(tmp, path)
+    return n
+
+def verify(digest: str) -> List[str]:
+    """Problems found re-hashing a stored file (empty if its chunks and digest match)."""
+    try:
+        expected = recipe(digest)["chunks"]
+        file_hash = hashlib.sha256()
+        problems = []
+        for chunk_digest, view in zip(expected, iter_chunks(digest)):
+            file_hash.update(view)
+            if hashlib.sha256(view).hexdigest() != chunk_digest:
+                problems.append(f"chunk {chunk_digest} is corrupt")
+    except BlobNotFound as e:
+        return [str(e)]
+    if file_hash.hexdigest() != digest:
+        problems.append("content does not match the file digest")
+    return problems
+
+def _walk(kind: str) -> Iterator[Path]:
+    """Every file under BLOB_DIR/<kind>, including leftover temporary files."""
+    root = BLOB_DIR / kind
+    if root.exists():
+        for bucket in root.iterdir():
+            yield from bucket.iterdir()
+
+def referenced() -> Dict[str, str]:
+    """File digest -> "<thesis ID>/<name>" of one thesis file using it, over hot and sealed theses."""
+    import archive
+    refs = {}
+    for thesis in archive.iter_records("theses.json"):
+        for name, meta in (thesis.get("files") or {}).items():
+            refs.setdefault(meta.get("sha256"), f"{thesis['thesis_id']}/{name}")
+    return refs
+
+def gc(grace: float = GC_GRACE, dry_run: bool = False) -> Dict[str, int]:
+    """Delete unreferenced recipes and chunks older than grace seconds; return what was (or would be) freed."""
+    freed = {"files": 0, "chunks": 0, "bytes": 0}
+    cutoff = time.time() - grace
+    lock = _lock(exclusive=True)
+    try:
+        refs = referenced()
+        live: Set[str] = set()
+        doomed: List[Path] = []
+        for path in _walk("files"):
+            if path.name in refs or path.stat().st_mtime > cutoff:
+                if not path.name.endswith(".tmp"):
+                    live.update(recipe(path.name)["chunks"])
+            else:
+                doomed.append(path)
+                freed["files"] += 1
+        for path in _walk("chunks"):
+            if path.name not in live and path.stat().st_mtime <= cutoff:
+                doomed.append(path)
+                freed["chunks"] += 1
+                freed["bytes"] += path.stat().st_size
+        if not dry_run:
+            for path in doomed:
+                path.unlink()
+    finally:
+        _unlock(lock)
+    return freed
+
+def stats() -> Dict[str, int]:
+    """Stored chunks and bytes, and the total size of the files the theses refer to."""
+    chunks = list(_walk("chunks"))
+    refs = referenced()
+    return {"chunks": len(chunks), "stored_bytes": sum(p.stat().st_size for p in chunks),
+            "referenced_files": len(refs), "referenced_bytes": sum(recipe(d)["size"] for d in refs if exists(d))}
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Thesis document store: chunked, content-addressed and deduplicated.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    attach = sub.add_parser("attach", help="upload a file and record it in a thesis")
+    attach.add_argument("user", help="ID of the student or supervisor of the thesis")
+    attach.add_argument("thesis_id")
+    attach.add_argument("file", type=Path)
+    attach.add_argument("--name", help="name in the thesis (default: the file's name)")
+    get = sub.add_parser("get", help="download a thesis file")
+    get.add_argument("thesis_id")
+    get.add_argument("name")
+    get.add_argument("out", type=Path)
+    listing = sub.add_parser("list", help="list the files of a thesis")
+    listing.add_argument("thesis_id")
+    sub.add_parser("verify", help="re-hash every referenced file")
+    collect = sub.add_parser("gc", help="delete chunks no thesis refers to")
+    collect.add_argument("--grace", type=float, default=GC_GRACE, help=f"keep anything newer (seconds, default {GC_GRACE})")
+    collect.add_argument("--dry-run", action="store_true")
+    sub.add_parser("stats", help="show stored and referenced sizes")
+    args = parser.parse_args(argv)
+
+    import archive
+    from transactions import TransactionAborted, transaction
+    if args.command == "attach":
+        import operations
+        from user_auth import find_user_by_id
+        user = find_user_by_id(args.user)
+        if user is None:
+            print("User not found.")
+            return 1
+        blob = put_file(args.file)
+        try:
+            transaction(operations.LOCKS["attach_file"],
+                        lambda: operations.attach_file(user, args.thesis_id, args.name or args.file.name, blob))
+        except TransactionAborted as e:
+            print(e)
+            return 1
+        print(f"{args.file.name}: {blob['size']} bytes, sha256 {blob['sha256']}, "
+              f"{blob['new_chunks']} of {blob['chunks']} chunks new.")
+    elif args.command in ("get", "list"):
+        thesis = archive.find("theses.json", args.thesis_id)
+        if thesis is None:
+            print("Thesis not found.")
+            return 1
+        files = thesis.get("files") or {}
+        if args.command == "list":
+            for name, meta in files.items():
+                print(f"{name:<32} {meta['size']:>12} bytes  {meta['uploaded']}  {meta['sha256']}")
+        elif args.name not in files:
+            print("No such file in this thesis.")
+            return 1
+        else:
+            print(f"{export(files[args.name]['sha256'], args.out)} bytes written to {args.out}.")
+    elif args.command == "verify":
+        bad = 0
+        for digest, where in referenced().items():
+            for problem in verify(digest):
+                print(f"{where}: {problem}")
+                bad += 1
+        print(f"{bad} problems found.")
+        return 1 if bad else 0
+    elif args.command == "gc":
+        freed = gc(args.grace, args.dry_run)
+        print(f"{'Would free' if args.dry_run else 'Freed'} {freed['files']} files, {freed['chunks']} chunks, "
+              f"{freed['bytes'] / 2 ** 20:.1f} MiB.")
+    else:
+        s = stats()
+        print(f"{s['referenced_files']} files referenced, {s['referenced_bytes'] / 2 ** 20:.1f} MiB; "
+              f"{s['chunks']} chunks stored, {s['stored_bytes'] / 2 ** 20:.1f} MiB.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
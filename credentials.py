@@ -0,0 +1,118 @@
+import argparse
+import csv
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import operations
+from repository import load_collection, save_collection, update_record
+from transactions import TransactionAborted, transaction
+from user_auth import BCRYPT_ROUNDS, find_user_by_id, hash_cost, hash_password
+
+# Bulk credential work. bcrypt is CPU-bound and deliberately slow, so passwords are hashed
+# in a pool of processes (one per core by default) before any lock is taken; the results
+# are then written in one transaction and one save of users.json.
+#
+#   python credentials.py status                      count hashes per cost factor
+#   python credentials.py migrate [--workers N]       hash every remaining plaintext password
+#   python credentials.py provision users.csv [...]   create accounts from id,type,name,password rows
+#
+# Hashes below the current cost (THESIS_BCRYPT_ROUNDS) cannot be upgraded in bulk, since
+# the passwords are unknown; authenticate_user re-hashes them at the next login.
+
+# Below this many passwords a pool costs more to start than it saves.
+MIN_PARALLEL = 4
+
+def _hash_one(item: Tuple[str, int]) -> str:
+    return hash_password(*item)
+
+def hash_many(passwords: List[str], rounds: Optional[int] = None, workers: Optional[int] = None) -> List[str]:
+    """bcrypt hashes of passwords, in order, computed on up to workers processes."""
+    workers = workers or os.cpu_count() or 1
+    items = [(p, rounds or BCRYPT_ROUNDS) for p in passwords]
+    if workers == 1 or len(items) < MIN_PARALLEL:
+        return [_hash_one(item) for item in items]
+    workers = min(workers, len(items))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_hash_one, items, chunksize=max(1, len(items) // (workers * 4))))
+
+def cost_summary() -> Dict[str, int]:
+    """Number of users per bcrypt cost factor ("plaintext" for unmigrated passwords)."""
+    summary: Dict[str, int] = {}
+    for user in load_collection("users.json"):
+        if 'password_hash' in user:
+            key = str(hash_cost(user['password_hash']))
+        else:
+            key = "plaintext" if 'password' in user else "none"
+        summary[key] = summary.get(key, 0) + 1
+    return summary
+
+def migrate_plaintext(workers: Optional[int] = None) -> int:
+    """Hash every plaintext password and save them all at once; return how many were stored."""
+    pending = [(u['id'], u['password']) for u in load_collection("users.json")
+               if 'password' in u and 'password_hash' not in u]
+    hashes = hash_many([p for _, p in pending], workers=workers)
+
+    def store_hashes():
+        stored = 0
+        for (user_id, password), password_hash in zip(pending, hashes):
+            user = find_user_by_id(user_id)
+            # Skip users whose password was changed or migrated meanwhile.
+            if user is None or user.get('password') != password or 'password_hash' in user:
+                continue
+            user['password_hash'] = password_hash
+            user.pop('password', None)
+            update_record("users.json", user)
+            stored += 1
+        save_collection("users.json")
+        return stored
+
+    return transaction(["users.json"], store_hashes) if pending else 0
+
+def provision(rows: List[Dict], workers: Optional[int] = None) -> List[Tuple[str, str]]:
+    """Create accounts from dicts with id, type, name and password; return (id, result) per row."""
+    hashes = hash_many([r.get('password', '') for r in rows], workers=workers)
+
+    def create_all():
+        results = []
+        for row, password_hash in zip(rows, hashes):
+            try:
+                if not row.get('password'):
+                    raise TransactionAborted("A password is required.")
+                operations.create_user(row.get('id', ''), row.get('type', ''), row.get('name', ''),
+                                       password_hash=password_hash)
+                results.append((row.get('id', ''), "created"))
+            except TransactionAborted as e:
+                results.append((row.get('id', ''), str(e)))
+        return results
+
+    return transaction(operations.LOCKS["create_user"], create_all)
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="credentials.py", description="Bulk password hashing.")
+    parser.add_argument("command", choices=["status", "migrate", "provision"])
+    parser.add_argument("file", nargs="?", type=Path, help="CSV of id,type,name,password (provision)")
+    parser.add_argument("--workers", type=int, default=None, help="hashing processes (default: all cores)")
+    args = parser.parse_args(argv)
+    if args.command == "status":
+        for cost, count in sorted(cost_summary().items()):
+            print(f"cost {cost}: {count} users")
+        print(f"Target cost: {BCRYPT_ROUNDS}")
+    elif args.command == "migrate":
+        print(f"Hashed {migrate_plaintext(args.workers)} plaintext passwords.")
+    else:
+        if args.file is None:
+            parser.error("provision needs a CSV file")
+        with open(args.file, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = [{k.strip(): (v or "").strip() for k, v in r.items() if k} for r in csv.DictReader(f)]
+        results = provision(rows, args.workers)
+        for user_id, result in results:
+            print(f"{user_id}: {result}")
+        failed = sum(1 for _, result in results if result != "created")
+        print(f"{len(results) - failed} accounts created, {failed} failed.")
+        return 1 if failed else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
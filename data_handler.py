@@ -1,22 +1,222 @@
 import json
+import marshal
+import os
+import struct
+import sys
+import zlib
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional
+import metrics
 
-DATA_DIR = Path(__file__).parent / "data"
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, sessions must not overlap
+    fcntl = None
 
+DATA_DIR = Path(os.environ.get("THESIS_DATA_DIR", Path(__file__).parent / "data"))
+
+# "json" rewrites a whole collection file on every save; "journal" appends changed
+# records to a write-ahead log next to it (see journal.py); "jsonl" stores each collection
+# as JSON Lines, one record per line in "<name>.jsonl", which can be streamed (see jsonl_store.py).
+STORAGE_MODE = os.environ.get("THESIS_STORAGE_MODE", "json")
+JSONL_SUFFIX = ".jsonl"
+
+# load_json keeps a marshal copy of each parsed file in CACHE_DIR and uses it instead of
+# parsing while the file's (size, mtime, inode) is unchanged; save_json writes it through.
+# marshal is several times faster to load than JSON but its format depends on the Python
+# version, which is part of the header, and the payload carries a checksum. A copy that
+# does not match is ignored and replaced. THESIS_SNAPSHOT_CACHE=0 turns this off.
+SNAPSHOT_CACHE = os.environ.get("THESIS_SNAPSHOT_CACHE", "1") != "0"
+CACHE_DIR = DATA_DIR / ".cache"
+# magic, Python major and minor version, JSON file size, mtime_ns and inode, payload length, adler32.
+_CACHE_HEADER = struct.Struct("<4sHHqqqqI")
+_CACHE_MAGIC = b"TSC1"
+
+# Callbacks run after every save_json(fn, data), e.g. to invalidate cached copies.
+_save_hooks: List[Callable[[str, Any], None]] = []
+
+def register_save_hook(hook: Callable[[str, Any], None]):
+    """Register a callback invoked as hook(fn, data) after each save_json."""
+    _save_hooks.append(hook)
+
+# Callbacks run as hook(path, name, records, offsets) after a collection is written to
+# path (a file that is, or will replace, name in the same directory) as JSON Lines;
+# offsets[i] is the byte offset of records[i]. See jsonl_store.py.
+_jsonl_hooks: List[Callable[[Path, str, List[Any], List[int]], None]] = []
+
+def register_jsonl_hook(hook: Callable[[Path, str, List[Any], List[int]], None]):
+    """Register a callback invoked after write_collection_file writes a JSON-Lines collection."""
+    _jsonl_hooks.append(hook)
+
+# fn -> open lock file of each collection this process currently holds a lock on.
+_locks: Dict[str, IO] = {}
+
+@contextmanager
+def file_lock(fns: Iterable[str], exclusive: bool = True):
+    """Hold advisory locks on collections ("<fn>.lock" files), taken in sorted order.
+
+    Locks already held by this process are not taken again. A shared lock requested while
+    this process holds other locks is skipped, since taking it out of order could deadlock;
+    plain readers do not need it because files are replaced atomically.
+    """
+    if not exclusive and _locks:
+        yield
+        return
+    acquired = []
+    try:
+        for fn in sorted(set(fns)):
+            if fn in _locks:
+                continue
+            f = open(DATA_DIR / (fn + ".lock"), 'a+b')
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            _locks[fn] = f
+            acquired.append(fn)
+        yield
+    finally:
+        for fn in reversed(acquired):
+            f = _locks.pop(fn)
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            f.close()
+
+def holding_locks() -> bool:
+    """Whether this process holds any collection lock (see file_lock)."""
+    return bool(_locks)
+
+def collection_file(fn: str) -> str:
+    """Name of the file holding fn: "<name>.jsonl" for "<name>.json" in jsonl mode, else fn."""
+    if STORAGE_MODE == "jsonl" and fn.endswith(".json"):
+        return fn[:-5] + JSONL_SUFFIX
+    return fn
+
+def data_path(fn: str) -> Path:
+    """Path of the file holding fn in the configured storage mode."""
+    return DATA_DIR / collection_file(fn)
+
+def iter_jsonl(f: IO[bytes]) -> Iterator[Any]:
+    """Yield the value on each non-blank line of a binary JSON-Lines file, one at a time."""
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"line {number}: {e}") from None
+
+@metrics.timed("load_json")
 def load_json(fn: str, default: Any):
     """Load JSON file or return default if missing or corrupted."""
+    name = collection_file(fn)
     try:
-        with open(DATA_DIR / fn, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(DATA_DIR / name, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if SNAPSHOT_CACHE:
+                data = _read_cache(name, st)
+                if data is not None:
+                    return data
+            if metrics.ENABLED:
+                metrics.count("bytes_read", st.st_size)
+                metrics.count("json_parsed")
+            data = list(iter_jsonl(f)) if name.endswith(JSONL_SUFFIX) else json.load(f)
+        if SNAPSHOT_CACHE:
+            _write_cache(name, st, data)
+        return data
     except FileNotFoundError:
-        print(f"Warning: {fn} not found. Using default data.")
+        print(f"Warning: {name} not found. Using default data.")
         return default
     except Exception as e:
-        print(f"Warning: Failed to load {fn}. Reason: {e}. Using default data.")
+        print(f"Warning: Failed to load {name}. Reason: {e}. Using default data.")
         return default
 
+def _cache_path(fn: str) -> Path:
+    return CACHE_DIR / (fn + ".marshal")
+
+def _read_cache(fn: str, st: os.stat_result) -> Optional[Any]:
+    """The cached copy of a JSON file with stat st, or None if there is no valid one."""
+    try:
+        with open(_cache_path(fn), 'rb') as f:
+            blob = f.read()
+    except OSError:
+        return None
+    if len(blob) < _CACHE_HEADER.size:
+        return None
+    magic, major, minor, size, mtime_ns, inode, length, checksum = _CACHE_HEADER.unpack_from(blob)
+    payload = memoryview(blob)[_CACHE_HEADER.size:]
+    if (magic, major, minor, size, mtime_ns, inode) != (_CACHE_MAGIC, *sys.version_info[:2], st.st_size, st.st_mtime_ns, st.st_ino) \
+            or length != len(payload) or zlib.adler32(payload) != checksum:
+        return None
+    try:
+        data = marshal.loads(payload)
+    except (EOFError, ValueError, TypeError):
+        return None
+    if metrics.ENABLED:
+        metrics.count("bytes_read", len(blob))
+        metrics.count("snapshot_cache_hits")
+    return data
+
+def _write_cache(fn: str, st: os.stat_result, data: Any):
+    """Store a parsed JSON file as the cached copy for stat st; failures only cost the next parse."""
+    try:
+        payload = marshal.dumps(data)
+        CACHE_DIR.mkdir(exist_ok=True)
+        tmp = CACHE_DIR / f"{fn}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(_CACHE_HEADER.pack(_CACHE_MAGIC, *sys.version_info[:2], st.st_size, st.st_mtime_ns, st.st_ino,
+                                       len(payload), zlib.adler32(payload)))
+            f.write(payload)
+        os.replace(tmp, _cache_path(fn))
+    except (OSError, ValueError):
+        pass
+
+def write_json_file(path: Path, data: Any):
+    """Write data as pretty JSON to path and fsync it."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+
+def write_jsonl_file(path: Path, records: Iterable[Any], offsets: Optional[List[int]] = None) -> int:
+    """Write records to path as JSON Lines and fsync it; return how many were written.
+
+    If offsets is given, the byte offset of each record's line is appended to it.
+    """
+    n = 0
+    position = 0
+    with open(path, 'wb') as f:
+        for record in records:
+            line = json.dumps(record, ensure_ascii=False).encode('utf-8') + b"\n"
+            if offsets is not None:
+                offsets.append(position)
+                position += len(line)
+            f.write(line)
+            n += 1
+        f.flush()
+        os.fsync(f.fileno())
+    return n
+
+def write_collection_file(path: Path, name: str, data: Any):
+    """Write data to path (a temporary file that will replace name) in name's format."""
+    if name.endswith(JSONL_SUFFIX):
+        offsets: Optional[List[int]] = [] if _jsonl_hooks else None
+        write_jsonl_file(path, data, offsets)
+        for hook in _jsonl_hooks:
+            hook(path, name, data, offsets)
+    else:
+        write_json_file(path, data)
+
+@metrics.timed("save_json")
 def save_json(fn: str, data: Any):
-    """Save data as pretty JSON to file."""
-    with open(DATA_DIR / fn, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+    """Save data as pretty JSON (JSON Lines in jsonl mode) to file, replacing it atomically."""
+    name = collection_file(fn)
+    tmp = DATA_DIR / (name + ".tmp")
+    write_collection_file(tmp, name, data)
+    st = os.stat(tmp)
+    if metrics.ENABLED:
+        metrics.count("bytes_written", st.st_size)
+    os.replace(tmp, DATA_DIR / name)
+    if SNAPSHOT_CACHE:
+        _write_cache(name, st, data)
+    for hook in _save_hooks:
+        hook(fn, data)
@@ -0,0 +1,219 @@
+import argparse
+import random
+import sys
+from collections import Counter
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+import bcrypt
+import scheduling
+from data_handler import collection_file, write_collection_file
+from user_auth import BCRYPT_ROUNDS
+
+# Seeded synthetic data at any scale, for benchmarks and load tests:
+#
+#   python datagen.py OUT_DIR [--students 10000] [--seed 1]
+#
+# writes users, courses, requests (with their history), theses and defenses to OUT_DIR in
+# the same format the application saves. The same arguments always give the same files.
+#
+# Per student: some never applied, the rest have one or more requests whose history
+# ends Rejected, Pending or Accepted. Each accepted request has a thesis that is Ongoing,
+# ready for defense, or Scheduled with a defense and possibly scores. Counters stay
+# consistent: supervise_count is the number of theses, review_count the number of defenses
+# reviewed, and full courses (capacity 0) only occur among those that accepted someone. Defenses never
+# double-book a person or a room.
+#
+# Passwords are those of the sample data (students "pass123", supervisors "drpass",
+# reviewers "revpass"), hashed once per role at the current cost factor.
+
+SHARES = {
+    "no_request": 0.05,   # students who never applied
+    "accepted": 0.6,      # of students who applied, the last request was accepted
+    "pending": 0.25,      # ... is still pending (the rest were rejected)
+    "resubmitted": 0.2,   # requests rejected once and submitted again before the final decision
+    "ready": 0.3,         # of theses, waiting for a defense to be scheduled
+    "scheduled": 0.4,     # ... with a scheduled defense (the rest are ongoing)
+    "scored": 0.5,        # of scheduled defenses, with both scores recorded
+}
+PASSWORDS = {"student": "pass123", "supervisor": "drpass", "reviewer": "revpass"}
+FIRST_NAMES = ["Ali", "Sara", "Reza", "Maryam", "Hossein", "Zahra", "Mohammad", "Fatemeh", "Amir", "Narges",
+               "Mehdi", "Leila", "Hamid", "Shirin", "Saeed", "Nazanin", "Omid", "Parisa", "Kaveh", "Elham"]
+LAST_NAMES = ["Rezaei", "Mohammadi", "Ahmadi", "Hosseini", "Karimi", "Moradi", "Jafari", "Rahimi", "Kazemi",
+              "Sadeghi", "Ebrahimi", "Ghasemi", "Nazari", "Mousavi", "Heidari", "Sharifi", "Akbari", "Alavi"]
+TOPICS = ["Machine Learning", "Computer Vision", "Natural Language Processing", "Distributed Systems",
+          "Computer Networks", "Information Security", "Databases", "Software Engineering", "Robotics",
+          "Bioinformatics", "Signal Processing", "Operating Systems", "Cloud Computing", "Data Mining",
+          "Human-Computer Interaction", "Compilers", "Graph Algorithms", "Internet of Things"]
+WORDS = ["adaptive", "scalable", "efficient", "robust", "federated", "neural", "graph", "sparse", "parallel",
+         "secure", "approximate", "incremental", "probabilistic", "energy-aware", "real-time", "distributed",
+         "learning", "detection", "optimization", "inference", "scheduling", "clustering", "retrieval",
+         "compression", "verification", "segmentation", "recommendation", "routing", "caching", "indexing"]
+SEMESTERS = ["First", "Second"]
+NOTES = {"Accepted": "Approved by supervisor", "Rejected": "Rejected by supervisor"}
+BCRYPT_ALPHABET = "./ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+
+def _hash(password: str, rng: random.Random) -> str:
+    """bcrypt hash with a salt drawn from rng, so the output is reproducible."""
+    salt = "".join(rng.choice(BCRYPT_ALPHABET) for _ in range(21)) + "."
+    return bcrypt.hashpw(password.encode('utf-8'), f"$2b${BCRYPT_ROUNDS:02d}${salt}".encode()).decode('utf-8')
+
+def _name(rng: random.Random, title: str = "") -> str:
+    return title + rng.choice(LAST_NAMES) if title else f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+def _iso(t: datetime) -> str:
+    return t.isoformat(timespec='seconds')
+
+def generate(students: int = 10000, supervisors: Optional[int] = None, reviewers: Optional[int] = None,
+             seed: int = 1) -> Dict[str, List[Dict]]:
+    """All collections of a synthetic department, keyed by file name."""
+    rng = random.Random(seed)
+    supervisors = supervisors or max(2, students // 40)
+    reviewers = reviewers or max(2, students // 100)
+    hashes = {role: _hash(password, rng) for role, password in PASSWORDS.items()}
+
+    users = [{"id": f"S{i}", "type": "student", "name": _name(rng), "password_hash": hashes["student"]}
+             for i in range(1, students + 1)]
+    staff = [{"id": f"P{i}", "type": "supervisor", "name": _name(rng, "Dr. "), "password_hash": hashes["supervisor"],
+              "supervise_count": 0, "review_count": 0} for i in range(1, supervisors + 1)]
+    staff += [{"id": f"E{i}", "type": "reviewer", "name": _name(rng, "Dr. "), "password_hash": hashes["reviewer"],
+               "supervise_count": 0, "review_count": 0} for i in range(1, reviewers + 1)]
+    users += staff
+    by_id = {u['id']: u for u in staff}
+
+    courses = []
+    for i in range(2 * supervisors):
+        year = 1400 + i % 5
+        courses.append({"course_id": f"TH{year}-{i + 1:04d}", "title": f"Thesis - {rng.choice(TOPICS)}",
+                        "supervisor_id": f"P{i % supervisors + 1}", "year": year, "semester": SEMESTERS[i // 5 % 2],
+                        "capacity": 0, "resources": [f"Ref {chr(65 + rng.randrange(26))}"], "sessions": 10, "units": 6})
+    # Popular courses get more requests.
+    cum_weights, total = [], 0.0
+    for i in range(len(courses)):
+        total += 1 / (i % 50 + 1) ** 0.5
+        cum_weights.append(total)
+
+    base = datetime(2025, 9, 1)
+    requests: List[Dict] = []
+    theses: List[Dict] = []
+    accepted = Counter()
+    for student in users[:students]:
+        if rng.random() < SHARES["no_request"]:
+            continue
+        t = base + timedelta(minutes=rng.randrange(60 * 24 * 90))
+        fate = rng.random()
+        outcome = "Accepted" if fate < SHARES["accepted"] else \
+            "Pending" if fate < SHARES["accepted"] + SHARES["pending"] else "Rejected"
+        # Earlier attempts in other courses that were rejected and not resubmitted.
+        for _ in range(rng.choice([0, 0, 0, 1, 2])):
+            course = rng.choices(courses, cum_weights=cum_weights)[0]
+            decided = t + timedelta(hours=rng.randint(2, 24 * 14))
+            requests.append({"request_id": f"R{len(requests) + 1}", "student_id": student['id'],
+                             "course_id": course['course_id'], "proposal": "", "status": "Rejected",
+                             "date_submitted": _iso(t),
+                             "history": [{"status": "Pending", "date": _iso(t), "note": "Submitted by student"},
+                                         {"status": "Rejected", "date": _iso(decided), "note": "Rejected by supervisor"}]})
+            t = decided + timedelta(hours=rng.randint(1, 72))
+        course = rng.choices(courses, cum_weights=cum_weights)[0]
+        history = [{"status": "Pending", "date": _iso(t), "note": "Submitted by student"}]
+        if outcome != "Rejected" and rng.random() < SHARES["resubmitted"]:
+            t += timedelta(hours=rng.randint(2, 24 * 14))
+            history.append({"status": "Rejected", "date": _iso(t), "note": "Rejected by supervisor"})
+            t += timedelta(hours=rng.randint(1, 72))
+            history.append({"status": "Pending", "date": _iso(t), "note": "Re-submitted by student"})
+        if outcome != "Pending":
+            t += timedelta(hours=rng.randint(2, 24 * 21))
+            history.append({"status": outcome, "date": _iso(t), "note": NOTES[outcome]})
+        request = {"request_id": f"R{len(requests) + 1}", "student_id": student['id'], "course_id": course['course_id'],
+                   "proposal": rng.choice(["", f"Work on {rng.choice(WORDS)} {rng.choice(WORDS)}."]),
+                   "status": outcome, "date_submitted": history[0]['date'], "history": history}
+        requests.append(request)
+        if outcome == "Accepted":
+            accepted[course['course_id']] += 1
+            by_id[course['supervisor_id']]['supervise_count'] += 1
+            topic = course['title'].split(" - ", 1)[1]
+            words = rng.sample(WORDS, 3)
+            theses.append({"thesis_id": f"T{len(theses) + 1}", "student_id": student['id'],
+                           "course_id": course['course_id'], "supervisor_id": course['supervisor_id'],
+                           "title": f"{words[0].capitalize()} {words[1]} for {topic}",
+                           "abstract": f"We study {words[1]} and {words[2]} in {topic.lower()} with a {words[0]} approach.",
+                           "keywords": [topic.lower(), words[1], words[2]], "files": {}, "ready_for_defense": False,
+                           "status": "Ongoing", "date_submitted": _iso(t)})
+    for course in courses:
+        course['capacity'] = rng.randint(0, 4) if accepted[course['course_id']] else rng.randint(1, 6)
+
+    defenses = _defenses(theses, staff, rng)
+    return {"users.json": users, "courses.json": courses, "requests.json": requests,
+            "theses.json": theses, "defenses.json": defenses}
+
+def _defenses(theses: List[Dict], staff: List[Dict], rng: random.Random) -> List[Dict]:
+    """Mark theses ready or scheduled, booking defenses in consecutive slots without double bookings."""
+    supervisors = [u['id'] for u in staff if u['type'] == 'supervisor']
+    pool = [u['id'] for u in staff]
+    by_id = {u['id']: u for u in staff}
+    first_day = date(2026, 2, 1)
+    per_day = len(scheduling.DAY_SLOTS)
+    defenses: List[Dict] = []
+    # People in the current slot; a new slot starts when its rooms are full or people run out.
+    slot_index, used_rooms, busy = 0, 0, set()
+
+    def pick(candidates: List[str]) -> str:
+        while True:
+            person = rng.choice(candidates)
+            if person not in busy:
+                busy.add(person)
+                return person
+
+    for thesis in theses:
+        fate = rng.random()
+        if fate < SHARES["ready"]:
+            thesis['ready_for_defense'] = True
+            continue
+        if fate >= SHARES["ready"] + SHARES["scheduled"] or len(supervisors) < 2:
+            continue
+        if used_rooms == len(scheduling.ROOMS) or thesis['supervisor_id'] in busy \
+                or len(busy) + 3 > len(supervisors):
+            slot_index, used_rooms, busy = slot_index + 1, 0, set()
+        busy.add(thesis['supervisor_id'])
+        internal = pick(supervisors)
+        external = pick(pool)
+        start, end = scheduling.slot(f"{first_day + timedelta(days=slot_index // per_day)} "
+                                     f"{scheduling.DAY_SLOTS[slot_index % per_day]}")
+        room = scheduling.ROOMS[used_rooms]
+        used_rooms += 1
+        defense = {"defense_id": f"D{len(defenses) + 1}", "thesis_id": thesis['thesis_id'],
+                   "supervisor_id": thesis['supervisor_id'], "date": start[:10], "start": start, "end": end,
+                   "room": room, "internal_reviewer": internal, "external_reviewer": external}
+        defenses.append(defense)
+        scores = {r: round(rng.uniform(12, 20), 2) for r in (internal, external)} if rng.random() < SHARES["scored"] else {}
+        thesis['ready_for_defense'] = True
+        thesis['status'] = "Scheduled"
+        thesis['defense'] = {"defense_id": defense['defense_id'], "date": defense['date'], "time": start[11:],
+                             "room": room, "internal_reviewer": internal, "external_reviewer": external,
+                             "attendance": [], "scores": scores}
+        for reviewer_id in (internal, external):
+            by_id[reviewer_id]['review_count'] += 1
+    return defenses
+
+def write(out_dir: Path, data: Dict[str, List[Dict]]):
+    """Save generated collections as the application's files (JSON Lines in jsonl mode)."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for fn, records in data.items():
+        name = collection_file(fn)
+        write_collection_file(out_dir / name, name, records)
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Write a seeded synthetic data set.")
+    parser.add_argument("out_dir", type=Path, help="directory to write the JSON files to (e.g. a THESIS_DATA_DIR)")
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--supervisors", type=int, help="default: one per 40 students")
+    parser.add_argument("--reviewers", type=int, help="default: one per 100 students")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    data = generate(args.students, args.supervisors, args.reviewers, args.seed)
+    write(args.out_dir, data)
+    print(", ".join(f"{len(records)} {fn[:-5]}" for fn, records in data.items()) + f" written to {args.out_dir}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,83 @@
+import json
+import os
+from typing import Dict, List, Optional, Set
+import repository
+from data_handler import DATA_DIR, file_lock, write_json_file
+
+# Durable ID sequences. SEQUENCE_FILE holds, per collection, the highest number ever handed
+# out. Sessions lease blocks of numbers from it under an exclusive lock and then allocate
+# from their block in memory; the block size doubles (up to MAX_BLOCK) while a session
+# keeps allocating, so interactive sessions get dense IDs and bulk work rarely touches disk.
+# Numbers left in a block when a session ends are skipped, never reused.
+
+SEQUENCE_FILE = "sequences.json"
+ID_PREFIXES = {"requests.json": "R", "theses.json": "T", "defenses.json": "D"}
+MAX_BLOCK = 64
+
+# fn -> [next number to hand out, last number of the leased block, size of that block]
+_blocks: Dict[str, List[int]] = {}
+# Collections whose sequence this process has checked against the stored IDs.
+_reconciled: Set[str] = set()
+
+def parse_id(record_id: str, prefix: str) -> Optional[int]:
+    """Numeric part of an ID like "R12", or None if it does not have that form."""
+    if isinstance(record_id, str) and record_id.startswith(prefix) and record_id[len(prefix):].isdigit():
+        return int(record_id[len(prefix):])
+    return None
+
+def highest_id(fn: str) -> int:
+    """Largest ID number used in a collection, including its sealed archive partitions (0 if none)."""
+    import archive  # imports this module
+    prefix = ID_PREFIXES[fn]
+    key = repository.PRIMARY_KEYS[fn]
+    numbers = (parse_id(r.get(key), prefix) for r in repository.load_collection(fn))
+    highest = max((n for n in numbers if n is not None), default=0)
+    return max(highest, archive.highest_id(fn)) if fn in archive.PARTITIONED else highest
+
+def _read() -> Dict[str, int]:
+    try:
+        with open(DATA_DIR / SEQUENCE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def _write(sequences: Dict[str, int]):
+    tmp = DATA_DIR / (SEQUENCE_FILE + ".tmp")
+    write_json_file(tmp, sequences)
+    os.replace(tmp, DATA_DIR / SEQUENCE_FILE)
+
+def _lease(fn: str, size: int) -> int:
+    """Reserve size numbers of a sequence for this session; return the first one."""
+    with file_lock([SEQUENCE_FILE]):
+        sequences = _read()
+        if fn not in _reconciled:
+            # Records may have been added outside the application (restored or generated
+            # files), so the first lease also skips past every stored ID.
+            sequences[fn] = max(sequences.get(fn, 0), highest_id(fn))
+            _reconciled.add(fn)
+        first = sequences[fn] + 1
+        sequences[fn] += size
+        _write(sequences)
+    return first
+
+def allocate_id(fn: str) -> str:
+    """Return a new, never used ID for a record of the collection fn."""
+    block = _blocks.get(fn)
+    if block is None or block[0] > block[1]:
+        size = min(block[2] * 2, MAX_BLOCK) if block else 1
+        first = _lease(fn, size)
+        block = _blocks[fn] = [first, first + size - 1, size]
+    number = block[0]
+    block[0] += 1
+    return f"{ID_PREFIXES[fn]}{number}"
+
+def reconcile() -> Dict[str, int]:
+    """Raise every sequence to at least the highest ID already in its collection."""
+    with file_lock([SEQUENCE_FILE]):
+        sequences = _read()
+        updated = dict(sequences)
+        for fn in ID_PREFIXES:
+            updated[fn] = max(updated.get(fn, 0), highest_id(fn))
+        if updated != sequences:
+            _write(updated)
+    return updated
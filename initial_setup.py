@@ -1,10 +1,33 @@
-from data_handler import load_json, save_json
+from data_handler import JSONL_SUFFIX, collection_file, data_path, file_lock, save_json
+from repository import PRIMARY_KEYS
+from transactions import recover
 from user_auth import hash_password
 
+def _missing(fn: str) -> bool:
+    """True if a collection file does not exist or (unless JSON Lines) is empty; warns if it does not start like a collection.
+
+    Only the first bytes are read, so startup does not depend on the size of the data.
+    """
+    try:
+        with open(data_path(fn), 'rb') as f:
+            head = f.read(64).lstrip()
+    except FileNotFoundError:
+        return True
+    name = collection_file(fn)
+    jsonl = name.endswith(JSONL_SUFFIX)
+    if head and not head.startswith(b"{" if jsonl else b"["):
+        print(f"Warning: {name} does not contain {'JSON Lines records' if jsonl else 'a JSON list'}; it was left unchanged.")
+    return not head and not jsonl
+
 def initialize_defaults():
-    """Create sample JSON files if missing."""
-    users = load_json("users.json", None)
-    if users is None:
+    """Finish any interrupted commit and create sample JSON files if missing.
+
+    ID sequences are checked against the collections when IDs are first allocated
+    (id_allocator._lease), not here.
+    """
+    with file_lock(PRIMARY_KEYS):
+        recover()
+    if _missing("users.json"):
         users = [
             {"id": "S1001", "type": "student", "name": "Ali Rezaei", "password_hash": hash_password("pass123")},
             {"id": "S1002", "type": "student", "name": "Sara Mohammadi", "password_hash": hash_password("pass123")},
@@ -13,13 +36,12 @@ def initialize_defaults():
             {"id": "T3001", "type": "reviewer", "name": "Dr. Karimi", "password_hash": hash_password("revpass"), "supervise_count": 0, "review_count": 0},
         ]
         save_json("users.json", users)
-    courses = load_json("courses.json", None)
-    if courses is None:
+    if _missing("courses.json"):
         courses = [
             {"course_id": "TH1404-01", "title": "Thesis - Machine Learning", "supervisor_id": "T2001", "year": 1404, "semester": "First", "capacity": 2, "resources": ["Ref A"], "sessions": 10, "units": 6},
             {"course_id": "TH1404-02", "title": "Thesis - Computer Vision", "supervisor_id": "T2002", "year": 1404, "semester": "First", "capacity": 1, "resources": ["Ref B"], "sessions": 10, "units": 6},
         ]
         save_json("courses.json", courses)
-    for fn, default in [("requests.json", []), ("theses.json", []), ("defenses.json", [])]:
-        if load_json(fn, None) is None:
-            save_json(fn, default)
\ No newline at end of file
+    for fn in ["requests.json", "theses.json", "defenses.json"]:
+        if _missing(fn):
+            save_json(fn, [])
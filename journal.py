@@ -0,0 +1,171 @@
+import json
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+import metrics
+from data_handler import DATA_DIR, load_json
+
+# Journal mode keeps each collection as a JSON snapshot (the regular data file) plus a
+# write-ahead log "<fn>.wal" of JSON-Lines "put" records. Every line is prefixed with the
+# CRC32 of its payload so a torn or corrupted tail can be detected and cut off on load.
+# Compaction (a new snapshot, then an empty log) is a commit intent: see transactions.compact.
+
+WAL_SUFFIX = ".wal"
+# Compact the log into the snapshot once it holds this many records.
+COMPACT_EVERY = 1000
+
+# fn -> {pk: record} of records changed since the last flush.
+_dirty: Dict[str, Dict[str, Dict]] = {}
+# fn -> number of records currently in the log.
+_wal_counts: Dict[str, int] = {}
+
+def wal_path(fn: str):
+    """Path of the write-ahead log of a collection."""
+    return DATA_DIR / (fn + WAL_SUFFIX)
+
+def _encode(key: str, record: Dict) -> bytes:
+    """Encode one log line: '<crc32 hex> <json payload>\\n'."""
+    payload = json.dumps({"op": "put", "key": key, "record": record}, ensure_ascii=False).encode('utf-8')
+    return b"%08x " % zlib.crc32(payload) + payload + b"\n"
+
+def _decode(line: bytes) -> Optional[Dict]:
+    """Decode one complete log line, or return None if it is torn or corrupted."""
+    crc, _, payload = line.rstrip(b"\n").partition(b" ")
+    try:
+        if int(crc, 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload.decode('utf-8'))
+    except ValueError:
+        return None
+
+def read_wal(fn: str) -> Tuple[List[Dict], int]:
+    """Read the valid prefix of a log; return its entries and the byte length of that prefix."""
+    try:
+        with open(wal_path(fn), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return [], 0
+    entries = []
+    good = 0
+    while good < len(data):
+        end = data.find(b"\n", good)
+        if end == -1:
+            break
+        entry = _decode(data[good:end + 1])
+        if entry is None:
+            break
+        entries.append(entry)
+        good = end + 1
+    if metrics.ENABLED:
+        metrics.count("bytes_read", len(data))
+        metrics.count("json_parsed", len(entries))
+    return entries, good
+
+def recover(fn: str) -> int:
+    """Cut a torn or corrupted tail off a log; return the number of bytes discarded."""
+    path = wal_path(fn)
+    if not path.exists():
+        return 0
+    _, good = read_wal(fn)
+    size = path.stat().st_size
+    if good < size:
+        with open(path, 'r+b') as f:
+            f.truncate(good)
+            f.flush()
+            os.fsync(f.fileno())
+        print(f"Warning: discarded {size - good} bytes of torn journal records in {fn + WAL_SUFFIX}.")
+    return size - good
+
+def _torn_tail(fn: str) -> bool:
+    """Cheap check: a log whose last byte is not a newline ends in a torn record."""
+    try:
+        with open(wal_path(fn), 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+    except FileNotFoundError:
+        return False
+
+def load(fn: str, key: str) -> List[Dict]:
+    """Load a collection by replaying the valid prefix of its log on top of its snapshot.
+
+    An incomplete tail may be a write in progress in another session, so it is skipped
+    here; a torn one is cut off by the next writer, which holds the lock.
+    """
+    records = load_json(fn, [])
+    entries, _ = read_wal(fn)
+    positions = {r[key]: i for i, r in enumerate(records) if key in r}
+    for entry in entries:
+        record = entry["record"]
+        if entry["key"] in positions:
+            records[positions[entry["key"]]] = record
+        else:
+            positions[entry["key"]] = len(records)
+            records.append(record)
+    _wal_counts[fn] = len(entries)
+    _dirty.pop(fn, None)
+    return records
+
+def mark_dirty(fn: str, key: str, record: Dict):
+    """Remember a changed record; it is serialized when the collection is next flushed."""
+    _dirty.setdefault(fn, {})[key] = record
+
+def take_dirty(fn: str) -> bytes:
+    """Encode and forget the dirty records of a collection, as log lines."""
+    dirty = _dirty.pop(fn, {})
+    return b"".join(_encode(k, r) for k, r in dirty.items())
+
+def discard_dirty(fn: str):
+    """Forget the dirty records of a collection without writing them."""
+    _dirty.pop(fn, None)
+
+def append(fn: str, lines: bytes):
+    """Append encoded log lines with a single fsync, cutting off a torn tail first."""
+    if not lines:
+        return
+    if _torn_tail(fn):
+        recover(fn)
+    with open(wal_path(fn), 'ab') as f:
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+    if metrics.ENABLED:
+        metrics.count("bytes_written", len(lines))
+    _wal_counts[fn] = _wal_counts.get(fn, 0) + lines.count(b"\n")
+
+def flush(fn: str) -> int:
+    """Append all dirty records of a collection to its log with a single fsync."""
+    count = len(_dirty.get(fn, {}))
+    append(fn, take_dirty(fn))
+    return count
+
+def needs_compaction(fn: str) -> bool:
+    """Whether the log of a collection has grown past COMPACT_EVERY records."""
+    return _wal_counts.get(fn, 0) >= COMPACT_EVERY
+
+def truncate(fn: str):
+    """Empty the log of a collection once its snapshot holds everything.
+
+    Only as part of a commit intent (transactions.compact and _apply): the old log must
+    never be replayed over the new snapshot, which may have dropped or replaced records.
+    """
+    path = wal_path(fn)
+    if path.exists():
+        with open(path, 'r+b') as f:
+            f.truncate(0)
+            f.flush()
+            os.fsync(f.fileno())
+    _wal_counts[fn] = 0
+    _dirty.pop(fn, None)
+
+if __name__ == "__main__":
+    from data_handler import file_lock
+    from repository import PRIMARY_KEYS
+    from transactions import compact, recover
+    recover()
+    for name, pk in PRIMARY_KEYS.items():
+        with file_lock([name]):
+            compact(name, load(name, pk))
+        print(f"Compacted {name}.")
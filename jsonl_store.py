@@ -0,0 +1,288 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import textwrap
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import data_handler
+import repository
+from data_handler import DATA_DIR, JSONL_SUFFIX, iter_jsonl, register_jsonl_hook, write_jsonl_file
+from sqlite_backend import iter_json_array
+
+# JSON-Lines collections. A "<name>.jsonl" file holds one record per line (compact JSON,
+# UTF-8), so records can be read one at a time: iter_records() streams a collection,
+# filters it and can stop at the first match without building the whole list.
+# THESIS_STORAGE_MODE=jsonl makes the application store its collections this way.
+#
+# An optional sidecar "<name>.jsonl.idx" maps primary keys to byte offsets for random
+# access by ID. It is a header followed by (8-byte key hash, offset) pairs sorted by hash;
+# find() memory-maps it and the data file, binary-searches the hash and parses the single
+# line at that offset. The header records the data file's size, mtime and inode, and an
+# index that no longer matches is rebuilt on the next lookup. In jsonl mode,
+# repository.find_by_id looks records up this way while their collection is not loaded.
+# An existing index is rewritten from the records whenever this process writes the
+# collection, so only files changed by other processes are re-scanned; find() keeps
+# each index open until its data file changes.
+
+INDEX_SUFFIX = ".idx"
+# magic, data file size, mtime_ns and inode, number of entries.
+_INDEX_HEADER = struct.Struct("<4sqqqq")
+_INDEX_MAGIC = b"TJX1"
+_INDEX_ENTRY = struct.Struct("<Qq")
+
+def _key_hash(record_id: str) -> int:
+    return int.from_bytes(hashlib.blake2b(record_id.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def iter_file(path: Path, where: Optional[Callable[[Dict], bool]] = None) -> Iterator[Dict]:
+    """Stream the records of a JSON-Lines or JSON array file, optionally only those where(record) is true."""
+    if path.name.endswith(JSONL_SUFFIX):
+        with open(path, 'rb') as f:
+            for record in iter_jsonl(f):
+                if where is None or where(record):
+                    yield record
+    else:
+        for record in iter_json_array(path):
+            if where is None or where(record):
+                yield record
+
+def iter_records(fn: str, where: Optional[Callable[[Dict], bool]] = None) -> Iterator[Dict]:
+    """Stream the records of a collection, optionally only those where(record) is true.
+
+    Uses the repository's copy if it is loaded and current; otherwise reads the file in
+    json and jsonl mode. Journal and SQLite mode keep recent changes elsewhere, so there
+    the collection is loaded through the repository.
+    """
+    records = repository.cached(fn)
+    if records is None and data_handler.STORAGE_MODE not in ("json", "jsonl"):
+        records = repository.load_collection(fn)
+    if records is not None:
+        return (r for r in records if where is None or where(r))
+    path = data_handler.data_path(fn)
+    if not path.exists():
+        return iter(())
+    return iter_file(path, where)
+
+def index_path(path: Path) -> Path:
+    """Path of the offset index of a JSON-Lines file."""
+    return path.with_name(path.name + INDEX_SUFFIX)
+
+def build_index(path: Path, key: str) -> int:
+    """Write the offset index of a JSON-Lines file by its key field; return the number of entries."""
+    entries = []
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        offset = 0
+        for line in f:
+            if line.strip():
+                record_id = json.loads(line).get(key)
+                if isinstance(record_id, str):
+                    entries.append((_key_hash(record_id), offset))
+            offset += len(line)
+    return _write_index(path, st, entries)
+
+def _write_index(path: Path, st: os.stat_result, entries: List[Tuple[int, int]]) -> int:
+    """Write the offset index of path, whose data file has stat st, from (key hash, offset) pairs."""
+    entries.sort()
+    tmp = index_path(path).with_name(f"{index_path(path).name}.{os.getpid()}.tmp")
+    with open(tmp, 'wb') as f:
+        f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, st.st_size, st.st_mtime_ns, st.st_ino, len(entries)))
+        f.write(b"".join(_INDEX_ENTRY.pack(h, o) for h, o in entries))
+    os.replace(tmp, index_path(path))
+    return len(entries)
+
+def _index_written(path: Path, name: str, records: List[Dict], offsets: List[int]):
+    """jsonl hook: rewrite the existing offset index of a collection this process just wrote."""
+    target = path.parent / name
+    fn = name[:-len(JSONL_SUFFIX)] + ".json"
+    if fn not in repository.PRIMARY_KEYS or not index_path(target).exists():
+        return
+    key = repository.PRIMARY_KEYS[fn]
+    entries = [(_key_hash(r[key]), offset) for r, offset in zip(records, offsets) if isinstance(r.get(key), str)]
+    # The header takes the stat of the new file, which keeps it when renamed over name.
+    _write_index(target, os.stat(path), entries)
+
+register_jsonl_hook(_index_written)
+
+class OffsetIndex:
+    """Memory-mapped offset index of a JSON-Lines file, for lookups by primary key."""
+
+    def __init__(self, path: Path, key: str):
+        self.path = path
+        self.key = key
+        self._files = []
+        self._index: Optional[mmap.mmap] = None
+        self._data: Optional[mmap.mmap] = None
+        self._stat: Optional[Tuple[int, int, int]] = None
+        self.count = 0
+
+    def open(self) -> bool:
+        """Map the index and data file; False if the index is missing or does not match the data."""
+        self.close()
+        try:
+            data_file = open(self.path, 'rb')
+            self._files.append(data_file)
+            index_file = open(index_path(self.path), 'rb')
+            self._files.append(index_file)
+        except FileNotFoundError:
+            self.close()
+            return False
+        st = os.fstat(data_file.fileno())
+        header = index_file.read(_INDEX_HEADER.size)
+        if len(header) < _INDEX_HEADER.size:
+            self.close()
+            return False
+        magic, size, mtime_ns, inode, count = _INDEX_HEADER.unpack(header)
+        expected = _INDEX_HEADER.size + count * _INDEX_ENTRY.size
+        if (magic, size, mtime_ns, inode) != (_INDEX_MAGIC, st.st_size, st.st_mtime_ns, st.st_ino) \
+                or os.fstat(index_file.fileno()).st_size != expected:
+            self.close()
+            return False
+        self.count = count
+        self._stat = (size, mtime_ns, inode)
+        if count:
+            self._index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return True
+
+    def close(self):
+        for m in (self._index, self._data):
+            if m is not None:
+                m.close()
+        self._index = self._data = None
+        for f in self._files:
+            f.close()
+        self._files = []
+        self._stat = None
+        self.count = 0
+
+    def current(self) -> bool:
+        """Whether the index is open and its data file has not changed since."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return self._stat == (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _hash_at(self, i: int) -> int:
+        return _INDEX_ENTRY.unpack_from(self._index, _INDEX_HEADER.size + i * _INDEX_ENTRY.size)[0]
+
+    def get(self, record_id: str) -> Optional[Dict]:
+        """The record with this key, reading only its line; None if there is none."""
+        if not self.count:
+            return None
+        h = _key_hash(record_id)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._hash_at(mid) < h:
+                lo = mid + 1
+            else:
+                hi = mid
+        # Different keys can share a hash, so check every entry with it.
+        while lo < self.count and self._hash_at(lo) == h:
+            offset = _INDEX_ENTRY.unpack_from(self._index, _INDEX_HEADER.size + lo * _INDEX_ENTRY.size)[1]
+            end = self._data.find(b"\n", offset)
+            record = json.loads(self._data[offset:end if end != -1 else len(self._data)])
+            if record.get(self.key) == record_id:
+                return record
+            lo += 1
+        return None
+
+def open_index(path: Path, key: str) -> OffsetIndex:
+    """Open the offset index of a JSON-Lines file, building or rebuilding it if needed."""
+    index = OffsetIndex(path, key)
+    if not index.open():
+        build_index(path, key)
+        if not index.open():
+            raise RuntimeError(f"{path.name} changed while it was being indexed.")
+    return index
+
+# Data file path -> its open offset index, reused by find() while the file is unchanged.
+_open_indexes: Dict[Path, OffsetIndex] = {}
+
+def find(fn: str, record_id: str) -> Optional[Dict]:
+    """Look up one record of a collection's JSON-Lines file by primary key through its offset index.
+
+    Returns None, with a warning, if the file does not exist.
+    """
+    path = DATA_DIR / (fn[:-5] + JSONL_SUFFIX)
+    index = _open_indexes.get(path)
+    if index is None or not index.current():
+        if index is not None:
+            index.close()
+        _open_indexes.pop(path, None)
+        try:
+            index = _open_indexes[path] = open_index(path, repository.PRIMARY_KEYS[fn])
+        except FileNotFoundError:
+            print(f"Warning: {path.name} not found.")
+            return None
+    return index.get(record_id)
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Conversion
+# ----------------------------------------------------------------------------------------------------------------------
+
+def to_jsonl(src: Path, dst: Path) -> int:
+    """Stream a JSON array file into a JSON-Lines file; return the number of records."""
+    tmp = dst.with_name(dst.name + ".tmp")
+    n = write_jsonl_file(tmp, iter_json_array(src))
+    os.replace(tmp, dst)
+    return n
+
+def to_json(src: Path, dst: Path) -> int:
+    """Stream a JSON-Lines file into a JSON array file formatted exactly like save_json."""
+    n = 0
+    tmp = dst.with_name(dst.name + ".tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for record in iter_file(src):
+            f.write("[\n" if n == 0 else ",\n")
+            f.write(textwrap.indent(json.dumps(record, ensure_ascii=False, indent=2), "  "))
+            n += 1
+        f.write("\n]" if n else "[]")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, dst)
+    return n
+
+def convert(direction: str, directory: Path = DATA_DIR) -> Dict[str, int]:
+    """Convert every collection in directory "to-jsonl" or "to-json"; return record counts.
+
+    The source files are left in place; switch THESIS_STORAGE_MODE to use the new ones.
+    """
+    counts = {}
+    for fn in repository.PRIMARY_KEYS:
+        json_path, jsonl_path = directory / fn, directory / (fn[:-5] + JSONL_SUFFIX)
+        src, dst = (json_path, jsonl_path) if direction == "to-jsonl" else (jsonl_path, json_path)
+        if src.exists():
+            counts[dst.name] = (to_jsonl if direction == "to-jsonl" else to_json)(src, dst)
+    return counts
+
+if __name__ == "__main__":
+    commands = ("to-jsonl", "to-json", "index", "get")
+    if len(sys.argv) < 2 or sys.argv[1] not in commands or (sys.argv[1] == "get" and len(sys.argv) != 4):
+        print("Usage: python jsonl_store.py to-jsonl|to-json|index [directory]\n"
+              "       python jsonl_store.py get <collection, e.g. theses.json> <id>")
+        sys.exit(1)
+    if sys.argv[1] == "get":
+        record = find(sys.argv[2], sys.argv[3])
+        print(json.dumps(record, ensure_ascii=False, indent=2) if record else "Not found.")
+        sys.exit(0 if record else 1)
+    directory = Path(sys.argv[2]) if len(sys.argv) > 2 else DATA_DIR
+    if sys.argv[1] == "index":
+        for name, key in repository.PRIMARY_KEYS.items():
+            path = directory / (name[:-5] + JSONL_SUFFIX)
+            if path.exists():
+                print(f"{path.name}: {build_index(path, key)} entries")
+    else:
+        for name, count in convert(sys.argv[1], directory).items():
+            print(f"{name}: {count} records")
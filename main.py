@@ -1,10 +1,7 @@
 import getpass
-from pathlib import Path
-from data_handler import load_json
+import sys
+import sessions
 from user_auth import authenticate_user
-from menus import student_menu
-from menus import supervisor_menu
-from menus import reviewer_menu
 from initial_setup import initialize_defaults
 
 def main_menu():
@@ -12,16 +9,22 @@ def main_menu():
     initialize_defaults()
     print("=== Thesis Management System (CLI) ===")
     while True:
-        print("\n1) Login\n0) Exit")
+        print("\n1) Login\n2) Logout (forget saved session)\n0) Exit" if sessions.enabled() else "\n1) Login\n0) Exit")
         ch = input("Choice: ").strip()
         if ch == "1":
             user_id = input("User ID: ").strip()
-            password = getpass.getpass("Password: ")
-            user = authenticate_user(user_id, password)
+            user = sessions.resume(user_id) if sessions.enabled() else None
             if not user:
-                print("Login failed.")
-                continue
+                password = getpass.getpass("Password: ")
+                user = authenticate_user(user_id, password)
+                if not user:
+                    print("Login failed.")
+                    continue
+                if sessions.enabled():
+                    sessions.save_client_token(sessions.issue(user))
             print(f"Welcome {user['name']} ({user['id']}).")
+            # Imported after login: the menus pull in scheduling, search and reports.
+            from menus import reviewer_menu, student_menu, supervisor_menu
             user_type = user.get("type")
             if user_type == "student":
                 student_menu(user)
@@ -31,6 +34,12 @@ def main_menu():
                 reviewer_menu(user)
             else:
                 print("Unknown user type.")
+        elif ch == "2" and sessions.enabled():
+            token = sessions.load_client_token()
+            if token:
+                sessions.revoke(token)
+                sessions.clear_client_token()
+            print("Logged out.")
         elif ch == "0":
             print("Goodbye.")
             break
@@ -38,4 +47,13 @@ def main_menu():
             print("Invalid choice.")
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["batch"]:
+        import batch
+        sys.exit(batch.main(sys.argv[2:]))
+    if sys.argv[1:2] == ["report"]:
+        import reports
+        sys.exit(reports.main(sys.argv[2:]))
+    if sys.argv[1:2] == ["serve"]:
+        import api_server
+        sys.exit(api_server.main(sys.argv[2:]))
     main_menu()
\ No newline at end of file
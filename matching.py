@@ -0,0 +1,280 @@
+import argparse
+import csv
+import heapq
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import operations
+from repository import find_by_id, load_collection, save_collection
+
+# Intake matching. All pending requests are assigned at once: each student gets at most
+# one of their ranked courses, no course takes more students than its remaining capacity,
+# and no supervisor goes over their cap of supervised theses. Among the assignments that
+# place the most students, the one with the lowest total preference rank is chosen.
+#
+# This is a min-cost flow on source -> student -> course -> supervisor -> sink, solved
+# with the primal-dual method: a Dijkstra pass computes node potentials, then a Dinic
+# blocking flow pushes every shortest augmenting path of that cost at once. Ranks are small
+# integers, so there are only a handful of phases even for tens of thousands of students.
+
+# Most theses a supervisor may have, unless their user record sets "max_supervise".
+SUPERVISOR_CAP = 10
+LOCKS = operations.LOCKS["review_request"]
+
+class MinCostFlow:
+    """Min-cost max-flow over integer capacities and non-negative integer costs."""
+
+    def __init__(self, nodes: int):
+        self.adj: List[List[int]] = [[] for _ in range(nodes)]
+        self.to: List[int] = []
+        self.cap: List[int] = []
+        self.cost: List[int] = []
+
+    def add_edge(self, u: int, v: int, cap: int, cost: int) -> int:
+        """Add an edge and its residual twin; return the edge's number."""
+        e = len(self.to)
+        self.to += [v, u]
+        self.cap += [cap, 0]
+        self.cost += [cost, -cost]
+        self.adj[u].append(e)
+        self.adj[v].append(e + 1)
+        return e
+
+    def push(self, path: List[int], amount: int = 1):
+        """Send flow along a path of edges before solving (it must keep the flow of minimum cost)."""
+        for e in path:
+            self.cap[e] -= amount
+            self.cap[e ^ 1] += amount
+
+    def flow(self, e: int) -> int:
+        """Flow on an edge added by add_edge."""
+        return self.cap[e ^ 1]
+
+    def solve(self, s: int, t: int) -> Tuple[int, int]:
+        """Push the maximum flow from s to t at minimum cost; return (flow, cost)."""
+        n = len(self.adj)
+        to, cap, cost, adj = self.to, self.cap, self.cost, self.adj
+        potential = [0] * n
+        total_flow = total_cost = 0
+        while True:
+            # Shortest distances by reduced cost (never negative thanks to the potentials).
+            dist: List[Optional[int]] = [None] * n
+            dist[s] = 0
+            heap = [(0, s)]
+            while heap:
+                d, u = heapq.heappop(heap)
+                if d != dist[u]:
+                    continue
+                for e in adj[u]:
+                    if cap[e]:
+                        v = to[e]
+                        nd = d + cost[e] + potential[u] - potential[v]
+                        if dist[v] is None or nd < dist[v]:
+                            dist[v] = nd
+                            heapq.heappush(heap, (nd, v))
+            if dist[t] is None:
+                return total_flow, total_cost
+            limit = dist[t]
+            for v in range(n):
+                potential[v] += min(dist[v], limit) if dist[v] is not None else limit
+            # Blocking flows over the edges with zero reduced cost.
+            while True:
+                level, forward = self._levels(s, t, potential)
+                if level[t] < 0:
+                    break
+                it = [0] * n
+                while True:
+                    pushed = self._augment(s, t, level, forward, it)
+                    if not pushed:
+                        break
+                    total_flow += pushed
+                    total_cost += pushed * (potential[t] - potential[s])
+
+    def _levels(self, s: int, t: int, potential: List[int]) -> Tuple[List[int], List[List[int]]]:
+        """BFS levels over the edges with spare capacity and zero reduced cost.
+
+        Also returns, per node, those of its edges that lead one level further: the only
+        ones a shortest augmenting path can use.
+        """
+        to, cap, cost = self.to, self.cap, self.cost
+        level = [-1] * len(self.adj)
+        forward: List[List[int]] = [[] for _ in self.adj]
+        level[s] = 0
+        queue = [s]
+        for u in queue:
+            next_level = level[u] + 1
+            if 0 <= level[t] < next_level:
+                break  # nodes beyond the sink's level cannot be on a shortest path
+            pu = potential[u]
+            out = forward[u]
+            for e in self.adj[u]:
+                if cap[e] and cost[e] + pu == potential[to[e]]:
+                    v = to[e]
+                    if level[v] < 0:
+                        level[v] = next_level
+                        queue.append(v)
+                    if level[v] == next_level:
+                        out.append(e)
+        return level, forward
+
+    def _augment(self, s: int, t: int, level: List[int], forward: List[List[int]], it: List[int]) -> int:
+        """Push flow along one path of the level graph (iteratively, no recursion)."""
+        to, cap = self.to, self.cap
+        path: List[int] = []
+        u = s
+        while True:
+            if u == t:
+                pushed = min(cap[e] for e in path)
+                for e in path:
+                    cap[e] -= pushed
+                    cap[e ^ 1] += pushed
+                return pushed
+            edges = forward[u]
+            i = it[u]
+            while i < len(edges) and not (cap[edges[i]] and level[to[edges[i]]] >= 0):
+                i += 1
+            it[u] = i
+            if i == len(edges):
+                if u == s:
+                    return 0
+                # Dead end: retreat and skip the edge that led here.
+                level[u] = -1
+                e = path.pop()
+                u = to[e ^ 1]
+                it[u] += 1
+                continue
+            path.append(edges[i])
+            u = to[edges[i]]
+
+def read_preferences(path: Path) -> Dict[str, List[str]]:
+    """Rankings from a CSV of rows "student_id, first choice, second choice, ..."."""
+    rankings = {}
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in csv.reader(f):
+            cells = [c.strip() for c in row if c.strip()]
+            if len(cells) > 1 and cells[0] != "student_id":
+                rankings[cells[0]] = cells[1:]
+    return rankings
+
+def match(requests: List[Dict], courses: List[Dict], users: List[Dict],
+          preferences: Optional[Dict[str, List[str]]] = None, supervisor_cap: int = SUPERVISOR_CAP) -> Dict[str, Tuple[str, int]]:
+    """Assign pending requests to courses; return request_id -> (course_id, rank from 0) for those placed.
+
+    A student's ranking is taken from preferences, else the request's own "preferences"
+    list; the requested course is always acceptable and ranked last if not listed.
+    Nothing is stored.
+    """
+    preferences = preferences or {}
+    course_by_id = {c['course_id']: c for c in courses}
+    remaining_cap = {u['id']: max(0, u.get('max_supervise', supervisor_cap) - u.get('supervise_count', 0))
+                     for u in users if u.get('type') == 'supervisor'}
+    # One node per student, holding every pending request they have.
+    students: Dict[str, List[Dict]] = {}
+    for r in requests:
+        if r.get('status') == 'Pending':
+            students.setdefault(r['student_id'], []).append(r)
+    rankings: Dict[str, List[str]] = {}
+    for student_id, reqs in students.items():
+        ranking = list(preferences.get(student_id) or reqs[0].get('preferences') or [])
+        ranking += [r['course_id'] for r in reqs]
+        seen = set()
+        rankings[student_id] = [c for c in ranking if c in course_by_id and not (c in seen or seen.add(c))]
+
+    course_ids = sorted({c for ranking in rankings.values() for c in ranking})
+    supervisor_ids = sorted({course_by_id[c]['supervisor_id'] for c in course_ids})
+    student_ids = list(rankings)
+    s, t = 0, 1
+    node = {("student", x): 2 + i for i, x in enumerate(student_ids)}
+    node.update({("course", x): 2 + len(node) + i for i, x in enumerate(course_ids)})
+    base = 2 + len(node)
+    node.update({("supervisor", x): base + i for i, x in enumerate(supervisor_ids)})
+    graph = MinCostFlow(2 + len(node))
+    seats = {c: max(0, course_by_id[c].get('capacity', 0)) for c in course_ids}
+    course_edge = {c: graph.add_edge(node[("course", c)], node[("supervisor", course_by_id[c]['supervisor_id'])], seats[c], 0)
+                   for c in course_ids}
+    supervisor_edge = {x: graph.add_edge(node[("supervisor", x)], t, remaining_cap.get(x, 0), 0) for x in supervisor_ids}
+    slots = {x: remaining_cap.get(x, 0) for x in supervisor_ids}
+    choice_edges: List[Tuple[int, str, str, int]] = []
+    for student_id in student_ids:
+        u = node[("student", student_id)]
+        source_edge = graph.add_edge(s, u, 1, 0)
+        for rank, course_id in enumerate(rankings[student_id]):
+            choice_edges.append((graph.add_edge(u, node[("course", course_id)], 1, rank), student_id, course_id, rank))
+        # Warm start: seat students in their first choice while there is room. Those edges
+        # cost nothing, so this flow is already of minimum cost and the solver only has to
+        # place the rest.
+        first = rankings[student_id][0] if rankings[student_id] else None
+        supervisor_id = course_by_id[first]['supervisor_id'] if first else None
+        if first and seats[first] and slots[supervisor_id]:
+            seats[first] -= 1
+            slots[supervisor_id] -= 1
+            graph.push([source_edge, choice_edges[-len(rankings[student_id])][0], course_edge[first],
+                        supervisor_edge[supervisor_id]])
+    graph.solve(s, t)
+
+    assignment = {}
+    for e, student_id, course_id, rank in choice_edges:
+        if graph.flow(e):
+            reqs = students[student_id]
+            req = next((r for r in reqs if r['course_id'] == course_id), reqs[0])
+            assignment[req['request_id']] = (course_id, rank)
+    return assignment
+
+def run_matching(preferences: Optional[Dict[str, List[str]]] = None, supervisor_cap: int = SUPERVISOR_CAP,
+                 dry_run: bool = False) -> List[Tuple[Dict, Optional[str], int]]:
+    """Match every pending request and, unless dry_run, store the decisions (inside a transaction).
+
+    Returns (request, assigned course or None, rank) for each pending request.
+    """
+    pending = [r for r in load_collection("requests.json") if r.get('status') == 'Pending']
+    assignment = match(pending, load_collection("courses.json"), load_collection("users.json"),
+                       preferences, supervisor_cap)
+    results = []
+    for req in pending:
+        course_id, rank = assignment.get(req['request_id'], (None, -1))
+        results.append((req, course_id, rank))
+    if not dry_run:
+        for req, course_id, rank in results:
+            stored = find_by_id("requests.json", req['request_id'])
+            if course_id is None:
+                operations.reject_request(stored, "No place in the student's ranked courses (intake matching)")
+            else:
+                operations.accept_request(stored, find_by_id("courses.json", course_id),
+                                          f"Accepted by intake matching (choice {rank + 1})")
+        for fn in LOCKS:
+            save_collection(fn)
+    return results
+
+def summary(results: List[Tuple[Dict, Optional[str], int]]) -> List[str]:
+    """Report lines: placements per choice and per course."""
+    placed = [r for r in results if r[1] is not None]
+    by_rank = Counter(rank for _, _, rank in placed)
+    lines = [f"{len(results)} pending requests: {len(placed)} placed, {len(results) - len(placed)} not placed."]
+    lines += [f"  choice {rank + 1}: {n}" for rank, n in sorted(by_rank.items())]
+    for course_id, n in sorted(Counter(c for _, c, _ in placed).items()):
+        course = find_by_id("courses.json", course_id)
+        lines.append(f"  {course_id}: {n} placed" + (f" ({course['title']})" if course else ""))
+    return lines
+
+if __name__ == "__main__":
+    from transactions import transaction
+    parser = argparse.ArgumentParser(prog="matching.py", description="Assign all pending requests to courses at once.")
+    parser.add_argument("--preferences", type=Path, help="CSV of student_id, first choice, second choice, ...")
+    parser.add_argument("--supervisor-cap", type=int, default=SUPERVISOR_CAP,
+                        help="most theses per supervisor (a user's max_supervise overrides it)")
+    parser.add_argument("--dry-run", action="store_true", help="report the assignment without storing it")
+    parser.add_argument("--report", default="", help="write one row per request to this CSV file")
+    args = parser.parse_args()
+    prefs = read_preferences(args.preferences) if args.preferences else None
+    if args.dry_run:
+        results = run_matching(prefs, args.supervisor_cap, dry_run=True)
+    else:
+        results = transaction(LOCKS, lambda: run_matching(prefs, args.supervisor_cap))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["request_id", "student_id", "course_id", "choice", "decision"])
+            for req, course_id, rank in results:
+                writer.writerow([req['request_id'], req['student_id'], course_id or "", rank + 1 if course_id else "",
+                                 "Accepted" if course_id else "Rejected"])
+    print(("Dry run - nothing stored.\n" if args.dry_run else "") + "\n".join(summary(results)))
@@ -0,0 +1,227 @@
+import atexit
+import bisect
+import functools
+import json
+import os
+import signal
+import sys
+import time
+from collections import Counter
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional
+
+# Opt-in instrumentation of the hot paths: JSON loads and saves, bcrypt, repository lookups
+# and each menu action.
+#
+#   THESIS_METRICS=1           print a summary to stderr when the program exits
+#   THESIS_METRICS=path.json   write the full results there instead
+#   THESIS_PROFILE=cprofile    also profile every call (written to THESIS_PROFILE_OUT.prof)
+#   THESIS_PROFILE=tracemalloc also trace allocations (top lines in THESIS_PROFILE_OUT.tracemalloc.txt)
+#
+# (THESIS_PROFILE takes both, comma-separated; THESIS_PROFILE_OUT defaults to
+# "thesis-profile".) On POSIX, SIGUSR1 writes everything without stopping the program.
+#
+# Everything is attributed to the menu action running at the time ("student.request_thesis"),
+# or to "-" outside of one. Per action there is a latency histogram, and per instrumented
+# function a histogram of its calls, plus counters such as bytes read and written, JSON
+# documents parsed and find_by_id calls. An action's time leaves out waits for the user
+# (prompt() instead of input()).
+#
+# When metrics are off, timed() returns the function unchanged, action() returns a shared
+# no-op context and callers guard counters with "if metrics.ENABLED", so the cost is an
+# attribute check.
+
+_setting = os.environ.get("THESIS_METRICS", "")
+ENABLED = _setting not in ("", "0")
+PROFILE = {p.strip() for p in os.environ.get("THESIS_PROFILE", "").split(",") if p.strip()}
+PROFILE_OUT = os.environ.get("THESIS_PROFILE_OUT", "thesis-profile")
+
+# Upper bounds of the histogram buckets, in milliseconds; the last bucket is unbounded.
+BUCKETS_MS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+class Histogram:
+    """Count, total, maximum and bucketed distribution of durations."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect.bisect_left(BUCKETS_MS, seconds * 1000)] += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound (ms) of the bucket holding the q-quantile; the maximum for the last bucket."""
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return round(min(BUCKETS_MS[i], self.max * 1000) if i < len(BUCKETS_MS) else self.max * 1000, 3)
+        return 0.0
+
+    def summary(self) -> Dict:
+        return {"count": self.count, "total_ms": round(self.total * 1000, 3),
+                "mean_ms": round(self.total * 1000 / self.count, 3) if self.count else 0.0,
+                "p50_ms": self.quantile(0.5), "p90_ms": self.quantile(0.9), "p99_ms": self.quantile(0.99),
+                "max_ms": round(self.max * 1000, 3),
+                "buckets": {(f"<={b}" if i < len(BUCKETS_MS) else f">{BUCKETS_MS[-1]}"): n
+                            for i, (b, n) in enumerate(zip(BUCKETS_MS + [None], self.buckets)) if n}}
+
+class ActionStats:
+    """What happened during one kind of menu action."""
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.calls: Dict[str, Histogram] = {}
+        self.counters: Counter = Counter()
+
+_stats: Dict[str, ActionStats] = {}
+# Running actions, innermost last: [name, start time, seconds spent waiting for input].
+_running: List[list] = []
+NO_ACTION = "-"
+
+def _stats_for(name: str) -> ActionStats:
+    stats = _stats.get(name)
+    if stats is None:
+        stats = _stats[name] = ActionStats()
+    return stats
+
+def _current() -> ActionStats:
+    return _stats_for(_running[-1][0] if _running else NO_ACTION)
+
+def count(name: str, n: int = 1):
+    """Add n to a counter of the current action (callers check ENABLED first)."""
+    _current().counters[name] += n
+
+def observe(name: str, seconds: float):
+    """Record one call of an instrumented function."""
+    calls = _current().calls
+    histogram = calls.get(name)
+    if histogram is None:
+        histogram = calls[name] = Histogram()
+    histogram.observe(seconds)
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """Decorator timing every call of a function under name; a no-op when metrics are off."""
+    def decorate(fn: Callable) -> Callable:
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def timed_fn(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start)
+        return timed_fn
+    return decorate
+
+class _Action:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        _running.append([self.name, time.perf_counter(), 0.0])
+
+    def __exit__(self, *exc):
+        name, start, waited = _running.pop()
+        _stats_for(name).latency.observe(time.perf_counter() - start - waited)
+        return False
+
+_NO_ACTION = nullcontext()
+
+def action(name: str):
+    """Context manager attributing everything inside it to the menu action name."""
+    return _Action(name) if ENABLED else _NO_ACTION
+
+def prompt(text: str) -> str:
+    """input(), with the wait for the user left out of the running action's time."""
+    if not _running:
+        return input(text)
+    start = time.perf_counter()
+    try:
+        return input(text)
+    finally:
+        for entry in _running:
+            entry[2] += time.perf_counter() - start
+
+def results() -> Dict:
+    """Everything collected so far, as JSON-compatible data."""
+    out = {"pid": os.getpid(), "actions": {}}
+    for name, stats in sorted(_stats.items()):
+        out["actions"][name] = {"latency": stats.latency.summary(),
+                                "calls": {k: h.summary() for k, h in sorted(stats.calls.items())},
+                                "counters": dict(sorted(stats.counters.items()))}
+    return out
+
+def report(file=None):
+    """Print a summary: one block per action with its calls and counters."""
+    file = file or sys.stderr
+    for name, data in results()["actions"].items():
+        latency = data["latency"]
+        if latency["count"]:
+            print(f"{name}: {latency['count']} x, p50 {latency['p50_ms']} ms, p90 {latency['p90_ms']} ms, "
+                  f"p99 {latency['p99_ms']} ms, max {latency['max_ms']} ms", file=file)
+        else:
+            print(f"{name}:", file=file)
+        for call, h in data["calls"].items():
+            print(f"    {call:<20} {h['count']:>7} x  total {h['total_ms']:>10.2f} ms  p50 {h['p50_ms']} ms  "
+                  f"max {h['max_ms']} ms", file=file)
+        for counter, n in data["counters"].items():
+            print(f"    {counter:<20} {n:>7}", file=file)
+
+_profiler = None
+
+def _start_profiling():
+    global _profiler
+    if "cprofile" in PROFILE:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    if "tracemalloc" in PROFILE:
+        import tracemalloc
+        tracemalloc.start(10)
+
+def _write_profiles():
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(PROFILE_OUT + ".prof")
+        _profiler.enable()
+    if "tracemalloc" in PROFILE:
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            with open(PROFILE_OUT + ".tracemalloc.txt", 'w', encoding='utf-8') as f:
+                f.write(f"current {current / 1024:.0f} KiB, peak {peak / 1024:.0f} KiB\n")
+                for stat in snapshot.statistics('lineno')[:40]:
+                    f.write(f"{stat}\n")
+
+def dump(path: Optional[str] = None):
+    """Write the metrics (to path, THESIS_METRICS or stderr) and any profiles."""
+    path = path or (_setting if _setting != "1" else None)
+    if ENABLED:
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(results(), f, indent=2)
+        else:
+            report()
+    _write_profiles()
+
+def _on_signal(signum, frame):
+    dump()
+
+if ENABLED or PROFILE:
+    _start_profiling()
+    atexit.register(dump)
+    if hasattr(signal, "SIGUSR1"):
+        try:
+            signal.signal(signal.SIGUSR1, _on_signal)
+        except ValueError:  # not the main thread
+            pass
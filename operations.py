@@ -0,0 +1,249 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+import blob_store
+import scheduling
+from id_allocator import allocate_id
+from repository import add_record, find_by_id, find_by_index, save_collection, update_record
+from transactions import TransactionAborted, expect_version
+from user_auth import find_user_by_id, hash_password
+
+# The write operations behind the role menus, shared by the interactive menus and the
+# batch runner. Each one validates everything before changing anything, raises
+# TransactionAborted with the message to show the user, and must run inside a
+# transaction (transactions.transaction) that locks the collections in LOCKS.
+
+LOCKS = {
+    "submit_request": ["requests.json"],
+    "resubmit_request": ["requests.json"],
+    "request_defense": ["theses.json"],
+    "review_request": ["courses.json", "requests.json", "theses.json", "users.json"],
+    "schedule_defense": scheduling.FN_LOCKS,
+    "record_score": ["theses.json"],
+    "attach_file": ["theses.json"],
+    "detach_file": ["theses.json"],
+    "create_user": ["users.json"],
+}
+
+USER_TYPES = ["student", "supervisor", "reviewer"]
+
+def now_iso():
+    """Return current datetime in ISO format."""
+    return datetime.now().isoformat(timespec='seconds')
+
+def _active_request(student_id: str) -> Optional[Dict]:
+    """The student's pending or accepted request, if any."""
+    return next((r for r in find_by_index("requests.json", "student_id", student_id) if r['status'] in ['Pending', 'Accepted']), None)
+
+def submit_request(user: Dict, course_id: str, proposal: str = "") -> Dict:
+    """Student: request a thesis in a course."""
+    course = find_by_id("courses.json", course_id)
+    if course is None:
+        raise TransactionAborted("Course not found.")
+    if course['capacity'] <= 0:
+        raise TransactionAborted("This course is at full capacity.")
+    if _active_request(user['id']):
+        raise TransactionAborted("You already have a pending or accepted request.")
+    new_request = {
+        "request_id": allocate_id("requests.json"),
+        "student_id": user['id'],
+        "course_id": course['course_id'],
+        "proposal": proposal,
+        "status": "Pending",
+        "date_submitted": now_iso(),
+        "history": [{"status": "Pending", "date": now_iso(), "note": "Submitted by student"}]
+    }
+    add_record("requests.json", new_request)
+    save_collection("requests.json")
+    return new_request
+
+def resubmit_request(user: Dict, request_id: str) -> Dict:
+    """Student: re-submit a rejected request."""
+    req = find_by_id("requests.json", request_id)
+    if not req or req['student_id'] != user['id'] or req['status'] != 'Rejected':
+        raise TransactionAborted("Invalid request or cannot be re-submitted.")
+    if _active_request(user['id']):
+        raise TransactionAborted("You already have a pending or accepted request.")
+    req['status'] = 'Pending'
+    req['date_submitted'] = now_iso()
+    req['history'].append({"status": "Pending", "date": now_iso(), "note": "Re-submitted by student"})
+    update_record("requests.json", req)
+    save_collection("requests.json")
+    return req
+
+def request_defense(user: Dict) -> Dict:
+    """Student: mark the ongoing thesis as ready for defense."""
+    thesis = next(iter(find_by_index("theses.json", "student_id", user['id'])), None)
+    if not thesis or thesis['status'] != 'Ongoing':
+        raise TransactionAborted("You do not have an active thesis or it's not ready for defense.")
+    if thesis['ready_for_defense']:
+        raise TransactionAborted("You have already requested a defense. It is currently under review.")
+    thesis['ready_for_defense'] = True
+    update_record("theses.json", thesis)
+    save_collection("theses.json")
+    return thesis
+
+def review_request(user: Dict, request_id: str, decision: str, seen_version: Optional[int] = None) -> Dict:
+    """Supervisor: accept (creating the thesis) or reject a pending request.
+
+    seen_version is the request version the decision was based on, if it was shown to the user.
+    """
+    req = find_by_id("requests.json", request_id)
+    course = find_by_id("courses.json", req['course_id']) if req else None
+    if not req or not course or course['supervisor_id'] != user['id'] or req['status'] != 'Pending':
+        raise TransactionAborted("Invalid request.")
+    if decision not in ("accept", "reject"):
+        raise TransactionAborted("Invalid input.")
+    if seen_version is not None:
+        expect_version(req, seen_version, f"Request {request_id}")
+    if decision == "reject":
+        reject_request(req, "Rejected by supervisor")
+        save_collection("requests.json")
+        return req
+    if course['capacity'] <= 0:
+        raise TransactionAborted("This course is at full capacity.")
+
+    new_thesis = accept_request(req, course, "Approved by supervisor")
+    for fn in LOCKS["review_request"]:
+        save_collection(fn)
+    return new_thesis
+
+def reject_request(req: Dict, note: str):
+    """Mark a request rejected (the caller saves requests.json)."""
+    req['status'] = "Rejected"
+    req['history'].append({"status": "Rejected", "date": now_iso(), "note": note})
+    update_record("requests.json", req)
+
+def accept_request(req: Dict, course: Dict, note: str) -> Dict:
+    """Accept a request into course: take a seat, create the thesis and count it for the supervisor.
+
+    The caller checks the seat is free and saves the collections in LOCKS["review_request"].
+    """
+    req['course_id'] = course['course_id']
+    req['status'] = "Accepted"
+    req['history'].append({"status": "Accepted", "date": now_iso(), "note": note})
+    update_record("requests.json", req)
+
+    course['capacity'] -= 1
+    update_record("courses.json", course)
+
+    # Create a new thesis entry
+    new_thesis = {
+        "thesis_id": allocate_id("theses.json"),
+        "student_id": req['student_id'],
+        "course_id": req['course_id'],
+        "supervisor_id": course['supervisor_id'],
+        "title": "",
+        "abstract": "",
+        "keywords": [],
+        "files": {},
+        "ready_for_defense": False,
+        "status": "Ongoing",
+        "date_submitted": now_iso()
+    }
+    add_record("theses.json", new_thesis)
+
+    # Update supervisor's supervise count
+    supervisor_user = find_user_by_id(course['supervisor_id'])
+    supervisor_user['supervise_count'] += 1
+    update_record("users.json", supervisor_user)
+    return new_thesis
+
+def schedule_defense(user: Dict, thesis_id: str, defense_date: str, internal_reviewer: str, external_reviewer: str,
+                     room: Optional[str] = None) -> Dict:
+    """Supervisor: schedule the defense of a thesis that is ready for it.
+
+    defense_date is "YYYY-MM-DD" or "YYYY-MM-DD HH:MM"; the first free room is used unless
+    one is given. Double bookings of the people or the room are refused.
+    """
+    thesis = find_by_id("theses.json", thesis_id)
+    if not thesis or thesis['supervisor_id'] != user['id'] or not thesis.get('ready_for_defense') or thesis['status'] != 'Ongoing':
+        raise TransactionAborted("Invalid thesis.")
+    try:
+        start, end = scheduling.slot(defense_date)
+    except ValueError:
+        raise TransactionAborted("Invalid date. Use YYYY-MM-DD or YYYY-MM-DD HH:MM.")
+
+    # Simple validation for reviewers
+    reviewer1 = find_user_by_id(internal_reviewer)
+    reviewer2 = find_user_by_id(external_reviewer)
+    if not reviewer1 or reviewer1['type'] not in ['reviewer', 'supervisor'] or not reviewer2 or reviewer2['type'] not in ['reviewer', 'supervisor']:
+        raise TransactionAborted("Invalid reviewer IDs.")
+
+    index = scheduling.day_index(start[:10])
+    room = room or scheduling.free_room(index, start, end)
+    if room is None:
+        raise TransactionAborted("No room is free at that time.")
+    conflict = scheduling.find_conflict(index, user['id'], internal_reviewer, external_reviewer, room, start, end)
+    if conflict:
+        raise TransactionAborted(conflict)
+    scheduling.book(thesis, start, end, room, internal_reviewer, external_reviewer)
+    for fn in LOCKS["schedule_defense"]:
+        save_collection(fn)
+    return thesis
+
+def record_score(user: Dict, thesis_id: str, score: float) -> Dict:
+    """Reviewer: record a final score (0 to 20) for a defense they review."""
+    thesis = find_by_id("theses.json", thesis_id)
+    if not thesis or not thesis.get('defense') or (thesis['defense'].get('internal_reviewer') != user['id'] and thesis['defense'].get('external_reviewer') != user['id']):
+        raise TransactionAborted("Invalid thesis.")
+    if not 0 <= score <= 20:
+        raise TransactionAborted("Score must be between 0 and 20.")
+    thesis['defense']['scores'][user['id']] = score
+    update_record("theses.json", thesis)
+    save_collection("theses.json")
+    return thesis
+
+def _own_thesis(user: Dict, thesis_id: str) -> Dict:
+    """A thesis the user is the student or supervisor of."""
+    thesis = find_by_id("theses.json", thesis_id)
+    if not thesis or user['id'] not in (thesis['student_id'], thesis['supervisor_id']):
+        raise TransactionAborted("Invalid thesis.")
+    return thesis
+
+def attach_file(user: Dict, thesis_id: str, name: str, blob: Dict) -> Dict:
+    """Student or supervisor: record a file stored with blob_store under a name, replacing any file of that name."""
+    thesis = _own_thesis(user, thesis_id)
+    name = name.strip()
+    if not name or "/" in name or "\\" in name:
+        raise TransactionAborted("Invalid file name.")
+    if not blob_store.exists(str(blob.get('sha256', ''))):
+        raise TransactionAborted("The file was not uploaded.")
+    thesis.setdefault('files', {})[name] = {"sha256": blob['sha256'], "size": blob['size'], "uploaded": now_iso(),
+                                            "uploaded_by": user['id']}
+    update_record("theses.json", thesis)
+    save_collection("theses.json")
+    return thesis
+
+def detach_file(user: Dict, thesis_id: str, name: str) -> Dict:
+    """Student or supervisor: remove a file from a thesis (blob_store.gc frees its chunks)."""
+    thesis = _own_thesis(user, thesis_id)
+    if name not in thesis.get('files', {}):
+        raise TransactionAborted("No such file in this thesis.")
+    del thesis['files'][name]
+    update_record("theses.json", thesis)
+    save_collection("theses.json")
+    return thesis
+
+def create_user(user_id: str, user_type: str, name: str, password: str = "", password_hash: str = "") -> Dict:
+    """Add a user account; pass either a plaintext password or an existing bcrypt hash."""
+    if not user_id or find_user_by_id(user_id):
+        raise TransactionAborted("User ID already exists." if user_id else "User ID is required.")
+    if user_type not in USER_TYPES:
+        raise TransactionAborted(f"User type must be one of: {', '.join(USER_TYPES)}.")
+    if not password and not password_hash:
+        raise TransactionAborted("A password is required.")
+    new_user = {"id": user_id, "type": user_type, "name": name,
+                "password_hash": password_hash or hash_password(password)}
+    if user_type != "student":
+        new_user["supervise_count"] = 0
+        new_user["review_count"] = 0
+    add_record("users.json", new_user)
+    save_collection("users.json")
+    return new_user
+
+def require_role(user_id: str, *roles: str) -> Dict:
+    """The user with this ID, if their type is one of roles."""
+    user = find_user_by_id(user_id)
+    if not user or user.get("type") not in roles:
+        raise TransactionAborted(f"{user_id or 'User'} is not a {' or '.join(roles)}.")
+    return user
@@ -0,0 +1,213 @@
+import argparse
+import csv
+import sys
+from typing import Callable, Dict, List, Optional, Tuple
+import archive
+import repository
+
+# numpy, imported by get_snapshot on first use (importing it costs more than the rest of
+# startup). Reports need it; everything else works without it.
+np = None
+
+# Statistics over requests, theses and scores. The collections are turned once into a
+# Snapshot of NumPy columns (one row per history event, request or score), and every
+# report is a vectorized group-by over them. The snapshot is reused until one of the
+# collections changes on disk. Requests and theses of sealed terms (archive.py) are included.
+#
+#   turnaround     days from first submission (Pending) to acceptance, per course
+#   acceptance     accepted / decided requests per course
+#   supervisors    defense scores of the theses each supervisor supervises
+#   reviewers      defense scores each reviewer gave
+
+COLLECTIONS = ["requests.json", "theses.json", "courses.json"]
+STATUSES = ["Pending", "Accepted", "Rejected"]
+QUANTILES = [("p25", 0.25), ("median", 0.5), ("p75", 0.75), ("p90", 0.9)]
+
+class Snapshot:
+    """Column-oriented copy of the collections the reports read."""
+
+    def __init__(self, requests: List[Dict], theses: List[Dict], courses: List[Dict]):
+        status_code = {s: i for i, s in enumerate(STATUSES)}
+        # Requests: one row each.
+        course_ids = sorted({c['course_id'] for c in courses} | {r.get('course_id', '') for r in requests})
+        course_code = {c: i for i, c in enumerate(course_ids)}
+        self.course_ids = np.array(course_ids, dtype=object)
+        self.course_titles = {c['course_id']: c.get('title', '') for c in courses}
+        self.request_course = np.fromiter((course_code[r.get('course_id', '')] for r in requests), np.int32, len(requests))
+        self.request_status = np.fromiter((status_code.get(r.get('status'), -1) for r in requests), np.int8, len(requests))
+        # History events: one row each, pointing at their request.
+        event_request: List[int] = []
+        event_status: List[int] = []
+        event_date: List[str] = []
+        for i, r in enumerate(requests):
+            for h in r.get('history', ()):
+                event_request.append(i)
+                event_status.append(status_code.get(h.get('status'), -1))
+                date = h.get('date')
+                event_date.append(date if isinstance(date, str) and date else "NaT")
+        self.event_request = np.array(event_request, dtype=np.int32)
+        self.event_status = np.array(event_status, dtype=np.int8)
+        self.event_time = parse_dates(event_date)
+        # Defense scores: one row per (thesis, reviewer).
+        people: Dict[str, int] = {}
+        score_supervisor: List[int] = []
+        score_reviewer: List[int] = []
+        score_value: List[float] = []
+        for t in theses:
+            scores = (t.get('defense') or {}).get('scores') or {}
+            for reviewer_id, score in scores.items():
+                try:
+                    score = float(score)
+                except (TypeError, ValueError):
+                    continue  # a hand-edited score that is not a number: left out, like a missing one
+                score_supervisor.append(people.setdefault(t.get('supervisor_id', ''), len(people)))
+                score_reviewer.append(people.setdefault(reviewer_id, len(people)))
+                score_value.append(score)
+        self.people = np.array(list(people), dtype=object)
+        self.score_supervisor = np.array(score_supervisor, dtype=np.int32)
+        self.score_reviewer = np.array(score_reviewer, dtype=np.int32)
+        self.score_value = np.array(score_value, dtype=np.float64)
+
+def parse_dates(dates: List[str]) -> "np.ndarray":
+    """datetime64[s] column of ISO dates; a date that does not parse becomes NaT, like a missing one."""
+    try:
+        return np.array(dates, dtype='datetime64[s]')
+    except ValueError:
+        pass
+    column = np.empty(len(dates), dtype='datetime64[s]')
+    for i, date in enumerate(dates):
+        try:
+            column[i] = np.datetime64(date, 's')
+        except ValueError:
+            column[i] = np.datetime64('NaT')
+    return column
+
+_snapshot: Optional[Snapshot] = None
+_stamps: Optional[List] = None
+
+def get_snapshot() -> Snapshot:
+    """The current snapshot, rebuilt only if a collection changed since it was taken."""
+    global _snapshot, _stamps, np
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            raise RuntimeError("Reports need NumPy: pip install numpy")
+    stamps = [repository.data_stamp(fn) for fn in COLLECTIONS] + [archive.stamp()]
+    if _snapshot is None or stamps != _stamps:
+        _snapshot = Snapshot(*(repository.load_collection(fn) + archive.sealed_records(fn) for fn in COLLECTIONS))
+        _stamps = stamps
+    return _snapshot
+
+def group_stats(groups: "np.ndarray", values: "np.ndarray", n_groups: int) -> Dict[str, "np.ndarray"]:
+    """count, mean, min, quantiles and max of values per group code (0..n_groups-1).
+
+    Quantiles interpolate linearly between the two nearest values, as numpy.quantile does.
+    """
+    count = np.bincount(groups, minlength=n_groups)
+    total = np.bincount(groups, weights=values, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats = {"count": count, "mean": total / count}
+    # Sort by group, then value: each group's values are a contiguous, ordered run.
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    starts = np.concatenate(([0], np.cumsum(count)[:-1]))
+    has = count > 0
+    last = np.maximum(count - 1, 0)
+    for name, q in [("min", 0.0)] + QUANTILES + [("max", 1.0)]:
+        position = last[has] * q
+        below = np.floor(position).astype(np.int64)
+        above = np.ceil(position).astype(np.int64)
+        low, high = ordered[starts[has] + below], ordered[starts[has] + above]
+        column = np.full(n_groups, np.nan)
+        column[has] = low + (high - low) * (position - below)
+        stats[name] = column
+    return stats
+
+def _rows(labels: "np.ndarray", stats: Dict[str, "np.ndarray"], digits: int = 2) -> List[List]:
+    """Table rows for the groups that have any values."""
+    rows = []
+    for i in np.flatnonzero(stats["count"]):
+        rows.append([labels[i]] + [int(stats["count"][i])] +
+                    [round(float(stats[k][i]), digits) for k in stats if k != "count"])
+    return rows
+
+def turnaround(snap: Snapshot) -> Tuple[List[str], List[List]]:
+    """Days from a request's first Pending event to its first Accepted event, per course."""
+    n = len(snap.request_course)
+    never = np.datetime64('9999-12-31T00:00:00')
+    first = {}
+    for status in ("Pending", "Accepted"):
+        mask = (snap.event_status == STATUSES.index(status)) & ~np.isnat(snap.event_time)
+        times = np.full(n, never)
+        np.minimum.at(times, snap.event_request[mask], snap.event_time[mask])
+        first[status] = times
+    done = (first["Pending"] != never) & (first["Accepted"] != never) & (first["Accepted"] >= first["Pending"])
+    days = (first["Accepted"][done] - first["Pending"][done]).astype(np.float64) / 86400
+    stats = group_stats(snap.request_course[done], days, len(snap.course_ids))
+    header = ["course_id", "accepted"] + [f"{k}_days" for k in stats if k != "count"]
+    rows = _rows(snap.course_ids, stats)
+    if len(days):
+        overall = group_stats(np.zeros(len(days), dtype=np.int64), days, 1)
+        rows += _rows(np.array(["ALL"], dtype=object), overall)
+    return header, rows
+
+def acceptance(snap: Snapshot) -> Tuple[List[str], List[List]]:
+    """Requests per course by status, and the share of decided ones that were accepted."""
+    n = len(snap.course_ids)
+    counts = {s: np.bincount(snap.request_course[snap.request_status == i], minlength=n) for i, s in enumerate(STATUSES)}
+    decided = counts["Accepted"] + counts["Rejected"]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rate = counts["Accepted"] / decided
+    total = np.bincount(snap.request_course, minlength=n)
+    rows = [[snap.course_ids[i], snap.course_titles.get(snap.course_ids[i], ""), int(total[i])]
+            + [int(counts[s][i]) for s in STATUSES] + [round(float(rate[i]), 3) if decided[i] else ""]
+            for i in range(n) if total[i]]
+    return ["course_id", "title", "requests"] + [s.lower() for s in STATUSES] + ["acceptance_rate"], rows
+
+def _scores_by(column: str) -> Callable[[Snapshot], Tuple[List[str], List[List]]]:
+    def report(snap: Snapshot) -> Tuple[List[str], List[List]]:
+        stats = group_stats(getattr(snap, column), snap.score_value, len(snap.people))
+        return [column.split("_")[1] + "_id", "scores"] + [k for k in stats if k != "count"], _rows(snap.people, stats)
+    report.__doc__ = f"Distribution of defense scores per {column.split('_')[1]}."
+    return report
+
+REPORTS: Dict[str, Callable[[Snapshot], Tuple[List[str], List[List]]]] = {
+    "turnaround": turnaround,
+    "acceptance": acceptance,
+    "supervisors": _scores_by("score_supervisor"),
+    "reviewers": _scores_by("score_reviewer"),
+}
+
+def run_report(name: str) -> Tuple[List[str], List[List]]:
+    """(header, rows) of a report by name."""
+    return REPORTS[name](get_snapshot())
+
+def print_table(header: List[str], rows: List[List]):
+    """Print a report as aligned columns."""
+    if not rows:
+        print("No data.")
+        return
+    widths = [max(len(str(x)) for x in column) for column in zip(header, *rows)]
+    for row in [header] + rows:
+        print("  ".join(str(x).ljust(w) for x, w in zip(row, widths)))
+
+def main(argv: List[str]) -> int:
+    """Entry point of the report subcommand: write a report as CSV."""
+    parser = argparse.ArgumentParser(prog="main.py report", description="Write a statistics report as CSV.")
+    parser.add_argument("report", choices=list(REPORTS))
+    parser.add_argument("-o", "--output", help="CSV file to write (default: standard output)")
+    args = parser.parse_args(argv)
+    header, rows = run_report(args.report)
+    out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        writer = csv.writer(out)
+        writer.writerow(header)
+        writer.writerows(rows)
+    finally:
+        if args.output:
+            out.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
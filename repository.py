@@ -0,0 +1,403 @@
+import gc
+import os
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+import data_handler
+import journal
+import metrics
+import sqlite_backend
+from data_handler import DATA_DIR, file_lock, load_json, save_json, write_json_file
+
+# Primary key field of every collection stored in DATA_DIR.
+PRIMARY_KEYS = {
+    "users.json": "id",
+    "courses.json": "course_id",
+    "requests.json": "request_id",
+    "theses.json": "thesis_id",
+    "defenses.json": "defense_id",
+}
+
+def _supervisor_status_keys(r: Dict) -> List[Hashable]:
+    """Requests are queued per (supervisor of the requested course, status)."""
+    # Called for every request while indexing, so use the cached courses as they are
+    # instead of checking the file on disk each time.
+    entry = _collections.get("courses.json") or _entry("courses.json")
+    course = entry["index"].get(r.get("course_id"))
+    return [(course.get("supervisor_id"), r.get("status"))] if course else []
+
+def _reviewer_keys(t: Dict) -> List[Hashable]:
+    """A thesis is in the queue of both reviewers assigned to its defense."""
+    defense = t.get("defense") or {}
+    return [rid for rid in {defense.get("internal_reviewer"), defense.get("external_reviewer")} if rid]
+
+def _field_keys(field: str) -> Callable[[Dict], List[Hashable]]:
+    """Index key function for a plain record field."""
+    return lambda r: [r[field]] if r.get(field) is not None else []
+
+# Secondary indexes per collection: index name -> function returning the keys of a record.
+SECONDARY_INDEXES: Dict[str, Dict[str, Callable[[Dict], List[Hashable]]]] = {
+    "requests.json": {
+        "student_id": _field_keys("student_id"),
+        "course_id": _field_keys("course_id"),
+        "supervisor_status": _supervisor_status_keys,
+    },
+    "theses.json": {
+        "student_id": _field_keys("student_id"),
+        "course_id": _field_keys("course_id"),
+        "supervisor_id": _field_keys("supervisor_id"),
+        "reviewer": _reviewer_keys,
+    },
+    "courses.json": {
+        "supervisor_id": _field_keys("supervisor_id"),
+    },
+    "defenses.json": {
+        "date": _field_keys("date"),
+    },
+}
+
+# fn -> {"stamp": (mtime_ns, size) or None, "records": [...], "index": {pk: record},
+#        "secondary": {name: {key: {pk: record}}}, "keys": {name: {pk: [key, ...]}}}
+_collections: Dict[str, Dict[str, Any]] = {}
+# Callbacks run as hook(fn, record) whenever a record is added or changed.
+_change_hooks: List[Callable[[str, Dict], None]] = []
+
+# Set while a transaction (transactions.py) runs: the collections it locked, the ones
+# saved so far (written together on commit), the ones replaced by a different list and
+# other JSON files to write with them (save_file).
+_txn: Optional[Dict[str, Any]] = None
+
+# SQLite mode keeps no cache; fn -> the list last returned by load_collection, so that
+# saving it back only commits the records written through add_record/update_record.
+_loaded: Dict[str, List[Dict]] = {}
+
+def _sqlite() -> bool:
+    """Whether collections are stored in SQLite (see sqlite_backend.py)."""
+    return data_handler.STORAGE_MODE == "sqlite"
+
+def _stat(path) -> Optional[Tuple[int, int]]:
+    """Return (mtime_ns, size) of a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _file_stamp(fn: str) -> Optional[Tuple]:
+    """Return a stamp that changes whenever the stored collection changes on disk."""
+    if data_handler.STORAGE_MODE == "journal":
+        return (_stat(DATA_DIR / fn), _stat(journal.wal_path(fn)))
+    return _stat(data_handler.data_path(fn))
+
+def _load_records(fn: str) -> List[Dict]:
+    """Read a collection from disk in the configured storage mode."""
+    if data_handler.STORAGE_MODE == "journal" and fn in PRIMARY_KEYS:
+        import transactions  # imported here: it imports this module
+        transactions.roll_forward(fn)
+        return journal.load(fn, PRIMARY_KEYS[fn])
+    return load_json(fn, [])
+
+def _build_index(fn: str, records: List[Dict]) -> Dict[str, Dict]:
+    """Build the primary-key index of a collection."""
+    key = PRIMARY_KEYS.get(fn)
+    if key is None:
+        return {}
+    return {r[key]: r for r in records if key in r}
+
+def _build_secondary(fn: str, records: List[Dict]) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """Build all secondary indexes of a collection from scratch."""
+    secondary: Dict[str, Dict] = {}
+    keys: Dict[str, Dict] = {}
+    pk = PRIMARY_KEYS.get(fn)
+    for name, key_func in SECONDARY_INDEXES.get(fn, {}).items():
+        buckets: Dict[Hashable, Dict[str, Dict]] = {}
+        record_keys: Dict[str, List[Hashable]] = {}
+        for r in records:
+            if pk not in r:
+                continue
+            rk = key_func(r)
+            record_keys[r[pk]] = rk
+            for k in rk:
+                buckets.setdefault(k, {})[r[pk]] = r
+        secondary[name] = buckets
+        keys[name] = record_keys
+    return secondary, keys
+
+def _new_entry(fn: str, stamp: Optional[Tuple[int, int]], records: List[Dict]) -> Dict[str, Any]:
+    """Create a cache entry with freshly built primary and secondary indexes."""
+    _collections[fn] = {"stamp": stamp, "records": records, "index": _build_index(fn, records),
+                        "secondary": {}, "keys": {}}
+    # Secondary key functions may look up other collections (or this one), so they run
+    # once the primary index is in place.
+    secondary, keys = _build_secondary(fn, records)
+    _collections[fn]["secondary"] = secondary
+    _collections[fn]["keys"] = keys
+    if fn == "courses.json":
+        _rekey_requests()  # any course may have a new supervisor
+    return _collections[fn]
+
+def _refile(entry: Dict[str, Any], name: str, pk: str, record: Dict, new_keys: List[Hashable]):
+    """Move a record from its old keys to new_keys in one secondary index of a cache entry."""
+    buckets = entry["secondary"][name]
+    for k in entry["keys"][name].get(pk, []):
+        if k not in new_keys:
+            bucket = buckets.get(k, {})
+            bucket.pop(pk, None)
+            if not bucket:
+                buckets.pop(k, None)
+    for k in new_keys:
+        buckets.setdefault(k, {})[pk] = record
+    entry["keys"][name][pk] = new_keys
+
+def _rekey_requests(course_id: Optional[str] = None):
+    """Re-file cached requests under their course's current supervisor in "supervisor_status".
+
+    Only the requests of course_id, or all of them if it is None.
+    """
+    entry = _collections.get("requests.json")
+    if entry is None or "supervisor_status" not in entry["secondary"]:
+        return  # not loaded, or being built right now (and so already current)
+    requests = entry["index"].values() if course_id is None \
+        else entry["secondary"]["course_id"].get(course_id, {}).values()
+    for r in list(requests):
+        _refile(entry, "supervisor_status", r["request_id"], r, _supervisor_status_keys(r))
+
+@contextmanager
+def _gc_paused():
+    """Pause the cyclic garbage collector while building objects that are all kept.
+
+    Loading a large collection allocates millions of dicts and lists; each allocation
+    counts towards the next collection, which would scan them all and free nothing.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def _entry(fn: str) -> Dict[str, Any]:
+    """Return the cached entry for fn, (re)loading it if missing or stale on disk."""
+    stamp = _file_stamp(fn)
+    entry = _collections.get(fn)
+    if entry is None or entry["stamp"] != stamp:
+        with _gc_paused():
+            entry = _new_entry(fn, stamp, _load_records(fn))
+    return entry
+
+def load_collection(fn: str) -> List[Dict]:
+    """Return the shared, cached list of records of a collection.
+
+    The same list (and the same record objects) is handed to every caller until the
+    file is saved or changed on disk, so a record found by ID can be mutated in place
+    and persisted with save_collection(fn).
+    """
+    if metrics.ENABLED:
+        metrics.count("load_collection")
+    if _sqlite():
+        _loaded[fn] = sqlite_backend.load_all(fn)
+        return _loaded[fn]
+    return _entry(fn)["records"]
+
+def cached(fn: str) -> Optional[List[Dict]]:
+    """The cached list of a collection if it is loaded and current on disk, else None (never loads)."""
+    if _sqlite():
+        return None
+    entry = _collections.get(fn)
+    return entry["records"] if entry is not None and entry["stamp"] == _file_stamp(fn) else None
+
+def find_by_id(fn: str, record_id: str) -> Optional[Dict]:
+    """Find a record by primary key in O(1).
+
+    In jsonl mode, outside a transaction and while the collection is not loaded, only the
+    record's line is read, through the file's offset index; the record is then a copy.
+    """
+    if metrics.ENABLED:
+        metrics.count("find_by_id")
+    if _sqlite():
+        return sqlite_backend.find_by_id(fn, record_id)
+    if data_handler.STORAGE_MODE == "jsonl" and _txn is None and cached(fn) is None:
+        import jsonl_store  # imported here: it imports this module
+        try:
+            return jsonl_store.find(fn, record_id)
+        except RuntimeError:
+            pass  # the file changed while it was being indexed; load it instead
+    return _entry(fn)["index"].get(record_id)
+
+def register_change_hook(hook: Callable[[str, Dict], None]):
+    """Register a callback invoked as hook(fn, record) by add_record and update_record."""
+    _change_hooks.append(hook)
+
+def find_by_index(fn: str, index: str, key: Hashable) -> List[Dict]:
+    """Return the records of a collection filed under key in a secondary index."""
+    if metrics.ENABLED:
+        metrics.count("find_by_index")
+    if _sqlite():
+        return sqlite_backend.find_by_index(fn, index, key)
+    return list(_entry(fn)["secondary"][index].get(key, {}).values())
+
+def update_record(fn: str, record: Dict):
+    """Re-file a record in the secondary indexes after it was changed in place.
+
+    Also bumps the record's "version" stamp, which transactions use to detect records
+    changed by another session.
+    """
+    record["version"] = record.get("version", 0) + 1
+    for hook in _change_hooks:
+        hook(fn, record)
+    if _sqlite():
+        sqlite_backend.put(fn, record)
+        return
+    entry = _entry(fn)
+    pk = record[PRIMARY_KEYS[fn]]
+    entry["index"][pk] = record
+    supervisor = entry["keys"]["supervisor_id"].get(pk) if fn == "courses.json" else None
+    for name, key_func in SECONDARY_INDEXES.get(fn, {}).items():
+        _refile(entry, name, pk, record, key_func(record))
+    if fn == "courses.json" and entry["keys"]["supervisor_id"][pk] != supervisor:
+        # Requests are queued by their course's supervisor (_supervisor_status_keys).
+        _rekey_requests(pk)
+    if data_handler.STORAGE_MODE == "journal":
+        journal.mark_dirty(fn, pk, record)
+
+def add_record(fn: str, record: Dict):
+    """Append a new record to a cached collection and index it."""
+    if _sqlite():
+        if fn in _loaded:
+            _loaded[fn].append(record)
+        update_record(fn, record)
+        return
+    _entry(fn)["records"].append(record)
+    update_record(fn, record)
+
+def save_collection(fn: str, records: Optional[List[Dict]] = None):
+    """Persist a collection; defaults to the cached list returned by load_collection.
+
+    Saving the cached list keeps the incrementally maintained indexes; saving any other
+    list replaces the cached copy and rebuilds them. In journal mode, saving the cached
+    list only appends the records passed to add_record/update_record since the last save;
+    in SQLite mode it commits them. Inside a transaction nothing is written until it commits.
+    """
+    if _txn is not None and fn not in _txn["fns"]:
+        raise RuntimeError(f"{fn} is saved but not locked by the current transaction.")
+    if _sqlite():
+        if records is not None and records is not _loaded.get(fn):
+            sqlite_backend.replace_all(fn, records, commit=_txn is None)
+        elif _txn is None:
+            sqlite_backend.commit()
+        return
+    entry = _collections.get(fn)
+    if records is None:
+        records = load_collection(fn)
+        entry = _collections[fn]
+    cached = entry is not None and entry["records"] is records
+    if _txn is not None:
+        if not cached:
+            # Keep the stamp the replaced copy was read at, for the commit-time check.
+            _new_entry(fn, entry["stamp"] if entry else _file_stamp(fn), records)
+            _txn["replaced"].add(fn)
+        if fn not in _txn["saved"]:
+            _txn["saved"].append(fn)
+        return
+    with file_lock([fn]):
+        if data_handler.STORAGE_MODE == "journal" and fn in PRIMARY_KEYS:
+            if cached and not journal.needs_compaction(fn):
+                journal.flush(fn)
+            else:
+                import transactions
+                transactions.compact(fn, records)
+        else:
+            save_json(fn, records)
+    if cached:
+        entry["stamp"] = _file_stamp(fn)
+    else:
+        _new_entry(fn, _file_stamp(fn), records)
+
+def begin_transaction(fns: List[str]):
+    """Start deferring saves of the given (locked) collections; see transactions.py."""
+    global _txn
+    _txn = {"fns": set(fns), "saved": [], "replaced": set(), "files": {}, "after_commit": []}
+
+def end_transaction() -> Dict[str, Any]:
+    """Stop deferring saves; return the transaction state (saved and replaced collections)."""
+    global _txn
+    txn, _txn = _txn, None
+    return txn
+
+def save_file(name: str, data: Any):
+    """Write a JSON file (name is its path under DATA_DIR) atomically.
+
+    Inside a transaction it is written by the commit, together with the collections.
+    """
+    if _txn is not None:
+        _txn["files"][name] = data
+        return
+    path = DATA_DIR / name
+    tmp = path.with_name(path.name + ".tmp")
+    write_json_file(tmp, data)
+    os.replace(tmp, path)
+
+def after_commit(callback: Callable[[], None]):
+    """Run callback once the current transaction has committed (never, if it aborts); now outside one."""
+    if _txn is None:
+        callback()
+    else:
+        _txn["after_commit"].append(callback)
+
+def is_stale(fn: str) -> bool:
+    """Whether a cached collection changed on disk since it was read."""
+    entry = _collections.get(fn)
+    return entry is not None and entry["stamp"] != _file_stamp(fn)
+
+def data_stamp(fn: str) -> Tuple:
+    """A value that changes whenever a collection changes on disk, in any storage mode."""
+    if _sqlite():
+        db = sqlite_backend.DB_PATH
+        return (_stat(db), _stat(db.with_name(db.name + "-wal")))
+    return _file_stamp(fn)
+
+def refresh_stamp(fn: str):
+    """Record that the cached copy of a collection now matches the disk."""
+    if fn in _collections:
+        _collections[fn]["stamp"] = _file_stamp(fn)
+
+def check_indexes(fn: Optional[str] = None) -> List[str]:
+    """Rebuild indexes from scratch and report every difference from the maintained ones."""
+    if _sqlite():
+        return sqlite_backend.integrity_problems()
+    problems = []
+    for name in ([fn] if fn else list(PRIMARY_KEYS)):
+        entry = _entry(name)
+        rebuilt_index = _build_index(name, entry["records"])
+        if set(rebuilt_index) != set(entry["index"]):
+            problems.append(f"{name}: primary index keys differ from records")
+        rebuilt, _ = _build_secondary(name, entry["records"])
+        for index, buckets in rebuilt.items():
+            maintained = entry["secondary"][index]
+            for key in set(buckets) | set(maintained):
+                expected = set(buckets.get(key, {}))
+                actual = set(maintained.get(key, {}))
+                if expected != actual:
+                    problems.append(f"{name}[{index}={key!r}]: expected {sorted(expected)}, found {sorted(actual)}")
+    return problems
+
+def invalidate(fn: Optional[str] = None):
+    """Drop the cached copy of one collection, or of all of them."""
+    if fn is None:
+        _collections.clear()
+    else:
+        _collections.pop(fn, None)
+
+def _on_save(fn: str, data: Any):
+    """save_json hook: drop the cached copy unless it is the very list just written."""
+    entry = _collections.get(fn)
+    if entry is not None and entry["records"] is not data:
+        invalidate(fn)
+
+data_handler.register_save_hook(_on_save)
+
+if __name__ == "__main__":
+    issues = check_indexes()
+    for issue in issues:
+        print(issue)
+    print("Indexes consistent." if not issues else f"{len(issues)} index inconsistencies found.")
@@ -0,0 +1,364 @@
+import argparse
+import bisect
+import heapq
+import os
+import sys
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from id_allocator import allocate_id
+from repository import add_record, find_by_id, find_by_index, load_collection, save_collection, update_record
+
+# Defense scheduling. Every defense books a time interval for four resources: the thesis
+# supervisor, the internal and external reviewers, and a room. IntervalIndex keeps the
+# bookings of each resource sorted, so a conflict check is a binary search. Reviewers are
+# proposed by lowest review_count among the people free at that time: supervisors (other
+# than the thesis's own) as internal reviewers, reviewer accounts as external ones.
+#
+# plan() places a whole season of ready theses into day slots: greedily (most loaded
+# supervisors first, earliest slot that fits), then repairs theses left over by moving a
+# blocking reviewer of an already placed defense to someone else free at that time, and
+# finally evens out review_count by swapping reviewers for less loaded free ones.
+
+DEFENSE_MINUTES = 90
+# Start times of the defense slots of a day.
+DAY_SLOTS = ["09:00", "10:45", "13:00", "14:45"]
+ROOMS = [r.strip() for r in os.environ.get("THESIS_DEFENSE_ROOMS", "Room 1,Room 2").split(",") if r.strip()]
+DEFAULT_TIME = "09:00"
+TIME_FORMAT = "%Y-%m-%dT%H:%M"
+FN_LOCKS = ["defenses.json", "theses.json", "users.json"]
+
+def slot(text: str) -> Tuple[str, str]:
+    """(start, end) of a defense starting at "YYYY-MM-DD" (at DEFAULT_TIME) or "YYYY-MM-DD HH:MM".
+
+    Times are kept as "YYYY-MM-DDTHH:MM" strings, which sort chronologically.
+    """
+    text = text.strip().replace("T", " ")
+    start = datetime.strptime(text if " " in text else f"{text} {DEFAULT_TIME}", "%Y-%m-%d %H:%M")
+    return start.strftime(TIME_FORMAT), (start + timedelta(minutes=DEFENSE_MINUTES)).strftime(TIME_FORMAT)
+
+class IntervalIndex:
+    """Booked time intervals per resource (person ID or "room:<name>"), sorted by start."""
+
+    def __init__(self):
+        self.starts: Dict[str, List[str]] = {}
+        self.bookings: Dict[str, List[Tuple[str, str, str]]] = {}  # (start, end, tag)
+
+    def conflict(self, resource: str, start: str, end: str) -> Optional[str]:
+        """Tag of a booking of resource overlapping [start, end), if any, in O(log n).
+
+        Bookings of one resource never overlap, so their ends are sorted too and only the
+        last booking starting before end can reach past start.
+        """
+        starts = self.starts.get(resource)
+        if not starts:
+            return None
+        i = bisect.bisect_left(starts, end)
+        if i and self.bookings[resource][i - 1][1] > start:
+            return self.bookings[resource][i - 1][2]
+        return None
+
+    def add(self, resource: str, start: str, end: str, tag: str):
+        """Book [start, end) for a resource."""
+        starts = self.starts.setdefault(resource, [])
+        i = bisect.bisect_right(starts, start)
+        starts.insert(i, start)
+        self.bookings.setdefault(resource, []).insert(i, (start, end, tag))
+
+    def remove(self, resource: str, tag: str):
+        """Cancel the booking of a resource with this tag."""
+        bookings = self.bookings.get(resource, [])
+        for i, booking in enumerate(bookings):
+            if booking[2] == tag:
+                del bookings[i]
+                del self.starts[resource][i]
+                return
+
+def resources(supervisor_id: str, internal: str, external: str, room: str) -> List[str]:
+    """Everything a defense occupies."""
+    return [supervisor_id, internal, external, "room:" + room]
+
+def _booking(defense: Dict) -> Optional[Tuple[str, str, List[str]]]:
+    """(start, end, resources) of a stored defense."""
+    if not defense.get("start"):
+        return None
+    return defense["start"], defense["end"], resources(defense.get("supervisor_id", ""), defense.get("internal_reviewer", ""),
+                                                       defense.get("external_reviewer", ""), defense.get("room", ""))
+
+def build_index(defenses: Iterable[Dict]) -> IntervalIndex:
+    """Index the bookings of stored defenses."""
+    index = IntervalIndex()
+    for d in defenses:
+        booking = _booking(d)
+        if booking:
+            for resource in booking[2]:
+                index.add(resource, booking[0], booking[1], d["defense_id"])
+    return index
+
+def day_index(day: str) -> IntervalIndex:
+    """Index of the defenses on one day; defenses never cross midnight, so that is all a check needs."""
+    return build_index(find_by_index("defenses.json", "date", day))
+
+def free_room(index: IntervalIndex, start: str, end: str, rooms: List[str] = ROOMS) -> Optional[str]:
+    """First room not booked in [start, end)."""
+    return next((r for r in rooms if index.conflict("room:" + r, start, end) is None), None)
+
+def find_conflict(index: IntervalIndex, supervisor_id: str, internal: str, external: str, room: str,
+                  start: str, end: str) -> Optional[str]:
+    """Describe why a defense cannot be held at [start, end), or None if it can."""
+    if len({supervisor_id, internal, external}) < 3:
+        return "The supervisor and the two reviewers must be three different people."
+    for who, resource in [("The supervisor", supervisor_id), (f"Reviewer {internal}", internal),
+                          (f"Reviewer {external}", external), (f"Room {room}", "room:" + room)]:
+        tag = index.conflict(resource, start, end)
+        if tag is not None:
+            return f"{who} is already booked at that time (defense {tag})."
+    return None
+
+def reviewer_pools(users: List[Dict]) -> Tuple[List[str], List[str]]:
+    """(internal, external) reviewer candidates; each falls back to the other if empty."""
+    internal = [u['id'] for u in users if u.get('type') == 'supervisor']
+    external = [u['id'] for u in users if u.get('type') == 'reviewer']
+    return internal or external, external or internal
+
+def _pick(heap: List[Tuple[int, str]], loads: Dict[str, int], ok: Callable[[str], bool]) -> Optional[str]:
+    """Least loaded candidate in a heap of (load, id) for which ok(id) holds.
+
+    Heap entries whose load is out of date are refreshed as they are met.
+    """
+    popped = []
+    chosen = None
+    while heap:
+        load, rid = heapq.heappop(heap)
+        if load != loads[rid]:
+            heapq.heappush(heap, (loads[rid], rid))
+            continue
+        popped.append((load, rid))
+        if ok(rid):
+            chosen = rid
+            break
+    for entry in popped:
+        heapq.heappush(heap, entry)
+    return chosen
+
+def _pick_pair(index: IntervalIndex, pools: Tuple[List[Tuple[int, str]], List[Tuple[int, str]]],
+               loads: Dict[str, int], supervisor_id: str, start: str, end: str) -> Optional[Tuple[str, str]]:
+    """Least loaded free (internal, external) reviewers for a defense of supervisor_id."""
+    internal = _pick(pools[0], loads, lambda r: r != supervisor_id and index.conflict(r, start, end) is None)
+    if internal is None:
+        return None
+    external = _pick(pools[1], loads, lambda r: r not in (supervisor_id, internal)
+                     and index.conflict(r, start, end) is None)
+    return (internal, external) if external else None
+
+def _heaps(users: List[Dict], loads: Dict[str, int]) -> Tuple[List[Tuple[int, str]], List[Tuple[int, str]]]:
+    internal, external = reviewer_pools(users)
+    heaps = ([(loads[r], r) for r in internal], [(loads[r], r) for r in external])
+    for h in heaps:
+        heapq.heapify(h)
+    return heaps
+
+def propose_reviewers(supervisor_id: str, start: str, end: str) -> Optional[Tuple[str, str]]:
+    """Suggested (internal, external) reviewers for a defense at [start, end)."""
+    users = load_collection("users.json")
+    loads = {u['id']: u.get('review_count', 0) for u in users}
+    return _pick_pair(day_index(start[:10]), _heaps(users, loads), loads, supervisor_id, start, end)
+
+def book(thesis: Dict, start: str, end: str, room: str, internal: str, external: str) -> Dict:
+    """Store a defense and count it in both reviewers' review_count (inside a transaction)."""
+    defense = {
+        "defense_id": allocate_id("defenses.json"),
+        "thesis_id": thesis['thesis_id'],
+        "supervisor_id": thesis['supervisor_id'],
+        "date": start[:10],
+        "start": start,
+        "end": end,
+        "room": room,
+        "internal_reviewer": internal,
+        "external_reviewer": external,
+    }
+    add_record("defenses.json", defense)
+    thesis['defense'] = {
+        "defense_id": defense['defense_id'],
+        "date": defense['date'],
+        "time": start[11:],
+        "room": room,
+        "internal_reviewer": internal,
+        "external_reviewer": external,
+        "attendance": [],
+        "scores": {}
+    }
+    thesis['status'] = "Scheduled"
+    update_record("theses.json", thesis)
+    for reviewer_id in (internal, external):
+        reviewer = find_by_id("users.json", reviewer_id)
+        reviewer['review_count'] = reviewer.get('review_count', 0) + 1
+        update_record("users.json", reviewer)
+    return defense
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Batch scheduling
+# ----------------------------------------------------------------------------------------------------------------------
+
+def season_slots(first_day: date, days: int, day_slots: List[str] = DAY_SLOTS) -> List[Tuple[str, str]]:
+    """Every (start, end) slot of days consecutive days, in time order."""
+    return [slot(f"{first_day + timedelta(days=d)} {t}") for d in range(days) for t in day_slots]
+
+def plan(theses: List[Dict], users: List[Dict], defenses: List[Dict], slots: List[Tuple[str, str]],
+         rooms: List[str] = ROOMS) -> Tuple[List[Dict], List[str]]:
+    """Place theses into slots around the existing defenses.
+
+    Returns the placements (dicts with thesis_id, supervisor_id, start, end, room,
+    internal_reviewer, external_reviewer) and the IDs of theses that did not fit.
+    Nothing is stored.
+    """
+    index = build_index(defenses)
+    loads = {u['id']: u.get('review_count', 0) for u in users}
+    heaps = _heaps(users, loads)
+    per_supervisor: Dict[str, int] = {}
+    for t in theses:
+        per_supervisor[t['supervisor_id']] = per_supervisor.get(t['supervisor_id'], 0) + 1
+    # Busiest supervisors first: they have the fewest slots to choose from.
+    order = sorted(theses, key=lambda t: (-per_supervisor[t['supervisor_id']], t['thesis_id']))
+    full: Set[int] = set()  # slots with every room booked
+    first_open = 0
+    placed: List[Dict] = []
+    unplaced: List[Dict] = []
+
+    def place(t: Dict, i: int, room: str, pair: Tuple[str, str]) -> Dict:
+        start, end = slots[i]
+        p = {"thesis_id": t['thesis_id'], "supervisor_id": t['supervisor_id'], "start": start, "end": end,
+             "room": room, "internal_reviewer": pair[0], "external_reviewer": pair[1], "slot": i}
+        for resource in resources(t['supervisor_id'], pair[0], pair[1], room):
+            index.add(resource, start, end, t['thesis_id'])
+        for r in pair:
+            loads[r] += 1
+        placed.append(p)
+        return p
+
+    for t in order:
+        sid = t['supervisor_id']
+        for i in range(first_open, len(slots)):
+            if i in full:
+                continue
+            start, end = slots[i]
+            if index.conflict(sid, start, end) is not None:
+                continue
+            room = free_room(index, start, end, rooms)
+            if room is None:
+                full.add(i)
+                continue
+            pair = _pick_pair(index, heaps, loads, sid, start, end)
+            if pair:
+                place(t, i, room, pair)
+                break
+        else:
+            unplaced.append(t)
+        while first_open in full:
+            first_open += 1
+
+    # Repair: a leftover thesis can take a slot where only a reviewer is missing if a
+    # defense placed above uses a candidate there and can hand its role to someone free.
+    by_thesis = {p['thesis_id']: p for p in placed}
+    pools = reviewer_pools(users)
+    still_unplaced = []
+    for t in unplaced:
+        if not _repair(t, slots, rooms, index, pools, loads, by_thesis, place):
+            still_unplaced.append(t['thesis_id'])
+
+    _balance(placed, index, heaps, loads)
+    for p in placed:
+        del p['slot']
+    return placed, still_unplaced
+
+def _swap(p: Dict, role: str, new: str, index: IntervalIndex, loads: Dict[str, int]):
+    """Give a placement's reviewer role to another person."""
+    old = p[role]
+    index.remove(old, p['thesis_id'])
+    index.add(new, p['start'], p['end'], p['thesis_id'])
+    loads[old] -= 1
+    loads[new] += 1
+    p[role] = new
+
+def _repair(t: Dict, slots: List[Tuple[str, str]], rooms: List[str], index: IntervalIndex,
+            pools: Tuple[List[str], List[str]], loads: Dict[str, int], by_thesis: Dict[str, Dict],
+            place: Callable[[Dict, int, str, Tuple[str, str]], Dict]) -> bool:
+    """Try to fit a leftover thesis by moving one reviewer role per missing reviewer."""
+    sid = t['supervisor_id']
+    for i, (start, end) in enumerate(slots):
+        if index.conflict(sid, start, end) is not None:
+            continue
+        room = free_room(index, start, end, rooms)
+        if room is None:
+            continue
+        chosen: List[str] = []
+        for pool, role in zip(pools, ("internal_reviewer", "external_reviewer")):
+            free = [r for r in pool if r != sid and r not in chosen and index.conflict(r, start, end) is None]
+            if free:
+                chosen.append(min(free, key=lambda r: (loads[r], r)))
+                continue
+            # Free a candidate by moving their role in a placed defense to a free colleague.
+            for r in pool:
+                if r == sid or r in chosen:
+                    continue
+                p = by_thesis.get(index.conflict(r, start, end) or "")
+                if p is None or p[role] != r or (p['start'], p['end']) != (start, end):
+                    continue
+                others = {p['supervisor_id'], p['internal_reviewer'], p['external_reviewer'], sid, *chosen}
+                substitute = next((s for s in pool if s not in others and index.conflict(s, start, end) is None), None)
+                if substitute:
+                    _swap(p, role, substitute, index, loads)
+                    chosen.append(r)
+                    break
+            else:
+                break
+        if len(chosen) == 2:
+            by_thesis[t['thesis_id']] = place(t, i, room, (chosen[0], chosen[1]))
+            return True
+    return False
+
+def _balance(placed: List[Dict], index: IntervalIndex, heaps: Tuple[List[Tuple[int, str]], List[Tuple[int, str]]],
+             loads: Dict[str, int]):
+    """Hand roles from busier reviewers to less loaded ones free at the same time."""
+    for p in placed:
+        for heap, role in zip(heaps, ("internal_reviewer", "external_reviewer")):
+            current = p[role]
+            taken = {p['supervisor_id'], p['internal_reviewer'], p['external_reviewer']}
+            best = _pick(heap, loads, lambda r: r not in taken and index.conflict(r, p['start'], p['end']) is None)
+            if best is not None and loads[best] + 1 < loads[current]:
+                _swap(p, role, best, index, loads)
+
+def ready_theses() -> List[Dict]:
+    """Theses waiting for a defense to be scheduled."""
+    return [t for t in load_collection("theses.json")
+            if t.get('ready_for_defense') and t.get('status') == 'Ongoing' and not t.get('defense')]
+
+def schedule_season(first_day: date, days: int, dry_run: bool = False) -> Tuple[List[Dict], List[str]]:
+    """Plan every ready thesis into the season and store it (inside a transaction unless dry_run)."""
+    placed, unplaced = plan(ready_theses(), load_collection("users.json"), load_collection("defenses.json"),
+                            season_slots(first_day, days))
+    if not dry_run:
+        for p in placed:
+            book(find_by_id("theses.json", p['thesis_id']), p['start'], p['end'], p['room'],
+                 p['internal_reviewer'], p['external_reviewer'])
+        for fn in FN_LOCKS:
+            save_collection(fn)
+    return placed, unplaced
+
+if __name__ == "__main__":
+    from transactions import transaction
+    parser = argparse.ArgumentParser(prog="scheduling.py", description="Schedule every thesis that is ready for defense.")
+    parser.add_argument("first_day", type=date.fromisoformat, help="YYYY-MM-DD")
+    parser.add_argument("--days", type=int, default=10)
+    parser.add_argument("--dry-run", action="store_true", help="print the plan without storing it")
+    args = parser.parse_args()
+    if args.dry_run:
+        placed, unplaced = schedule_season(args.first_day, args.days, dry_run=True)
+    else:
+        placed, unplaced = transaction(FN_LOCKS, lambda: schedule_season(args.first_day, args.days))
+    for p in placed:
+        print(f"{p['thesis_id']}: {p['start'].replace('T', ' ')} {p['room']} - "
+              f"reviewers {p['internal_reviewer']}, {p['external_reviewer']}")
+    for thesis_id in unplaced:
+        print(f"{thesis_id}: no free slot")
+    print(f"{len(placed)} defenses {'planned' if args.dry_run else 'scheduled'}, {len(unplaced)} did not fit.")
+    sys.exit(1 if unplaced else 0)
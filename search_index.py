@@ -0,0 +1,257 @@
+import bisect
+import heapq
+import math
+import re
+import sys
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import archive
+import journal
+import repository
+import transactions
+from data_handler import data_path, file_lock
+
+# Full-text index over thesis title, abstract and keywords.
+#
+# The persistent part is a forward index (thesis_id -> weighted term frequencies) kept as a
+# journaled collection "search_index.json": editing a thesis appends one line to its log
+# once the transaction has committed. The inverted postings are rebuilt from it in memory
+# on first use. Theses of sealed terms (archive.py) stay indexed; their entries name the
+# term, so a hit is read from that partition alone.
+#
+# Each entry also records the thesis version it was made from. Sessions that never
+# searched do not keep the index up to date; when it is loaded, every hot thesis whose
+# version differs from its entry (edited or created since) is re-indexed.
+
+INDEX_FILE = "search_index.json"
+# Weight of a term occurrence per field.
+FIELD_WEIGHTS = {"title": 3, "keywords": 2, "abstract": 1}
+# BM25 parameters.
+K1 = 1.2
+B = 0.75
+
+_ARABIC_TO_PERSIAN = {
+    "\u064a": "\u06cc",  # Arabic yeh -> Persian yeh
+    "\u0649": "\u06cc",  # alef maksura -> Persian yeh
+    "\u0643": "\u06a9",  # Arabic kaf -> keheh
+    "\u0629": "\u0647",  # teh marbuta -> heh
+    **{chr(0x06f0 + d): str(d) for d in range(10)},  # Persian digits
+    **{chr(0x0660 + d): str(d) for d in range(10)},  # Arabic-Indic digits
+}
+_ARABIC_CHARS = re.compile("[%s]" % "".join(_ARABIC_TO_PERSIAN))
+# Harakat, tatweel and zero-width joiners/non-joiners are dropped before splitting, so
+# "می‌شود" and "میشود" index the same way.
+_STRIP = re.compile("[\u064b-\u065f\u0670\u0640\u200c\u200d]")
+_TOKEN = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """Split English or Persian text into normalized lowercase terms."""
+    if not text.isascii():
+        text = _ARABIC_CHARS.sub(lambda m: _ARABIC_TO_PERSIAN[m.group()], _STRIP.sub("", text))
+    return _TOKEN.findall(text.casefold())
+
+def thesis_terms(thesis: Dict) -> Dict[str, int]:
+    """Field-weighted term frequencies of a thesis."""
+    terms: Dict[str, int] = {}
+    fields = {"title": thesis.get("title", ""), "abstract": thesis.get("abstract", ""),
+              "keywords": " ".join(thesis.get("keywords", []))}
+    for field, text in fields.items():
+        weight = FIELD_WEIGHTS[field]
+        for term, count in Counter(tokenize(text)).items():
+            terms[term] = terms.get(term, 0) + count * weight
+    return terms
+
+class InvertedIndex:
+    """In-memory inverted index with BM25 ranking, AND/OR queries and prefix terms."""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_terms: Dict[str, Dict[str, int]] = {}
+        self.doc_len: Dict[str, int] = {}
+        self.total_len = 0
+        self.vocabulary: List[str] = []  # sorted, for prefix lookups
+
+    def add(self, doc_id: str, terms: Dict[str, int]):
+        """Index (or re-index) a document from its term frequencies."""
+        self.remove(doc_id)
+        self.doc_terms[doc_id] = terms
+        self.doc_len[doc_id] = length = sum(terms.values())
+        self.total_len += length
+        for term, tf in terms.items():
+            if term not in self.postings:
+                self.postings[term] = {}
+                bisect.insort(self.vocabulary, term)
+            self.postings[term][doc_id] = tf
+
+    def remove(self, doc_id: str):
+        """Drop a document from the index."""
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self.total_len -= self.doc_len.pop(doc_id)
+        for term in terms:
+            docs = self.postings[term]
+            docs.pop(doc_id, None)
+            if not docs:
+                del self.postings[term]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, term)]
+
+    def expand(self, term: str, prefix: bool) -> List[str]:
+        """Indexed terms matching term exactly, or starting with it if prefix is set."""
+        if not prefix:
+            return [term] if term in self.postings else []
+        lo = bisect.bisect_left(self.vocabulary, term)
+        hi = bisect.bisect_left(self.vocabulary, term + "\uffff")
+        return self.vocabulary[lo:hi]
+
+    def _term_scores(self, terms: Iterable[str]) -> Dict[str, float]:
+        """BM25 contribution of a group of (expanded) terms to every document containing one."""
+        n = len(self.doc_len)
+        # BM25 length normalization K1 * (1 - B + B * len / avg_len), split into constants.
+        base = K1 * (1 - B)
+        per_len = K1 * B * n / self.total_len if self.total_len else 0.0
+        doc_len = self.doc_len
+        scores: Dict[str, float] = {}
+        for term in terms:
+            docs = self.postings[term]
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                score = idf * tf * (K1 + 1) / (tf + base + per_len * doc_len[doc_id])
+                scores[doc_id] = scores.get(doc_id, 0.0) + score
+        return scores
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[float, str]]:
+        """Return the top-k (score, doc_id) pairs for a query.
+
+        Terms are ANDed unless the query contains the word OR; a term ending in "*" matches
+        every indexed term starting with it.
+        """
+        words = query.split()
+        use_or = any(w == "OR" for w in words)
+        groups = []
+        for word in words:
+            if word == "OR":
+                continue
+            prefix = word.endswith("*")
+            for token in tokenize(word):
+                groups.append(self.expand(token, prefix))
+        if not groups:
+            return []
+        group_scores = sorted((self._term_scores(g) for g in groups), key=len)
+        if use_or:
+            candidates: Set[str] = set().union(*group_scores)
+        else:
+            candidates = set(group_scores[0])
+            for scores in group_scores[1:]:
+                candidates &= scores.keys()
+        ranked = ((sum(s.get(d, 0.0) for s in group_scores), d) for d in candidates)
+        return heapq.nlargest(k, ranked)
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Persistent thesis index
+# ----------------------------------------------------------------------------------------------------------------------
+
+_index: Optional[InvertedIndex] = None
+# thesis_id -> term of the sealed partition holding it.
+_sealed: Dict[str, str] = {}
+# thesis_id -> version of the thesis its entry was made from.
+_versions: Dict[str, int] = {}
+
+def _doc(thesis_id: str, terms: Dict[str, int]) -> Dict:
+    """Stored form of a thesis's index entry."""
+    doc = {"thesis_id": thesis_id, "terms": terms, "version": _versions.get(thesis_id, 0)}
+    if thesis_id in _sealed:
+        doc["partition"] = _sealed[thesis_id]
+    return doc
+
+def rebuild() -> InvertedIndex:
+    """Re-index every thesis and replace the stored index."""
+    global _index
+    _index = InvertedIndex()
+    _sealed.clear()
+    _versions.clear()
+    docs = []
+    for t in repository.load_collection("theses.json"):
+        terms = thesis_terms(t)
+        _index.add(t["thesis_id"], terms)
+        _versions[t["thesis_id"]] = t.get("version", 0)
+        docs.append(_doc(t["thesis_id"], terms))
+    for t in archive.iter_records("theses.json", sealed_only=True):
+        terms = thesis_terms(t)
+        _index.add(t["thesis_id"], terms)
+        _sealed[t["thesis_id"]] = archive.record_term(t)
+        _versions[t["thesis_id"]] = t.get("version", 0)
+        docs.append(_doc(t["thesis_id"], terms))
+    with file_lock([INDEX_FILE]):
+        transactions.compact(INDEX_FILE, docs)
+    return _index
+
+def get_index() -> InvertedIndex:
+    """Load the stored index (building it on first use)."""
+    global _index
+    if _index is None:
+        if not data_path(INDEX_FILE).exists():
+            return rebuild()
+        _index = InvertedIndex()
+        _sealed.clear()
+        _versions.clear()
+        transactions.roll_forward(INDEX_FILE)
+        for doc in journal.load(INDEX_FILE, "thesis_id"):
+            _index.add(doc["thesis_id"], doc["terms"])
+            _versions[doc["thesis_id"]] = doc.get("version")
+            if doc.get("partition"):
+                _sealed[doc["thesis_id"]] = doc["partition"]
+        # Theses created or edited while no index was loaded.
+        hot = repository.load_collection("theses.json")
+        _store([(t["thesis_id"], t.get("version", 0), thesis_terms(t)) for t in hot
+                if _versions.get(t["thesis_id"]) != t.get("version", 0)])
+        if len(_index.doc_len) != len(hot) + archive.count("theses.json"):
+            return rebuild()
+    return _index
+
+def _store(entries: List[Tuple[str, int, Dict[str, int]]]):
+    """Put (thesis_id, version, terms) entries of hot theses in the loaded index and append them to the stored one."""
+    changed = False
+    for thesis_id, version, terms in entries:
+        _sealed.pop(thesis_id, None)  # only hot theses change
+        if _versions.get(thesis_id) == version and _index.doc_terms.get(thesis_id) == terms:
+            continue
+        _index.add(thesis_id, terms)
+        _versions[thesis_id] = version
+        journal.mark_dirty(INDEX_FILE, thesis_id, _doc(thesis_id, terms))
+        changed = True
+    if not changed:
+        return
+    with file_lock([INDEX_FILE]):
+        journal.flush(INDEX_FILE)
+        if journal.needs_compaction(INDEX_FILE):
+            transactions.compact(INDEX_FILE, [_doc(d, t) for d, t in _index.doc_terms.items()])
+
+def index_thesis(thesis: Dict):
+    """Re-index one thesis, if the index is loaded (otherwise it catches up when it is)."""
+    if _index is not None:
+        _store([(thesis["thesis_id"], thesis.get("version", 0), thesis_terms(thesis))])
+
+def search(query: str, k: int = 20) -> List[Dict]:
+    """Top-k theses for a query, best match first."""
+    results = []
+    for _, thesis_id in get_index().search(query, k):
+        thesis = archive.find("theses.json", thesis_id, _sealed.get(thesis_id))
+        if thesis is not None:
+            results.append(thesis)
+    return results
+
+def _on_record_change(fn: str, record: Dict):
+    """repository hook: re-index a created or edited thesis once its transaction commits."""
+    if fn == "theses.json" and _index is not None:
+        entry = (record["thesis_id"], record.get("version", 0), thesis_terms(record))
+        repository.after_commit(lambda: _index is not None and _store([entry]))
+
+repository.register_change_hook(_on_record_change)
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["rebuild"]:
+        print(f"Indexed {len(rebuild().doc_len)} theses.")
+    else:
+        for t in search(" ".join(sys.argv[1:])):
+            print(f"{t['thesis_id']}: {t.get('title', '')}")
@@ -0,0 +1,171 @@
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from data_handler import DATA_DIR, file_lock, write_json_file
+
+# Opt-in login sessions (THESIS_SESSIONS=1). A successful password login issues a signed
+# token, "<user id>.<expiry>.<session id>.<HMAC-SHA256 signature>", which the CLI keeps in
+# TOKEN_FILE; logging in again as the same user with a valid token skips bcrypt.
+#
+# The server side lives in SESSION_FILE: one entry per session, ordered from least to most
+# recently used, so the oldest are evicted once there are more than MAX_SESSIONS. Each
+# entry holds a fingerprint of the user's password hash; a session stops being valid when
+# the password changes, and store_password_hash also revokes it at once.
+#
+# Every revocation also replaces REVOKED_FILE, so a server that caches validated tokens
+# (api_server.py) can see with one stat() that it must check them again.
+
+SESSION_FILE = "sessions.json"
+REVOKED_FILE = SESSION_FILE + ".revoked"
+KEY_FILE = "session.key"
+TOKEN_FILE = Path(os.environ.get("THESIS_TOKEN_FILE", Path.home() / ".thesis_token"))
+SESSION_TTL = int(os.environ.get("THESIS_SESSION_TTL", "3600"))
+MAX_SESSIONS = int(os.environ.get("THESIS_MAX_SESSIONS", "100"))
+
+_key: Optional[bytes] = None
+
+def enabled() -> bool:
+    """Whether login sessions are switched on."""
+    return os.environ.get("THESIS_SESSIONS", "") == "1"
+
+def _secret() -> bytes:
+    """The signing key, created (readable by the owner only) on first use."""
+    global _key
+    if _key is None:
+        path = DATA_DIR / KEY_FILE
+        with file_lock([KEY_FILE]):
+            if not path.exists():
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(secrets.token_hex(32))
+            _key = bytes.fromhex(path.read_text(encoding='utf-8').strip())
+    return _key
+
+def _sign(text: str) -> str:
+    return hmac.new(_secret(), text.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def _fingerprint(user: Dict) -> str:
+    return _sign("password:" + user.get('password_hash', ''))[:16]
+
+def _read() -> Dict[str, Dict]:
+    try:
+        with open(DATA_DIR / SESSION_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _write(sessions: Dict[str, Dict]):
+    tmp = DATA_DIR / (SESSION_FILE + ".tmp")
+    write_json_file(tmp, sessions)
+    os.replace(tmp, DATA_DIR / SESSION_FILE)
+
+def _prune(sessions: Dict[str, Dict], now: float):
+    """Drop expired sessions, then the least recently used beyond MAX_SESSIONS."""
+    for session_id in [s for s, entry in sessions.items() if entry['expires'] <= now]:
+        del sessions[session_id]
+    while len(sessions) > MAX_SESSIONS:
+        del sessions[next(iter(sessions))]
+
+def issue(user: Dict) -> str:
+    """Start a session for a user who just logged in with their password; return its token."""
+    now = time.time()
+    expires = int(now + SESSION_TTL)
+    session_id = secrets.token_urlsafe(16)
+    with file_lock([SESSION_FILE]):
+        sessions = _read()
+        sessions[session_id] = {"user_id": user['id'], "expires": expires, "last_used": int(now),
+                                "fingerprint": _fingerprint(user)}
+        _prune(sessions, now)
+        _write(sessions)
+    payload = f"{user['id']}.{expires}.{session_id}"
+    return f"{payload}.{_sign(payload)}"
+
+def validate(token: str) -> Optional[Dict]:
+    """The user a token belongs to, or None if it is forged, expired or revoked."""
+    try:
+        user_id, expires, session_id, signature = token.rsplit(".", 3)
+        expires_at = int(expires)
+    except ValueError:
+        return None
+    now = time.time()
+    if expires_at <= now or not hmac.compare_digest(signature, _sign(f"{user_id}.{expires}.{session_id}")):
+        return None
+    from repository import find_by_id
+    user = find_by_id("users.json", user_id)
+    with file_lock([SESSION_FILE]):
+        sessions = _read()
+        entry = sessions.pop(session_id, None)
+        valid = entry is not None and entry['user_id'] == user_id and user is not None \
+            and hmac.compare_digest(entry['fingerprint'], _fingerprint(user))
+        if valid:
+            entry['last_used'] = int(now)
+            sessions[session_id] = entry  # move to the most recently used end
+        _prune(sessions, now)
+        _write(sessions)
+    return user if valid else None
+
+def _mark_revoked():
+    tmp = DATA_DIR / (REVOKED_FILE + ".tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(str(time.time_ns()))
+    os.replace(tmp, DATA_DIR / REVOKED_FILE)
+
+def revocation_stamp() -> Optional[Tuple[int, int]]:
+    """A value that changes whenever a session is revoked (None if none ever was)."""
+    try:
+        st = os.stat(DATA_DIR / REVOKED_FILE)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_ino
+
+def revoke(token: str):
+    """End the session of a token."""
+    session_id = token.rsplit(".", 3)[-2] if token.count(".") >= 3 else ""
+    with file_lock([SESSION_FILE]):
+        sessions = _read()
+        if sessions.pop(session_id, None) is not None:
+            _write(sessions)
+            _mark_revoked()
+
+def revoke_user(user_id: str):
+    """End every session of a user, e.g. after a password change."""
+    if not (DATA_DIR / SESSION_FILE).exists():
+        return
+    with file_lock([SESSION_FILE]):
+        sessions = _read()
+        kept = {s: entry for s, entry in sessions.items() if entry['user_id'] != user_id}
+        if len(kept) != len(sessions):
+            _write(kept)
+            _mark_revoked()
+
+def load_client_token() -> Optional[str]:
+    """The token saved by the last login on this account, if any."""
+    try:
+        return TOKEN_FILE.read_text(encoding='utf-8').strip() or None
+    except OSError:
+        return None
+
+def save_client_token(token: str):
+    """Remember a token for the next login (readable by the owner only)."""
+    fd = os.open(TOKEN_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(token)
+
+def clear_client_token():
+    """Forget the saved token."""
+    try:
+        TOKEN_FILE.unlink()
+    except FileNotFoundError:
+        pass
+
+def resume(user_id: str) -> Optional[Dict]:
+    """The user, if the saved token is a valid session of theirs."""
+    token = load_client_token()
+    if not token or not token.startswith(user_id + "."):
+        return None
+    return validate(token)
@@ -0,0 +1,312 @@
+import json
+import os
+import sqlite3
+import sys
+import textwrap
+from pathlib import Path
+from typing import Dict, Hashable, Iterator, List, Optional, Sequence
+import metrics
+from data_handler import DATA_DIR, file_lock
+
+# SQLite storage (THESIS_STORAGE_MODE=sqlite). Each collection is a table holding the
+# fields used for lookups as indexed columns, plus the full record as JSON in "doc".
+# Request history lives in its own child table.
+
+DB_PATH = Path(os.environ.get("THESIS_DB", DATA_DIR / "thesis.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY, type TEXT, name TEXT, doc TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS users_type ON users(type);
+
+CREATE TABLE IF NOT EXISTS courses (
+    course_id TEXT PRIMARY KEY, supervisor_id TEXT, year INTEGER, semester TEXT, doc TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS courses_supervisor ON courses(supervisor_id);
+CREATE INDEX IF NOT EXISTS courses_term ON courses(year, semester);
+
+CREATE TABLE IF NOT EXISTS requests (
+    request_id TEXT PRIMARY KEY, student_id TEXT, course_id TEXT, status TEXT, date_submitted TEXT,
+    doc TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS requests_student ON requests(student_id);
+CREATE INDEX IF NOT EXISTS requests_course_status ON requests(course_id, status);
+
+CREATE TABLE IF NOT EXISTS request_history (
+    request_id TEXT NOT NULL, seq INTEGER NOT NULL, status TEXT, date TEXT, note TEXT,
+    PRIMARY KEY (request_id, seq)) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS theses (
+    thesis_id TEXT PRIMARY KEY, student_id TEXT, course_id TEXT, supervisor_id TEXT, status TEXT,
+    ready_for_defense INTEGER, internal_reviewer TEXT, external_reviewer TEXT, doc TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS theses_student ON theses(student_id);
+CREATE INDEX IF NOT EXISTS theses_course ON theses(course_id);
+CREATE INDEX IF NOT EXISTS theses_supervisor ON theses(supervisor_id, ready_for_defense);
+CREATE INDEX IF NOT EXISTS theses_internal ON theses(internal_reviewer);
+CREATE INDEX IF NOT EXISTS theses_external ON theses(external_reviewer);
+
+CREATE TABLE IF NOT EXISTS defenses (
+    defense_id TEXT PRIMARY KEY, thesis_id TEXT, date TEXT, doc TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS defenses_thesis ON defenses(thesis_id);
+CREATE INDEX IF NOT EXISTS defenses_date ON defenses(date);
+"""
+
+def _defense(r: Dict) -> Dict:
+    return r.get("defense") or {}
+
+# fn -> (table, primary key, {column: function extracting it from a record})
+TABLES = {
+    "users.json": ("users", "id", {
+        "type": lambda r: r.get("type"),
+        "name": lambda r: r.get("name"),
+    }),
+    "courses.json": ("courses", "course_id", {
+        "supervisor_id": lambda r: r.get("supervisor_id"),
+        "year": lambda r: r.get("year"),
+        "semester": lambda r: r.get("semester"),
+    }),
+    "requests.json": ("requests", "request_id", {
+        "student_id": lambda r: r.get("student_id"),
+        "course_id": lambda r: r.get("course_id"),
+        "status": lambda r: r.get("status"),
+        "date_submitted": lambda r: r.get("date_submitted"),
+    }),
+    "theses.json": ("theses", "thesis_id", {
+        "student_id": lambda r: r.get("student_id"),
+        "course_id": lambda r: r.get("course_id"),
+        "supervisor_id": lambda r: r.get("supervisor_id"),
+        "status": lambda r: r.get("status"),
+        "ready_for_defense": lambda r: int(bool(r.get("ready_for_defense"))),
+        "internal_reviewer": lambda r: _defense(r).get("internal_reviewer"),
+        "external_reviewer": lambda r: _defense(r).get("external_reviewer"),
+    }),
+    "defenses.json": ("defenses", "defense_id", {
+        "thesis_id": lambda r: r.get("thesis_id"),
+        "date": lambda r: r.get("date"),
+    }),
+}
+
+# Secondary index name (as used by repository.find_by_index) -> (SQL selecting the
+# matching rows, number of key parts).
+INDEX_QUERIES = {
+    "requests.json": {
+        "student_id": ("SELECT * FROM requests WHERE student_id = ? ORDER BY rowid", 1),
+        "course_id": ("SELECT * FROM requests WHERE course_id = ? ORDER BY rowid", 1),
+        "supervisor_status": ("SELECT r.* FROM requests r JOIN courses c ON c.course_id = r.course_id "
+                              "WHERE c.supervisor_id = ? AND r.status = ? ORDER BY r.rowid", 2),
+    },
+    "theses.json": {
+        "student_id": ("SELECT * FROM theses WHERE student_id = ? ORDER BY rowid", 1),
+        "course_id": ("SELECT * FROM theses WHERE course_id = ? ORDER BY rowid", 1),
+        "supervisor_id": ("SELECT * FROM theses WHERE supervisor_id = ? ORDER BY rowid", 1),
+        "reviewer": ("SELECT * FROM theses WHERE internal_reviewer = ?1 OR external_reviewer = ?1 ORDER BY rowid", 1),
+    },
+    "courses.json": {
+        "supervisor_id": ("SELECT * FROM courses WHERE supervisor_id = ? ORDER BY rowid", 1),
+    },
+    "defenses.json": {
+        "date": ("SELECT * FROM defenses WHERE date = ? ORDER BY rowid", 1),
+    },
+}
+
+_conn: Optional[sqlite3.Connection] = None
+
+def connect(seed: bool = True) -> sqlite3.Connection:
+    """Open (once) the database in WAL mode; a new database is seeded from the JSON files."""
+    global _conn
+    if _conn is None:
+        # Locked so that concurrent first sessions neither seed twice nor see it half done.
+        with file_lock([DB_PATH.name]):
+            is_new = not DB_PATH.exists()
+            conn = sqlite3.connect(DB_PATH)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            if is_new and seed:
+                migrate(DATA_DIR, conn)
+        _conn = conn
+    return _conn
+
+def close():
+    """Close the shared connection."""
+    global _conn
+    if _conn is not None:
+        _conn.close()
+        _conn = None
+
+def _row_values(fn: str, record: Dict) -> List:
+    """Column values of a record, in table column order, ending with the JSON doc."""
+    _, pk, columns = TABLES[fn]
+    doc = {k: v for k, v in record.items() if not (fn == "requests.json" and k == "history")}
+    return [record[pk]] + [get(record) for get in columns.values()] + [json.dumps(doc, ensure_ascii=False)]
+
+def _upsert_sql(fn: str) -> str:
+    table, pk, columns = TABLES[fn]
+    names = [pk] + list(columns) + ["doc"]
+    updates = ", ".join(f"{c} = excluded.{c}" for c in names[1:])
+    return (f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+            f"ON CONFLICT({pk}) DO UPDATE SET {updates}")
+
+def _attach_history(conn: sqlite3.Connection, records: List[Dict]):
+    """Fill in the history list of request records from the child table."""
+    by_id = {r["request_id"]: r for r in records}
+    for r in records:
+        r["history"] = []
+    ids = list(by_id)
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        rows = conn.execute(f"SELECT * FROM request_history WHERE request_id IN ({', '.join('?' * len(chunk))}) "
+                            "ORDER BY request_id, seq", chunk)
+        for h in rows:
+            entry = {"status": h["status"], "date": h["date"]}
+            if h["note"] is not None:
+                entry["note"] = h["note"]
+            by_id[h["request_id"]]["history"].append(entry)
+
+def _records(fn: str, rows: Sequence[sqlite3.Row]) -> List[Dict]:
+    records = [json.loads(row["doc"]) for row in rows]
+    if metrics.ENABLED:
+        metrics.count("json_parsed", len(records))
+    if fn == "requests.json":
+        _attach_history(connect(), records)
+    return records
+
+def load_all(fn: str) -> List[Dict]:
+    """All records of a collection, in insertion order."""
+    table = TABLES[fn][0]
+    return _records(fn, connect().execute(f"SELECT * FROM {table} ORDER BY rowid").fetchall())
+
+def find_by_id(fn: str, record_id: str) -> Optional[Dict]:
+    """Primary-key lookup."""
+    table, pk, _ = TABLES[fn]
+    rows = connect().execute(f"SELECT * FROM {table} WHERE {pk} = ?", (record_id,)).fetchall()
+    records = _records(fn, rows)
+    return records[0] if records else None
+
+def find_by_index(fn: str, index: str, key: Hashable) -> List[Dict]:
+    """Indexed equivalent of repository.find_by_index."""
+    sql, arity = INDEX_QUERIES[fn][index]
+    params = tuple(key) if arity > 1 else (key,)
+    return _records(fn, connect().execute(sql, params).fetchall())
+
+def put(fn: str, record: Dict, conn: Optional[sqlite3.Connection] = None):
+    """Insert or update a record inside the current transaction (see commit)."""
+    conn = conn or connect()
+    conn.execute(_upsert_sql(fn), _row_values(fn, record))
+    if fn == "requests.json":
+        history = record.get("history", [])
+        rid = record["request_id"]
+        stored = conn.execute("SELECT COUNT(*) FROM request_history WHERE request_id = ?", (rid,)).fetchone()[0]
+        if stored > len(history):
+            conn.execute("DELETE FROM request_history WHERE request_id = ?", (rid,))
+            stored = 0
+        conn.executemany("INSERT OR REPLACE INTO request_history VALUES (?, ?, ?, ?, ?)",
+                         [(rid, seq, h.get("status"), h.get("date"), h.get("note"))
+                          for seq, h in enumerate(history) if seq >= stored])
+
+def replace_all(fn: str, records: List[Dict], commit: bool = True):
+    """Replace a whole collection with records (and commit, unless told not to)."""
+    conn = connect()
+    conn.execute(f"DELETE FROM {TABLES[fn][0]}")
+    if fn == "requests.json":
+        conn.execute("DELETE FROM request_history")
+    for r in records:
+        put(fn, r, conn)
+    if commit:
+        conn.commit()
+
+def commit():
+    """Commit the records written with put since the last commit."""
+    connect().commit()
+
+def begin():
+    """Start a write transaction, taking the database write lock right away."""
+    conn = connect()
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+
+def rollback():
+    """Discard everything written since the last commit."""
+    connect().rollback()
+
+def integrity_problems() -> List[str]:
+    """Run SQLite's integrity check; return its complaints."""
+    rows = connect().execute("PRAGMA integrity_check").fetchall()
+    return [row[0] for row in rows if row[0] != "ok"]
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Migration and export
+# ----------------------------------------------------------------------------------------------------------------------
+
+def iter_json_array(path: Path, chunk_size: int = 1 << 16) -> Iterator[Dict]:
+    """Yield the elements of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buf = f.read(chunk_size).lstrip()
+        if not buf.startswith("["):
+            raise ValueError(f"{path.name} is not a JSON array")
+        buf = buf[1:]
+        eof = False
+        while True:
+            buf = buf.lstrip().lstrip(",").lstrip()
+            if buf.startswith("]"):
+                return
+            try:
+                item, end = decoder.raw_decode(buf)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = f.read(chunk_size)
+                eof = not more
+                buf += more
+                continue
+            yield item
+            buf = buf[end:]
+
+def migrate(src_dir: Path = DATA_DIR, conn: Optional[sqlite3.Connection] = None, batch: int = 1000) -> Dict[str, int]:
+    """Stream every JSON collection in src_dir into the database; return record counts."""
+    conn = conn or connect(seed=False)
+    counts = {}
+    for fn in TABLES:
+        path = src_dir / fn
+        if not path.exists():
+            continue
+        n = 0
+        for record in iter_json_array(path):
+            put(fn, record, conn)
+            n += 1
+            if n % batch == 0:
+                conn.commit()
+        conn.commit()
+        counts[fn] = n
+    return counts
+
+def export(dst_dir: Path = DATA_DIR) -> Dict[str, int]:
+    """Write every table back as a JSON file formatted exactly like save_json."""
+    conn = connect()
+    counts = {}
+    for fn, (table, _, _) in TABLES.items():
+        n = 0
+        tmp = dst_dir / (fn + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            cursor = conn.execute(f"SELECT * FROM {table} ORDER BY rowid")
+            while True:
+                rows = cursor.fetchmany(500)
+                if not rows:
+                    break
+                for record in _records(fn, rows):
+                    f.write("[\n" if n == 0 else ",\n")
+                    f.write(textwrap.indent(json.dumps(record, ensure_ascii=False, indent=2), "  "))
+                    n += 1
+            f.write("\n]" if n else "[]")
+        os.replace(tmp, dst_dir / fn)
+        counts[fn] = n
+    return counts
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("migrate", "export"):
+        print("Usage: python sqlite_backend.py migrate|export [directory]")
+        sys.exit(1)
+    directory = Path(sys.argv[2]) if len(sys.argv) > 2 else DATA_DIR
+    action = migrate if sys.argv[1] == "migrate" else export
+    for name, count in action(directory).items():
+        print(f"{name}: {count} records")
@@ -0,0 +1,288 @@
+import json
+import os
+import random
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, TypeVar
+import data_handler
+import journal
+import repository
+import sqlite_backend
+from data_handler import DATA_DIR, collection_file, data_path, file_lock, write_collection_file, write_json_file
+
+# Multi-session safety. A transaction locks the collections it touches (exclusive fcntl
+# locks, in sorted order), re-reads any that changed on disk, runs an action that reads
+# and changes records through the repository, and then commits every saved collection
+# together:
+#
+#   1. check that no collection changed since it was read (compare-and-swap on its stamp),
+#   2. write new snapshot files as "<fn>.<token>.txn" / encode new journal lines, and
+#      stage any other files saved with repository.save_file the same way,
+#   3. write an intent record ("commit.pending.<token>") naming all of them and fsync it,
+#   4. apply it (rename snapshots and files into place / append journal lines), then delete it.
+#
+# The token (process ID and a random part) is new for every commit, so transactions that
+# lock different collections never touch each other's files. A crash after step 3 is
+# rolled forward by recover() before the next transaction on any of its collections;
+# before it, nothing was changed. A commit in progress is never mistaken for a crashed
+# one: its owner holds the locks of every collection it names until it has deleted the
+# intent, and recover() takes those same locks first.
+
+COMMIT_FILE = "commit.pending"
+TXN_SUFFIX = ".txn"
+RETRIES = 5
+
+T = TypeVar("T")
+
+class TransactionAborted(Exception):
+    """Raised inside a transaction to discard its changes; the message is shown to the user."""
+
+class ConflictError(TransactionAborted):
+    """A record or collection was changed by another session."""
+
+class _StaleWrite(Exception):
+    """A collection changed on disk between reading and committing; the action is retried."""
+
+def expect_version(record: Dict, version: int, what: str):
+    """Abort unless a record still has the version the caller saw."""
+    if record.get("version", 0) != version:
+        raise ConflictError(f"{what} was changed by another session. Please try again.")
+
+def _txn_path(fn: str, token: Optional[str]) -> Path:
+    """The new snapshot of fn written by the commit with this token (None: an intent from before tokens)."""
+    return DATA_DIR / (f"{fn}.{token}{TXN_SUFFIX}" if token else fn + TXN_SUFFIX)
+
+def _staged_path(name: str, token: str) -> Path:
+    """Where the commit with this token stages a file saved with repository.save_file."""
+    return _txn_path(name.replace("/", "."), token)
+
+def _apply(intent: Dict[str, Any]):
+    """Carry out a commit intent; safe to repeat."""
+    for fn in intent["replace"]:
+        txn = _txn_path(fn, intent.get("token"))
+        if txn.exists():
+            os.replace(txn, data_path(fn))
+        if intent["mode"] == "journal":
+            journal.truncate(fn)
+    for fn, lines in intent["append"].items():
+        journal.append(fn, lines.encode('utf-8'))
+    for name in intent.get("files", ()):
+        staged = _staged_path(name, intent["token"])
+        if staged.exists():
+            os.replace(staged, DATA_DIR / name)
+
+def _intent_paths() -> List[Path]:
+    return sorted(p for p in DATA_DIR.glob(COMMIT_FILE + "*") if not p.name.endswith(".tmp"))
+
+def _read_intent(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        # The crash hit while the intent itself was written: nothing was applied yet.
+        return {"replace": [], "append": {}, "token": path.name[len(COMMIT_FILE) + 1:] or None}
+
+def _touched(intent: Dict[str, Any]) -> List[str]:
+    return list(intent["replace"]) + list(intent["append"])
+
+def _dead(token: str) -> bool:
+    """Whether the process that made a commit token has exited (POSIX only; elsewhere assume not)."""
+    try:
+        pid = int(token.split("-")[0])
+    except ValueError:
+        return False
+    if os.name != "posix":
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        return False
+    return False
+
+def interrupted(fns: Iterable[str]) -> bool:
+    """Whether an interrupted commit that wrote any of fns is waiting to be rolled forward."""
+    fns = set(fns)
+    return any(intent is not None and fns & set(_touched(intent))
+               for intent in map(_read_intent, _intent_paths()))
+
+def recover(fns: Optional[Iterable[str]] = None):
+    """Roll forward commits interrupted by a crash that wrote any of fns (default: any collection).
+
+    Takes the locks of every collection such a commit wrote, so call it before taking
+    other locks, or with all of them held.
+    """
+    wanted = set(fns) if fns is not None else None
+    for path in _intent_paths():
+        intent = _read_intent(path)
+        if intent is None or (wanted is not None and _touched(intent) and not wanted & set(_touched(intent))):
+            continue
+        with file_lock(_touched(intent)):
+            # Gone if its owner finished it while we waited for the locks.
+            intent = _read_intent(path)
+            if intent is None:
+                continue
+            if _touched(intent) or intent.get("files"):
+                _apply(intent)
+                print("Warning: completed an interrupted commit.")
+            for fn in intent["replace"]:
+                _txn_path(fn, intent.get("token")).unlink(missing_ok=True)
+            for name in intent.get("files", ()):
+                _staged_path(name, intent["token"]).unlink(missing_ok=True)
+            path.unlink()
+            for fn in _touched(intent):
+                repository.invalidate(fn)
+    # Snapshots and intents of commits whose process died before writing the intent.
+    pending = {p.name[len(COMMIT_FILE) + 1:] for p in _intent_paths()}
+    for stray in list(DATA_DIR.glob("*" + TXN_SUFFIX)) + list(DATA_DIR.glob(COMMIT_FILE + ".*.tmp")):
+        token = stray.name[:-len(TXN_SUFFIX)].rsplit(".", 1)[-1] if stray.name.endswith(TXN_SUFFIX) \
+            else stray.name[len(COMMIT_FILE) + 1:-len(".tmp")]
+        if token not in pending and _dead(token):
+            stray.unlink(missing_ok=True)
+
+def _commit(txn: Dict[str, Any]):
+    """Write all collections saved in a transaction, all or none."""
+    saved = txn["saved"]
+    for fn in saved:
+        if repository.is_stale(fn):
+            raise _StaleWrite(fn)
+    journal_mode = data_handler.STORAGE_MODE == "journal"
+    append: Dict[str, str] = {}
+    snapshots: Dict[str, List[Dict]] = {}
+    for fn in saved:
+        if journal_mode and fn in repository.PRIMARY_KEYS and fn not in txn["replaced"] \
+                and not journal.needs_compaction(fn):
+            append[fn] = journal.take_dirty(fn).decode('utf-8')
+        else:
+            snapshots[fn] = repository.load_collection(fn)
+    _carry_out(data_handler.STORAGE_MODE, snapshots, append, txn["files"])
+    for fn in saved:
+        repository.refresh_stamp(fn)
+
+def _carry_out(mode: str, snapshots: Dict[str, List[Dict]], append: Dict[str, str],
+               files: Optional[Dict[str, Any]] = None):
+    """Write new snapshots, staged files and an intent naming them and the journal lines, then apply it."""
+    token = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+    intent: Dict[str, Any] = {"mode": mode, "token": token, "replace": [], "append": append, "files": []}
+    path = DATA_DIR / f"{COMMIT_FILE}.{token}"
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        for fn, records in snapshots.items():
+            intent["replace"].append(fn)
+            write_collection_file(_txn_path(fn, token), collection_file(fn), records)
+        for name, data in (files or {}).items():
+            intent["files"].append(name)
+            write_json_file(_staged_path(name, token), data)
+        if not intent["replace"] and not any(append.values()) and not intent["files"]:
+            return
+        write_json_file(tmp, intent)
+        os.replace(tmp, path)
+    except BaseException:
+        for fn in intent["replace"]:
+            _txn_path(fn, token).unlink(missing_ok=True)
+        for name in intent["files"]:
+            _staged_path(name, token).unlink(missing_ok=True)
+        tmp.unlink(missing_ok=True)
+        raise
+    _apply(intent)
+    os.unlink(path)
+
+def compact(fn: str, records: List[Dict]):
+    """Write records as the new snapshot of a journaled file and empty its log; fn must be locked.
+
+    Done as a commit intent: were the log emptied after the snapshot was replaced, a crash
+    in between would replay the old log over the new snapshot, bringing back old versions
+    of records and records the snapshot dropped. The search index is journaled in every
+    storage mode, hence mode "journal" here.
+    """
+    _carry_out("journal", {fn: records}, {})
+
+def roll_forward(fn: str):
+    """Complete an interrupted commit that wrote fn before fn is read from disk.
+
+    Skipped while this process holds locks, which recover() could take out of order; a
+    transaction has already recovered the collections it locked.
+    """
+    if not data_handler.holding_locks() and interrupted([fn]):
+        recover([fn])
+
+def _rollback(fns: List[str]):
+    """Forget in-memory changes made by a failed transaction."""
+    for fn in fns:
+        repository.invalidate(fn)
+        journal.discard_dirty(fn)
+
+def _sqlite_transaction(action: Callable[[], T], retries: int) -> T:
+    """SQLite transactions: BEGIN IMMEDIATE ... COMMIT, retried while the database is busy."""
+    for attempt in range(retries):
+        try:
+            sqlite_backend.begin()
+            repository.begin_transaction(list(repository.PRIMARY_KEYS))
+            try:
+                result = action()
+            finally:
+                txn = repository.end_transaction()
+            # No commit intent here: the files go first, so a crash before COMMIT can
+            # leave them ahead of the database, never behind it.
+            for name, data in txn["files"].items():
+                repository.save_file(name, data)
+            sqlite_backend.commit()
+            for callback in txn["after_commit"]:
+                callback()
+            return result
+        except sqlite3.OperationalError as e:
+            sqlite_backend.rollback()
+            if "locked" not in str(e) and "busy" not in str(e):
+                raise
+            time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+        except BaseException:
+            sqlite_backend.rollback()
+            raise
+    raise ConflictError("The database is busy. Please try again.")
+
+def transaction(fns: List[str], action: Callable[[], T], retries: int = RETRIES) -> T:
+    """Run action with fns locked and commit every collection it saves atomically.
+
+    The action must fetch the records it changes itself (they are re-read if another
+    session wrote them) and raise TransactionAborted to give up without writing.
+    Callbacks it registers with repository.after_commit run once the commit is done.
+    """
+    if data_handler.STORAGE_MODE == "sqlite":
+        return _sqlite_transaction(action, retries)
+    for attempt in range(retries):
+        recover(fns)
+        with file_lock(fns):
+            if interrupted(fns):
+                # A session crashed mid-commit after recover(); roll it forward first.
+                continue
+            for fn in fns:
+                if repository.is_stale(fn):
+                    repository.invalidate(fn)
+            repository.begin_transaction(fns)
+            try:
+                result = action()
+            except BaseException:
+                repository.end_transaction()
+                _rollback(fns)
+                raise
+            txn = repository.end_transaction()
+            try:
+                _commit(txn)
+                committed = True
+            except _StaleWrite:
+                _rollback(fns)
+                committed = False
+            except BaseException:
+                _rollback(fns)
+                raise
+        # After the locks are released: callbacks may take locks of their own.
+        if committed:
+            for callback in txn["after_commit"]:
+                callback()
+            return result
+        time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+    raise ConflictError("The data was changed by another session. Please try again.")
@@ -1,37 +1,65 @@
-import bcrypt
-from data_handler import load_json, save_json
+import os
+import metrics
 from typing import Dict, Optional
 
-def hash_password(password: str) -> str:
+# bcrypt cost factor for new hashes. Stored hashes with a lower cost are re-hashed at the
+# user's next successful login.
+BCRYPT_ROUNDS = int(os.environ.get("THESIS_BCRYPT_ROUNDS", "12"))
+
+@metrics.timed("hash_password")
+def hash_password(password: str, rounds: Optional[int] = None) -> str:
     """Hashes a password using bcrypt."""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    import bcrypt  # imported on first use, to keep startup light
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds or BCRYPT_ROUNDS)).decode('utf-8')
 
+@metrics.timed("check_password")
 def check_password(password: str, hashed_password: str) -> bool:
     """Checks a password against a hashed password."""
+    import bcrypt
     try:
         return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
     except ValueError:
         return False # Handles case where hash is not a valid bcrypt hash
 
+def hash_cost(hashed_password: str) -> Optional[int]:
+    """The cost factor of a bcrypt hash ("$2b$12$..." -> 12), or None if it is not one."""
+    parts = hashed_password.split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+def needs_rehash(hashed_password: str) -> bool:
+    """True if a hash was made with a lower cost factor than BCRYPT_ROUNDS."""
+    cost = hash_cost(hashed_password)
+    return cost is not None and cost < BCRYPT_ROUNDS
+
 def find_user_by_id(user_id: str) -> Optional[Dict]:
     """Finds a user by their ID."""
-    users = load_json("users.json", [])
-    for u in users:
-        if u["id"] == user_id:
-            return u
-    return None
+    from repository import find_by_id  # imported on first use, like bcrypt: it pulls in the storage backends
+    return find_by_id("users.json", user_id)
+
+def store_password_hash(user: Dict, password_hash: str):
+    """Saves a new password hash for the user, dropping any plaintext password."""
+    from repository import save_collection, update_record
+    from sessions import revoke_user
+    from transactions import transaction
+
+    def store_hash():
+        stored = find_user_by_id(user['id'])
+        stored['password_hash'] = password_hash
+        stored.pop('password', None)
+        update_record("users.json", stored)
+        save_collection("users.json")
+
+    transaction(["users.json"], store_hash)
+    user['password_hash'] = password_hash
+    user.pop('password', None)
+    revoke_user(user['id'])
 
 def upgrade_user_password(user: Dict):
     """Hashes the user's plaintext password and saves the updated user list."""
     if 'password' in user:
-        user['password_hash'] = hash_password(user['password'])
-        del user['password']
-        users = load_json("users.json", [])
-        for i, u in enumerate(users):
-            if u.get('id') == user.get('id'):
-                users[i] = user
-                break
-        save_json("users.json", users)
+        store_password_hash(user, hash_password(user['password']))
 
 def authenticate_user(user_id: str, password: str) -> Optional[Dict]:
     """Authenticates a user with their ID and password, handling both hashed and plaintext passwords."""
@@ -42,6 +70,9 @@ def authenticate_user(user_id: str, password: str) -> Optional[Dict]:
     # Check for hashed password
     if 'password_hash' in user:
         if check_password(password, user['password_hash']):
+            # The password is known only now, so this is when a weaker hash can be replaced.
+            if needs_rehash(user['password_hash']):
+                store_password_hash(user, hash_password(password))
             return user
     
     # Fallback to plaintext password (for first-time login)